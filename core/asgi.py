@@ -3,6 +3,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django_ai_assistant.routing import websocket_urlpatterns
+from django_ai_assistant.write_behind import LifespanApp
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
@@ -14,4 +15,6 @@ application = ProtocolTypeRouter({
     "websocket": AuthMiddlewareStack(
         URLRouter(websocket_urlpatterns)
     ),
+    # Flushes rows still waiting to be written when the server shuts down
+    "lifespan": LifespanApp(),
 })
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Bulk analysis of a source tree with analyze_code's prompt and cache.
+
+BulkAnalysisJob splits Python files into class and function chunks (as
+retrieval.chunk_source does), skips chunks whose content hash already has a
+stored analysis, and sends the rest to the async client from a pool of
+workers. Calls go through an LLMClient of the job's own, for its retries,
+circuit breaker and metrics (operation 'analysis'), with the job's attempt
+and backoff settings. Two token buckets, checked before every attempt, keep
+requests and estimated input tokens per minute under the account's limits. Results
+go into CodeAnalysis with bulk_create, batch_size rows at a time, as rows the
+response cache will serve to analyze_code.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from channels.db import database_sync_to_async
+
+from . import services
+from .cache import ROW_UPDATE_FIELDS, content_hash, response_cache, row_fields
+from .client import LLMClient
+from .context import estimate_tokens
+from .models import CodeAnalysis
+from .retrieval import chunk_source, source_files
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Chunk:
+    source: str
+    line: int
+    code: str
+    key: str
+
+
+@dataclass
+class JobStats:
+    files: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    analyzed: int = 0
+    failed: int = 0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict:
+        stats = {name: value for name, value in self.__dict__.items() if name != 'errors'}
+        stats['chunks_per_second'] = self.analyzed / self.elapsed if self.elapsed else None
+        return stats
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average, in bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1) -> None:
+        # One event loop, and no await between the check and the take
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def collect_chunks(root, model: str) -> tuple:
+    """(number of files, chunks) for the Python files under root, keyed for analysis by model."""
+    files = 0
+    chunks = []
+    for path in sorted(source_files(root, suffixes=('.py',))):
+        try:
+            with open(path, encoding='utf-8') as file:
+                text = file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Skipping {path}: {str(e)}")
+            continue
+        files += 1
+        source = os.path.relpath(path, root)
+        for line, code in chunk_source(text, '.py'):
+            chunks.append(Chunk(source, line, code, content_hash('analysis', model, code)))
+    return files, chunks
+
+
+class BulkAnalysisJob:
+
+    def __init__(self, root, concurrency=8, requests_per_minute=50, tokens_per_minute=40000,
+                 max_attempts=5, base_backoff=1.0, max_backoff=60.0, batch_size=50, client=None, model=None):
+        self.root = root
+        self.model = model or services.MODEL
+        self.concurrency = concurrency
+        self.requests = TokenBucket(requests_per_minute / 60, max(1, concurrency))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60 * 10)
+        self.batch_size = batch_size
+        # client is an async SDK client to call instead of one from settings. Retries are
+        # LLMClient's, so its own are turned off; run() closes it, as its connections
+        # belong to run()'s event loop.
+        self.llm = LLMClient(
+            max_attempts=max_attempts, base_backoff=base_backoff, max_backoff=max_backoff,
+            async_client=client.with_options(max_retries=0) if client else None, throttle=self.throttle,
+        )
+        self.stats = JobStats()
+        self.pending = []
+
+    def pending_chunks(self) -> List[Chunk]:
+        """Chunks without a stored analysis, one per distinct content hash."""
+        self.stats.files, chunks = collect_chunks(self.root, self.model)
+        self.stats.chunks = len(chunks)
+        unique = {chunk.key: chunk for chunk in chunks}
+        stored = set()
+        keys = list(unique)
+        for start in range(0, len(keys), 500):
+            stored |= response_cache.stored_keys(keys[start:start + 500])
+        self.stats.skipped = len(chunks) - len(unique) + len(stored)
+        return [chunk for key, chunk in unique.items() if key not in stored]
+
+    async def throttle(self, request):
+        await self.requests.acquire()
+        await self.tokens.acquire(estimate_tokens(request['messages'][0]['content']))
+
+    async def analyze(self, chunk: Chunk):
+        """The parsed analysis of a chunk."""
+        response = await self.llm.acreate(
+            'analysis',
+            model=self.model,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": services.build_analysis_prompt(chunk.code)}]
+        )
+        self.stats.input_tokens += response.usage.input_tokens
+        self.stats.output_tokens += response.usage.output_tokens
+        return json.loads(response.content[0].text)
+
+    async def worker(self, queue):
+        while True:
+            chunk = await queue.get()
+            try:
+                result = await self.analyze(chunk)
+            except Exception as e:
+                self.stats.failed += 1
+                self.stats.errors.append(f"{chunk.source}:{chunk.line}: {str(e)}")
+                logger.warning(f"Analysis of {chunk.source}:{chunk.line} failed: {str(e)}")
+            else:
+                self.pending.append(CodeAnalysis(
+                    content_hash=chunk.key, **row_fields('analysis', self.model, chunk.code, result)
+                ))
+                self.stats.analyzed += 1
+                if len(self.pending) >= self.batch_size:
+                    await self.flush()
+            finally:
+                queue.task_done()
+
+    @database_sync_to_async
+    def _write(self, rows):
+        # Replaces expired rows for the same content
+        CodeAnalysis.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['content_hash'], update_fields=ROW_UPDATE_FIELDS
+        )
+
+    async def flush(self):
+        rows, self.pending = self.pending, []
+        if rows:
+            await self._write(rows)
+
+    def _retries(self) -> int:
+        return self.llm.metrics.snapshot().get('analysis', {}).get('retries', 0)
+
+    async def run(self) -> JobStats:
+        started = time.monotonic()
+        # Counted by the shared metrics, so analysis calls made elsewhere meanwhile are included
+        retries = self._retries()
+        chunks = await database_sync_to_async(self.pending_chunks)()
+        queue = asyncio.Queue()
+        for chunk in chunks:
+            queue.put_nowait(chunk)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.flush()
+            await self.llm.aclose()
+            self.stats.retries = self._retries() - retries
+            self.stats.elapsed = time.monotonic() - started
+        return self.stats
@@ -0,0 +1,147 @@
+"""
+Content-addressed cache for analyze_code and explain_code responses.
+
+Responses are keyed by a SHA-256 of the operation, model, cache version and
+normalized code. An in-process LRU sits in front of CodeAnalysis rows, which
+are looked up by their unique content_hash. Entries older than
+AI_ASSISTANT_CACHE_TTL seconds count as misses, and changing
+AI_ASSISTANT_CACHE_VERSION invalidates every entry at once.
+"""
+import hashlib
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import CodeAnalysis
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 512
+
+# CodeAnalysis columns filled from an analysis response, besides the full response
+ANALYSIS_FIELDS = {
+    'suggestions': 'suggestions',
+    'improvements': 'improvements',
+    'security_concerns': 'security',
+    'patterns': 'patterns',
+    'database_impact': 'database_impact',
+    'api_considerations': 'api_considerations',
+}
+
+
+# Columns replaced when a row is written again for the same content_hash
+ROW_UPDATE_FIELDS = ['code_snippet', 'operation', 'model', 'response', 'created_at', *ANALYSIS_FIELDS]
+
+
+def normalize_code(code: str) -> str:
+    """Code with line endings, trailing whitespace, indentation and blank edges normalized."""
+    lines = [line.rstrip() for line in code.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return textwrap.dedent('\n'.join(lines)).strip('\n')
+
+
+def content_hash(operation: str, model: str, code: str) -> str:
+    version = getattr(settings, 'AI_ASSISTANT_CACHE_VERSION', 1)
+    key = '\0'.join([operation, model, str(version), normalize_code(code)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def row_fields(operation: str, model: str, code: str, response) -> dict:
+    """CodeAnalysis field values for a cached response, other than content_hash."""
+    fields = {
+        'code_snippet': code,
+        'operation': operation,
+        'model': model,
+        'response': response,
+        'created_at': timezone.now(),
+    }
+    for field, name in ANALYSIS_FIELDS.items():
+        fields[field] = response.get(name, []) if isinstance(response, dict) else []
+    return fields
+
+
+class ResponseCache:
+    """LRU of responses in front of the CodeAnalysis table, with hit counters."""
+
+    def __init__(self, max_entries: int = None, ttl: int = None):
+        self.max_entries = max_entries or getattr(settings, 'AI_ASSISTANT_CACHE_SIZE', DEFAULT_MAX_ENTRIES)
+        self.ttl = ttl or getattr(settings, 'AI_ASSISTANT_CACHE_TTL', DEFAULT_TTL)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def remember(self, key: str, response) -> None:
+        """Keep a response in memory only, for a row that is written separately."""
+        self._remember(key, response, time.time() + self.ttl)
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        """The cached response for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._counts['memory_hits'] += 1
+                    return entry[0]
+                del self._entries[key]
+
+        row = CodeAnalysis.objects.filter(
+            content_hash=key,
+            created_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+        ).values('response', 'created_at').first()
+        if row is None or row['response'] is None:
+            self._count('misses')
+            return None
+        self._count('db_hits')
+        self._remember(key, row['response'], row['created_at'].timestamp() + self.ttl)
+        return row['response']
+
+    def stored_keys(self, keys) -> set:
+        """Those of keys with a stored, unexpired response. Doesn't count as lookups."""
+        return set(CodeAnalysis.objects.filter(
+            content_hash__in=list(keys),
+            created_at__gte=timezone.now() - timedelta(seconds=self.ttl),
+            response__isnull=False,
+        ).values_list('content_hash', flat=True))
+
+    def set(self, key: str, operation: str, model: str, code: str, response) -> None:
+        """Store a response in memory and in its CodeAnalysis row, replacing an expired one."""
+        self._remember(key, response, time.time() + self.ttl)
+        CodeAnalysis.objects.update_or_create(content_hash=key, defaults=row_fields(operation, model, code, response))
+
+    def clear(self) -> None:
+        """Empty the in-memory LRU and reset the counters. Stored rows are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            entries = len(self._entries)
+        lookups = sum(counts.values())
+        hits = counts['memory_hits'] + counts['db_hits']
+        return {
+            **counts,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hit_rate': hits / lookups if lookups else None,
+        }
+
+
+response_cache = ResponseCache()
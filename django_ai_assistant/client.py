@@ -0,0 +1,411 @@
+"""
+The Anthropic client shared by the assistant's services.
+
+LLMClient holds one sync and one async SDK client, created on first use, so
+a missing API key fails the calls that need it rather than the import. Both
+use a connection pool with keep-alive and the timeouts from settings, and
+the SDK's own retries are off: LLMClient retries 429s, 5xx and connection
+errors itself, with exponential backoff and jitter, honouring retry-after.
+
+A CircuitBreaker stops calls for a while after repeated server failures, so
+requests fail fast instead of each waiting out its timeouts and retries.
+
+Every call is recorded in `metrics` under its operation (suggestion,
+analysis, explanation, chat): latency and token histograms, plus counts of
+calls, errors, retries and calls rejected by the breaker.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List
+
+import anthropic
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+# httpx's Limits, from whichever httpx the SDK is built on
+Limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000]
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+def retryable(error: Exception) -> bool:
+    if isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code >= 500
+
+
+def server_failure(error: Exception) -> bool:
+    """Errors that say the API is unwell; rate limits and bad requests don't."""
+    return retryable(error) and not isinstance(error, anthropic.RateLimitError)
+
+
+def retry_after(error: Exception):
+    """Seconds the server asked us to wait, if it said."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class Histogram:
+    """Counts of observed values per bucket, by upper bound."""
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-quantile (max for the last bucket)."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.bounds + [self.max], self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.bounds + ['+Inf'], self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'mean': round(self.sum / self.count, 3) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 3),
+            'buckets': buckets,
+        }
+
+
+class ClientMetrics:
+    """Per-operation call counts and latency and token histograms."""
+    COUNTERS = ('calls', 'errors', 'retries', 'rejected')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.operations = {}
+
+    def _operation(self, operation):
+        if operation not in self.operations:
+            self.operations[operation] = {
+                **{name: 0 for name in self.COUNTERS},
+                'latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                'input_tokens': Histogram(TOKEN_BUCKETS),
+                'output_tokens': Histogram(TOKEN_BUCKETS),
+            }
+        return self.operations[operation]
+
+    def count(self, operation: str, name: str) -> None:
+        with self._lock:
+            self._operation(operation)[name] += 1
+
+    def observe(self, operation: str, seconds: float, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            histograms = self._operation(operation)
+            histograms['calls'] += 1
+            histograms['latency_ms'].observe(seconds * 1000)
+            histograms['input_tokens'].observe(input_tokens)
+            histograms['output_tokens'].observe(output_tokens)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                operation: {
+                    name: value.as_dict() if isinstance(value, Histogram) else value
+                    for name, value in values.items()
+                }
+                for operation, values in self.operations.items()
+            }
+
+
+metrics = ClientMetrics()
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` server failures in a row, rejecting calls for
+    `reset_after` seconds. Then one trial call is let through: success
+    closes the circuit again, failure keeps it open for another period.
+    """
+
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_after else 'open'
+
+    def check(self) -> bool:
+        """
+        Raises CircuitOpenError unless a call may go ahead. Returns True when
+        the call is the half-open trial.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if self.state == 'half_open' and not self.trial:
+                self.trial = True
+                return True
+        raise CircuitOpenError('The Anthropic API is failing; calls are paused')
+
+    def abandoned(self, trial: bool) -> None:
+        """A call ended without an outcome, e.g. it was cancelled; its trial goes to the next call."""
+        if trial:
+            with self._lock:
+                self.trial = False
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failed(self, error: Exception) -> None:
+        with self._lock:
+            if not server_failure(error):
+                # The API answered, if not with what we wanted
+                self.failures = 0
+                self.opened_at = None
+                self.trial = False
+                return
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.threshold):
+                logger.error(f"Opening the circuit after {self.failures} failures: {str(error)}")
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class LLMClient:
+
+    def __init__(self, api_key=None, base_url=None, timeout=None, connect_timeout=None, max_connections=None,
+                 max_keepalive=None, keepalive_expiry=None, max_attempts=None, base_backoff=None,
+                 max_backoff=None, breaker_threshold=None, breaker_reset=None, client=None, async_client=None,
+                 throttle=None):
+        def option(value, name, default):
+            return value if value is not None else getattr(settings, name, default)
+
+        self.api_key = api_key or getattr(settings, 'ANTHROPIC_API_KEY', None)
+        self.base_url = option(base_url, 'AI_ASSISTANT_API_URL', None)
+        self.timeout = anthropic.Timeout(
+            option(timeout, 'AI_ASSISTANT_HTTP_TIMEOUT', 60.0),
+            connect=option(connect_timeout, 'AI_ASSISTANT_CONNECT_TIMEOUT', 5.0),
+        )
+        self.limits = Limits(
+            max_connections=option(max_connections, 'AI_ASSISTANT_MAX_CONNECTIONS', 200),
+            max_keepalive_connections=option(max_keepalive, 'AI_ASSISTANT_KEEPALIVE_CONNECTIONS', 20),
+            keepalive_expiry=option(keepalive_expiry, 'AI_ASSISTANT_KEEPALIVE_EXPIRY', 30.0),
+        )
+        self.max_attempts = option(max_attempts, 'AI_ASSISTANT_MAX_ATTEMPTS', 3)
+        self.base_backoff = option(base_backoff, 'AI_ASSISTANT_BACKOFF', 0.5)
+        self.max_backoff = option(max_backoff, 'AI_ASSISTANT_MAX_BACKOFF', 8.0)
+        self.breaker = CircuitBreaker(
+            option(breaker_threshold, 'AI_ASSISTANT_BREAKER_THRESHOLD', 5),
+            option(breaker_reset, 'AI_ASSISTANT_BREAKER_RESET', 30.0),
+        )
+        self.metrics = metrics
+        # Awaited with the request's arguments before each async attempt, e.g. to rate-limit
+        self.throttle = throttle
+        self._client = client
+        self._async_client = async_client
+        self._lock = threading.Lock()
+
+    def _options(self) -> Dict:
+        if not self.api_key:
+            raise ImproperlyConfigured('ANTHROPIC_API_KEY environment variable is required')
+        return {'api_key': self.api_key, 'base_url': self.base_url, 'timeout': self.timeout, 'max_retries': 0}
+
+    @property
+    def client(self) -> anthropic.Anthropic:
+        with self._lock:
+            if self._client is None:
+                http_client = anthropic.DefaultHttpxClient(limits=self.limits, timeout=self.timeout)
+                self._client = anthropic.Anthropic(http_client=http_client, **self._options())
+            return self._client
+
+    @property
+    def async_client(self) -> anthropic.AsyncAnthropic:
+        with self._lock:
+            if self._async_client is None:
+                http_client = anthropic.DefaultAsyncHttpxClient(limits=self.limits, timeout=self.timeout)
+                self._async_client = anthropic.AsyncAnthropic(http_client=http_client, **self._options())
+            return self._async_client
+
+    def close(self) -> None:
+        """Close the sync client, if one was created; a later call creates a new one."""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        """
+        Close the async client, if one was created, from the event loop it was
+        used on; a later call creates a new one.
+        """
+        with self._lock:
+            async_client, self._async_client = self._async_client, None
+        if async_client is not None:
+            await async_client.close()
+
+    def _retry_delay(self, operation: str, error: Exception, attempt: int):
+        """Seconds to wait before the next attempt, or None to give up."""
+        self.breaker.failed(error)
+        if not retryable(error) or attempt == self.max_attempts or self.breaker.state != 'closed':
+            return None
+        self.metrics.count(operation, 'retries')
+        logger.warning(f"Retrying {operation} after attempt {attempt} failed: {str(error)}")
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        return max(delay, retry_after(error) or 0)
+
+    def _check(self, operation: str) -> bool:
+        try:
+            return self.breaker.check()
+        except CircuitOpenError:
+            self.metrics.count(operation, 'rejected')
+            raise
+
+    def _call(self, operation: str, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            trial = self._check(operation)
+            try:
+                response = self.client.messages.create(**kwargs)
+            except Exception as e:
+                delay = self._retry_delay(operation, e, attempt)
+                if delay is None:
+                    self.metrics.count(operation, 'errors')
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandoned(trial)
+                raise
+            self.breaker.succeeded()
+            return response
+
+    async def _acall(self, operation: str, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            if self.throttle is not None:
+                await self.throttle(kwargs)
+            trial = self._check(operation)
+            try:
+                response = await self.async_client.messages.create(**kwargs)
+            except Exception as e:
+                delay = self._retry_delay(operation, e, attempt)
+                if delay is None:
+                    self.metrics.count(operation, 'errors')
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (CancelledError isn't an Exception) before the API answered
+                self.breaker.abandoned(trial)
+                raise
+            self.breaker.succeeded()
+            return response
+
+    def create(self, operation: str, **kwargs):
+        """messages.create with retries, recorded under operation."""
+        started = time.monotonic()
+        response = self._call(operation, **kwargs)
+        self.metrics.observe(
+            operation, time.monotonic() - started, response.usage.input_tokens, response.usage.output_tokens
+        )
+        return response
+
+    async def acreate(self, operation: str, **kwargs):
+        """create on the async client."""
+        started = time.monotonic()
+        response = await self._acall(operation, **kwargs)
+        self.metrics.observe(
+            operation, time.monotonic() - started, response.usage.input_tokens, response.usage.output_tokens
+        )
+        return response
+
+    @staticmethod
+    def _usage(event, usage: Dict) -> None:
+        if event.type == 'message_start':
+            usage['input'] = event.message.usage.input_tokens
+        elif event.type == 'message_delta':
+            usage['output'] = event.usage.output_tokens
+
+    @contextmanager
+    def stream(self, operation: str, **kwargs):
+        """
+        A streamed reply's events, as a context manager that closes the
+        stream. Only opening the stream is retried; its latency is recorded
+        once the stream has been read to the end.
+        """
+        started = time.monotonic()
+        stream = self._call(operation, stream=True, **kwargs)
+        usage = {'input': 0, 'output': 0}
+
+        def events():
+            for event in stream:
+                self._usage(event, usage)
+                yield event
+
+        with stream:
+            try:
+                yield events()
+            except Exception:
+                self.metrics.count(operation, 'errors')
+                raise
+        self.metrics.observe(operation, time.monotonic() - started, usage['input'], usage['output'])
+
+    @asynccontextmanager
+    async def astream(self, operation: str, **kwargs):
+        """stream on the async client. Closing it on cancellation aborts the request upstream."""
+        started = time.monotonic()
+        stream = await self._acall(operation, stream=True, **kwargs)
+        usage = {'input': 0, 'output': 0}
+
+        async def events():
+            async for event in stream:
+                self._usage(event, usage)
+                yield event
+
+        async with stream:
+            try:
+                yield events()
+            except Exception:
+                self.metrics.count(operation, 'errors')
+                raise
+        self.metrics.observe(operation, time.monotonic() - started, usage['input'], usage['output'])
@@ -1,11 +1,32 @@
+import asyncio
 import json
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .services import generate_code_suggestion, analyze_code
-from .models import CodeSuggestion, CodeAnalysis
+from .services import astream_code_suggestion, aanalyze_code, match_code_pattern
+from .models import CodeSuggestion
+from .write_behind import suggestion_writes
+
+# Requests a single connection may have in flight; more are refused with an
+# error frame with code "busy" until a reply arrives or the client cancels one.
+MAX_IN_FLIGHT = getattr(settings, 'AI_ASSISTANT_WS_MAX_IN_FLIGHT', 4)
+# Whether a suggestion answered from a CodePattern is then refined by the model
+REFINE_PATTERNS = getattr(settings, 'AI_ASSISTANT_REFINE_PATTERNS', True)
 
 class CodeAssistantConsumer(AsyncWebsocketConsumer):
+    """
+    Requests are {"type", "id", "content"} frames and every frame sent in reply
+    carries the request's id (one is assigned when the client sends none).
+    Requests run concurrently. {"type": "cancel", "id": ...} aborts one, and a
+    new suggestion request for a file supersedes the one in flight for it;
+    either way the client gets a "cancelled" frame instead of a reply.
+    """
+
     async def connect(self):
+        # request id -> task, and file path -> id of its in-flight suggestion
+        self.requests = {}
+        self.file_requests = {}
+        self.request_count = 0
         await self.accept()
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
@@ -13,63 +34,120 @@ class CodeAssistantConsumer(AsyncWebsocketConsumer):
         }))
 
     async def disconnect(self, close_code):
-        pass
+        for task in self.requests.values():
+            task.cancel()
+        self.requests.clear()
 
     async def receive(self, text_data):
+        request_id = None
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
             content = data.get('content', {})
+            request_id = data.get('id')
+
+            if message_type == 'cancel':
+                await self._cancel(request_id, 'cancelled')
+                return
+            if message_type not in ('suggestion', 'analysis'):
+                return
 
+            if request_id is None:
+                self.request_count += 1
+                request_id = f'auto-{self.request_count}'
+            if request_id in self.requests:
+                await self._send(request_id, 'error', f'Request {request_id} is already in flight')
+                return
+
+            file_path = content.get('file', '')
+            if message_type == 'suggestion' and file_path in self.file_requests:
+                await self._cancel(self.file_requests[file_path], 'superseded')
+            if len(self.requests) >= MAX_IN_FLIGHT:
+                await self._send(request_id, 'error', f'Too many requests in flight (limit {MAX_IN_FLIGHT})', code='busy')
+                return
+
+            self.requests[request_id] = asyncio.create_task(self._run(request_id, message_type, content))
             if message_type == 'suggestion':
-                suggestion = await self._handle_suggestion(content)
-                await self.send(text_data=json.dumps({
-                    'type': 'suggestion',
-                    'content': suggestion
-                }))
-            elif message_type == 'analysis':
-                analysis = await self._handle_analysis(content)
-                await self.send(text_data=json.dumps({
-                    'type': 'analysis',
-                    'content': analysis
-                }))
+                self.file_requests[file_path] = request_id
 
         except Exception as e:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'content': str(e)
-            }))
-
-    @database_sync_to_async
-    def _handle_suggestion(self, content):
-        suggestion = generate_code_suggestion(
-            code=content.get('code', ''),
-            cursor=content.get('cursor', 0),
+            await self._send(request_id, 'error', str(e))
+
+    async def _send(self, request_id, message_type, content, **extra):
+        await self.send(text_data=json.dumps({
+            'type': message_type,
+            'id': request_id,
+            'content': content,
+            **extra
+        }))
+
+    async def _cancel(self, request_id, reason):
+        task = self.requests.pop(request_id, None)
+        if task is None:
+            # Unknown, or already answered
+            return
+        task.cancel()
+        await self._send(request_id, 'cancelled', {'reason': reason})
+
+    async def _run(self, request_id, message_type, content):
+        try:
+            if message_type == 'suggestion':
+                await self._handle_suggestion(request_id, content)
+            else:
+                analysis = await self._handle_analysis(content)
+                await self._send(request_id, 'analysis', analysis)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._send(request_id, 'error', str(e))
+        finally:
+            if self.requests.get(request_id) is asyncio.current_task():
+                del self.requests[request_id]
+            file_path = content.get('file', '')
+            if self.file_requests.get(file_path) == request_id:
+                del self.file_requests[file_path]
+
+    async def _handle_suggestion(self, request_id, content):
+        code = content.get('code', '')
+        cursor = content.get('cursor', 0)
+        # Boilerplate matching a CodePattern is answered straight away, then
+        # refined by the model unless the client asks for "refine": false.
+        pattern = await database_sync_to_async(match_code_pattern)(code, cursor)
+        if pattern:
+            await self._send(request_id, 'suggestion', pattern)
+            if not content.get('refine', REFINE_PATTERNS):
+                self._save_suggestion(content, pattern, pattern['pattern_id'])
+                return
+
+        # Suggestion text is sent in suggestion_delta frames as the model
+        # writes it, then the parsed reply in a suggestion frame. It is only
+        # stored once the reply is complete, and after it has been sent.
+        suggestion = None
+        async for event in astream_code_suggestion(
+            code=code,
+            cursor=cursor,
             language=content.get('language', 'python'),
             file_path=content.get('file', '')
-        )
+        ):
+            if 'delta' in event:
+                await self._send(request_id, 'suggestion_delta', event['delta'])
+            else:
+                suggestion = event['result']
+
+        await self._send(request_id, 'suggestion', suggestion)
+        self._save_suggestion(content, suggestion, pattern and pattern['pattern_id'])
 
-        # Store suggestion in database
-        CodeSuggestion.objects.create(
+    def _save_suggestion(self, content, suggestion, pattern_id=None):
+        # Store suggestion in database, in the background: see write_behind.py
+        suggestion_writes.put(CodeSuggestion(
             file_path=content.get('file', ''),
             code_snippet=content.get('code', ''),
             suggestion=suggestion['suggestion'],
             confidence=suggestion['confidence'],
-            language=content.get('language', 'python')
-        )
-
-        return suggestion
-
-    @database_sync_to_async
-    def _handle_analysis(self, content):
-        analysis = analyze_code(content.get('code', ''))
-
-        # Store analysis in database
-        CodeAnalysis.objects.create(
-            code_snippet=content.get('code', ''),
-            suggestions=analysis['suggestions'],
-            improvements=analysis['improvements'],
-            security_concerns=analysis['security']
-        )
+            language=content.get('language', 'python'),
+            context={'pattern_id': pattern_id} if pattern_id else {}
+        ))
 
-        return analysis
\ No newline at end of file
+    async def _handle_analysis(self, content):
+        # aanalyze_code queues the analysis for its CodeAnalysis cache row
+        return await aanalyze_code(content.get('code', ''))
@@ -0,0 +1,187 @@
+"""
+Prompt context for code suggestions.
+
+Instead of everything before the cursor, a suggestion prompt gets the lines
+around the cursor that fit a token budget (AI_ASSISTANT_CONTEXT_TOKENS),
+plus, for Python, the file's imports and the signatures of the classes and
+functions enclosing the cursor. Only the lines near the cursor, the scopes
+above it and the top of the file are read, so the cost of building the
+context and the size of the prompt stay flat as files grow.
+"""
+import math
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+
+DEFAULT_TOKEN_BUDGET = 2000
+# Rough average for source code; estimate_tokens is used for budgeting only
+CHARS_PER_TOKEN = 3.5
+# Shares of the budget: imports and enclosing signatures may use up to these,
+# and the rest goes to the window, BEFORE_SHARE of it before the cursor.
+IMPORTS_SHARE = 0.2
+SCOPES_SHARE = 0.1
+BEFORE_SHARE = 0.75
+MAX_IMPORT_LINES = 200
+MAX_SCOPE_SCAN_LINES = 5000
+MAX_SIGNATURE_LINES = 10
+
+IMPORT_LINE = re.compile(r'(?:from\s+\S+\s+)?import\s')
+SCOPE_LINE = re.compile(r'(?:async\s+def|def|class)\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of text, without a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class SuggestionContext:
+    imports: str
+    scopes: str
+    before: str
+    after: str
+
+    @property
+    def tokens(self) -> int:
+        return sum(estimate_tokens(part) for part in (self.imports, self.scopes, self.before, self.after))
+
+
+def _previous_line(code, start):
+    """Start of the line before the one starting at start."""
+    return code.rfind('\n', 0, start - 1) + 1
+
+
+def _next_line(code, end):
+    """End of the line starting at end, including its newline."""
+    newline = code.find('\n', end)
+    return len(code) if newline == -1 else newline + 1
+
+
+def _extend_back(code, start, budget):
+    """Move start back over whole lines while they fit budget; returns (start, tokens used)."""
+    used = 0
+    while start > 0:
+        previous = _previous_line(code, start)
+        cost = estimate_tokens(code[previous:start])
+        if used + cost > budget:
+            break
+        start, used = previous, used + cost
+    return start, used
+
+
+def _extend_forward(code, end, budget):
+    """Move end forward over whole lines while they fit budget; returns (end, tokens used)."""
+    used = 0
+    while end < len(code):
+        following = _next_line(code, end)
+        cost = estimate_tokens(code[end:following])
+        if used + cost > budget:
+            break
+        end, used = following, used + cost
+    return end, used
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def python_imports(code: str, stop: int, budget: int) -> list:
+    """
+    (position, statement) for the import statements at the top of the file,
+    before position stop, that fit budget. Scanning ends at the first
+    top-level class, function or decorator.
+    """
+    imports = []
+    used = 0
+    position = 0
+    for _ in range(MAX_IMPORT_LINES):
+        if position >= stop:
+            break
+        end = _next_line(code, position)
+        line = code[position:end]
+        if line.startswith(('class ', 'def ', 'async def ', '@')):
+            break
+        statement_end = end
+        if IMPORT_LINE.match(line):
+            # Parenthesized imports continue until the closing parenthesis
+            if '(' in line and ')' not in line:
+                while statement_end < stop and ')' not in code[statement_end:_next_line(code, statement_end)]:
+                    statement_end = _next_line(code, statement_end)
+                statement_end = _next_line(code, statement_end)
+            statement = code[position:statement_end].rstrip('\n')
+            cost = estimate_tokens(statement)
+            if used + cost > budget:
+                break
+            imports.append((position, statement))
+            used += cost
+        position = statement_end
+    return imports
+
+
+def python_scopes(code: str, cursor: int, budget: int) -> list:
+    """
+    (position, signature) for the classes and functions enclosing the cursor,
+    outermost first; the innermost are kept when they don't all fit budget.
+    """
+    line_start = code.rfind('\n', 0, cursor) + 1
+    current = code[line_start:_next_line(code, cursor)]
+    # On a blank line the cursor's column decides which block it is in
+    indent = _indent(current) if current.strip() else cursor - line_start
+    signatures = []
+    position = line_start
+    for _ in range(MAX_SCOPE_SCAN_LINES):
+        if position == 0 or indent == 0:
+            break
+        position = _previous_line(code, position)
+        line = code[position:_next_line(code, position)]
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#') or _indent(line) >= indent:
+            continue
+        indent = _indent(line)
+        if SCOPE_LINE.match(stripped):
+            end = position
+            for _ in range(MAX_SIGNATURE_LINES):
+                end = _next_line(code, end)
+                if code[position:end].rstrip().endswith(':') or end >= len(code):
+                    break
+            signatures.append((position, code[position:end].rstrip('\n')))
+
+    kept = []
+    used = 0
+    for position, signature in signatures:
+        cost = estimate_tokens(signature)
+        if used + cost > budget:
+            break
+        kept.append((position, signature))
+        used += cost
+    return kept[::-1]
+
+
+def build_suggestion_context(code: str, cursor: int, language: str, budget: int = None) -> SuggestionContext:
+    """The context around cursor for a suggestion prompt, within budget tokens."""
+    budget = budget or getattr(settings, 'AI_ASSISTANT_CONTEXT_TOKENS', DEFAULT_TOKEN_BUDGET)
+    cursor = max(0, min(cursor, len(code)))
+    line_start = code.rfind('\n', 0, cursor) + 1
+    line_end = _next_line(code, cursor)
+
+    imports = scopes = []
+    if language == 'python':
+        imports = python_imports(code, line_start, int(budget * IMPORTS_SHARE))
+        scopes = python_scopes(code, cursor, int(budget * SCOPES_SHARE))
+
+    window = budget - sum(estimate_tokens(text) for _, text in imports + scopes)
+    window -= estimate_tokens(code[line_start:line_end])
+    start, used_before = _extend_back(code, line_start, int(window * BEFORE_SHARE))
+    end, used_after = _extend_forward(code, line_end, window - used_before)
+    if end == len(code):
+        # Near the end of the file the rest of the budget goes to the code before
+        start, _ = _extend_back(code, start, window - used_before - used_after)
+
+    # Imports and signatures the window already shows aren't repeated
+    return SuggestionContext(
+        imports='\n'.join(text for position, text in imports if position < start),
+        scopes='\n'.join(text for position, text in scopes if position < start),
+        before=code[start:cursor],
+        after=code[cursor:end],
+    )
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+from anthropic import AsyncAnthropic
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from django_ai_assistant.bulk_analysis import BulkAnalysisJob
+from django_ai_assistant.models import CodeAnalysis
+from django_ai_assistant.stub_server import StubAnthropicServer
+
+# Fake analyses are stored under their own model name, so they never answer a real lookup
+FAKE_MODEL = 'fake-analysis'
+FAKE_ANALYSIS = {
+    'suggestions': ['Fake analysis'], 'improvements': [], 'security': [], 'patterns': [],
+    'database_impact': [], 'api_considerations': [], 'financial_safety': [], 'audit_completeness': [],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyze every class and function of a source tree (LedgerLink by default) and "
+        "store the results as CodeAnalysis rows, skipping chunks analyzed before. "
+        "With --fake-latency the model is replaced by a local stub, for measuring throughput; "
+        "the fake analyses are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=str(Path(settings.BASE_DIR) / 'repositories' / 'LedgerLink'))
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests-per-minute', type=int, default=50)
+        parser.add_argument('--tokens-per-minute', type=int, default=40000, help='Estimated input tokens')
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=50, help='Rows per bulk_create')
+        parser.add_argument('--fake-latency', type=float, default=None,
+                            help='Seconds per call of a local stub model instead of the API')
+
+    def handle(self, *args, **options):
+        stub = None
+        client = None
+        model = None
+        if options['fake_latency'] is not None:
+            stub = StubAnthropicServer(text=json.dumps(FAKE_ANALYSIS), delay=options['fake_latency']).start()
+            client = AsyncAnthropic(api_key='fake', base_url=stub.url)
+            model = FAKE_MODEL
+        try:
+            job = BulkAnalysisJob(
+                options['root'],
+                concurrency=options['concurrency'],
+                requests_per_minute=options['requests_per_minute'],
+                tokens_per_minute=options['tokens_per_minute'],
+                max_attempts=options['max_attempts'],
+                batch_size=options['batch_size'],
+                client=client,
+                model=model,
+            )
+            stats = async_to_sync(job.run)()
+        finally:
+            if stub:
+                stub.stop()
+                CodeAnalysis.objects.filter(model=FAKE_MODEL).delete()
+
+        for error in stats.errors:
+            self.stderr.write(error)
+        rate = stats.as_dict()['chunks_per_second']
+        self.stdout.write(
+            f"{stats.files} files, {stats.chunks} chunks: {stats.analyzed} analyzed, "
+            f"{stats.skipped} unchanged, {stats.failed} failed, {stats.retries} retries "
+            f"in {stats.elapsed:.1f}s ({rate or 0:.1f} chunks/s; "
+            f"{stats.input_tokens} input and {stats.output_tokens} output tokens)"
+        )
+        if stub:
+            self.stdout.write(f"model calls in flight at once: {stub.max_in_flight}")
@@ -0,0 +1,52 @@
+import random
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from django_ai_assistant.context import build_suggestion_context, estimate_tokens
+
+LEDGERLINK = Path(settings.BASE_DIR) / 'repositories' / 'LedgerLink'
+DEFAULT_FILES = ['billing/billing_calculator.py', 'orders/views.py', 'customer_services/views.py']
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark suggestion context building on LedgerLink source files: time and "
+        "estimated prompt tokens at random cursors, against sending everything before "
+        "the cursor. Each file is also repeated to show cost doesn't grow with size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help=f'Paths under {LEDGERLINK}')
+        parser.add_argument('--cursors', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=10, help='Copies of the file in the enlarged run')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        for name in options['files'] or DEFAULT_FILES:
+            code = (LEDGERLINK / name).read_text()
+            for label, text in ((name, code), (f"{name} x{options['repeat']}", code * options['repeat'])):
+                self.run(label, text, rng, options['cursors'])
+
+    def run(self, label, code, rng, cursors):
+        timings = []
+        tokens = []
+        prefix_tokens = []
+        for _ in range(cursors):
+            cursor = rng.randrange(len(code))
+            started = perf_counter()
+            context = build_suggestion_context(code, cursor, 'python')
+            timings.append((perf_counter() - started) * 1000)
+            tokens.append(context.tokens)
+            prefix_tokens.append(estimate_tokens(code[:cursor]))
+        timings.sort()
+        self.stdout.write(
+            f"{label} ({code.count(chr(10))} lines): build median {median(timings):.3f}ms, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.3f}ms; "
+            f"tokens median {median(tokens):.0f} (max {max(tokens)}) "
+            f"vs {median(prefix_tokens):.0f} (max {max(prefix_tokens)}) for the whole prefix"
+        )
@@ -0,0 +1,46 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from django_ai_assistant.retrieval import get_source_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or refresh the retrieval index used for suggestion prompts, then time "
+        "top-k queries made from random lines of the indexed sources."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Timed queries; 0 to skip')
+        parser.add_argument('--k', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        index = get_source_index(refresh=False)
+        changed = index.refresh()
+        self.stdout.write(
+            f"{len(index)} chunks from {len(index.sources)} sources in {index.root}; "
+            f"{changed} re-indexed in {perf_counter() - started:.2f}s; stored in {index.path}"
+        )
+        if not options['queries'] or not len(index):
+            return
+
+        rng = random.Random(options['seed'])
+        chunks = [document[2] for document in index.documents.values()]
+        timings = []
+        for _ in range(options['queries']):
+            lines = rng.choice(chunks).splitlines()
+            start = rng.randrange(len(lines))
+            query = '\n'.join(lines[start:start + 20])
+            started = perf_counter()
+            index.search(query, k=options['k'])
+            timings.append((perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"top-{options['k']} query: median {median(timings):.2f}ms, "
+            f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms, max {timings[-1]:.2f}ms"
+        )
@@ -0,0 +1,111 @@
+import asyncio
+import json
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from django_ai_assistant import services
+from django_ai_assistant.client import LLMClient
+from django_ai_assistant.consumers import CodeAssistantConsumer
+from django_ai_assistant.models import CodePattern, CodeSuggestion
+from django_ai_assistant.retrieval import get_source_index
+from django_ai_assistant.stub_server import ConsumerClient, StubAnthropicServer
+from django_ai_assistant.write_behind import suggestion_writes
+
+FILE_PREFIX = 'loadtest/'
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the code assistant WebSocket consumer: many concurrent sockets "
+        "request suggestions from a local stub of the Anthropic API that answers "
+        "after a fixed delay. Reports throughput, latency and how many model calls "
+        "overlapped. Suggestions written by the run are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Concurrent WebSocket connections')
+        parser.add_argument('--requests', type=int, default=5, help='Suggestions requested per connection')
+        parser.add_argument('--delay', type=float, default=0.5, help='Seconds before the stub starts answering')
+        parser.add_argument('--chunk-delay', type=float, default=0.0,
+                            help='Seconds between streamed chunks of 8 characters')
+        parser.add_argument('--max-connections', type=int, default=None,
+                            help='Connection pool size of the client (default AI_ASSISTANT_MAX_CONNECTIONS)')
+        parser.add_argument('--boilerplate', action='store_true',
+                            help='Send code matching a temporary CodePattern, answered without the model')
+
+    def handle(self, *args, **options):
+        pattern = None
+        self.code = 'x = {number}'
+        if options['boilerplate']:
+            pattern = CodePattern.objects.create(
+                name='Load test list view', pattern_type='LoadtestListView',
+                code_template='class LoadtestListView(ListView):\n    model = Order\n',
+                description='Created and deleted by loadtest_assistant',
+            )
+            get_source_index().refresh()
+            self.code = 'class OrderListView(LoadtestListView):  # {number}\n    '
+        reply = json.dumps({'suggestion': 'total = sum(line.amount for line in lines)\n', 'confidence': 0.9})
+        with StubAnthropicServer(text=reply, delay=options['delay'], chunk_delay=options['chunk_delay']) as stub:
+            client = services.llm
+            services.llm = LLMClient(
+                api_key='loadtest', base_url=stub.url, max_connections=options['max_connections']
+            )
+            try:
+                started = perf_counter()
+                timings = asyncio.run(self.run_clients(options['clients'], options['requests']))
+                elapsed = perf_counter() - started
+            finally:
+                services.llm = client
+                CodeSuggestion.objects.filter(file_path__startswith=FILE_PREFIX).delete()
+                if pattern:
+                    pattern.delete()
+
+        total = len(timings)
+        self.stdout.write(
+            f"{total} suggestions over {options['clients']} sockets in {elapsed:.2f}s ({total / elapsed:.1f}/s)"
+        )
+        self.percentiles('first text', [first for first, _ in timings])
+        self.percentiles('complete', [complete for _, complete in timings])
+        self.stdout.write(f"model calls in flight at once: {stub.max_in_flight}")
+        writes = suggestion_writes.stats()
+        self.stdout.write(
+            f"suggestions written: {writes['written']} in {writes['batches']} batches, "
+            f"{writes['dropped']} dropped, {writes['failed']} failed"
+        )
+
+    def percentiles(self, label, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f"{label}: median {median(timings) * 1000:.0f}ms, "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.0f}ms"
+        )
+
+    async def run_clients(self, clients, requests):
+        results = await asyncio.gather(*(self.run_client(index, requests) for index in range(clients)))
+        # Suggestions are stored behind the replies; write them before they're deleted
+        await suggestion_writes.close()
+        return [timing for timings in results for timing in timings]
+
+    async def run_client(self, index, requests):
+        communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+        await communicator.connect()
+        await communicator.receive_json()
+        timings = []
+        for number in range(requests):
+            started = perf_counter()
+            code = self.code.format(number=number)
+            await communicator.send_json({
+                'type': 'suggestion',
+                'content': {'code': code, 'cursor': len(code), 'file': f'{FILE_PREFIX}{index}.py', 'refine': False},
+            })
+            response = await communicator.receive_json(timeout=60)
+            first = perf_counter() - started
+            while response['type'] == 'suggestion_delta':
+                response = await communicator.receive_json(timeout=60)
+            if response['type'] != 'suggestion':
+                raise RuntimeError(f"Unexpected response: {response}")
+            timings.append((first, perf_counter() - started))
+        await communicator.disconnect()
+        return timings
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ai_assistant', '0002_codepattern_codeanalysis_api_considerations_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codeanalysis',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='codeanalysis',
+            name='model',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='codeanalysis',
+            name='operation',
+            field=models.CharField(choices=[('analysis', 'Analysis'), ('explanation', 'Explanation')], default='analysis', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='codeanalysis',
+            name='response',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -16,7 +16,17 @@ class CodeSuggestion(models.Model):
         ordering = ['-created_at']
 
 class CodeAnalysis(models.Model):
+    OPERATION_CHOICES = [
+        ('analysis', 'Analysis'),
+        ('explanation', 'Explanation'),
+    ]
+
     code_snippet = models.TextField()
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES, default='analysis')
+    model = models.CharField(max_length=100, blank=True)
+    # Response cache key, see cache.content_hash; null for rows not written by the cache
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
     suggestions = models.JSONField()
     improvements = models.JSONField()
     security_concerns = models.JSONField()
@@ -0,0 +1,348 @@
+"""
+Local retrieval of LedgerLink code for suggestion prompts.
+
+RetrievalIndex is a BM25 index over chunks of the LedgerLink source tree
+(AI_ASSISTANT_SOURCE_ROOT) and over CodePattern rows. Python files are
+chunked at class and function definitions. Query terms missing from the
+index are expanded to indexed terms sharing most of their trigrams, so
+"calc" still finds "calculator".
+
+refresh() re-chunks only files whose mtime changed and patterns whose
+indexed text changed, and the index is pickled to AI_ASSISTANT_INDEX_PATH so a
+new process starts warm. get_source_index() refreshes it at most every
+REFRESH_INTERVAL seconds; queries themselves don't touch disk or database.
+"""
+import hashlib
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+from .context import estimate_tokens
+from .models import CodePattern
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 2
+REFRESH_INTERVAL = 30
+SOURCE_SUFFIXES = ('.py', '.html')
+SKIP_DIRS = {'migrations', '__pycache__', 'node_modules', 'staticfiles', 'venv', '.venv', '.git'}
+# Benchmark commands aren't code worth imitating
+SKIP_FILE_PREFIXES = ('benchmark_',)
+MAX_CHUNK_LINES = 60
+MAX_QUERY_TERMS = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Expansion of query terms missing from the index
+MIN_TRIGRAM_SIMILARITY = 0.5
+MAX_EXPANSIONS = 3
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+CAMEL_CASE_PART = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z0-9]+')
+CHUNK_START = re.compile(r'(?: {0,4})(?:@|async\s+def\s|def\s|class\s)')
+STOP_WORDS = {
+    'and', 'as', 'async', 'await', 'class', 'def', 'elif', 'else', 'false', 'for', 'from',
+    'if', 'import', 'in', 'is', 'none', 'not', 'or', 'pass', 'return', 'self', 'the',
+    'true', 'try', 'with', 'endif', 'endfor', 'endblock', 'block', 'div', 'span',
+}
+
+
+def tokenize(text: str) -> list:
+    """Lowercased identifiers, plus their snake_case and camelCase parts."""
+    terms = []
+    for identifier in IDENTIFIER.findall(text):
+        parts = [part for word in identifier.split('_') for part in CAMEL_CASE_PART.findall(word)]
+        if len(parts) > 1:
+            terms.append(identifier.lower())
+        terms.extend(part.lower() for part in parts)
+    return [term for term in terms if len(term) > 1 and term not in STOP_WORDS]
+
+
+def trigrams(term: str) -> set:
+    padded = f' {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def chunk_source(text: str, suffix: str) -> list:
+    """(first line number, text) chunks of a file, split at definitions for Python."""
+    lines = text.splitlines(keepends=True)
+    starts = [0]
+    if suffix == '.py':
+        for number, line in enumerate(lines):
+            previous = lines[number - 1].lstrip() if number else ''
+            if number and CHUNK_START.match(line) and not previous.startswith('@'):
+                starts.append(number)
+    chunks = []
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        for piece in range(start, end, MAX_CHUNK_LINES):
+            chunk = ''.join(lines[piece:min(end, piece + MAX_CHUNK_LINES)])
+            if chunk.strip():
+                chunks.append((piece + 1, chunk))
+    return chunks
+
+
+def source_files(root, suffixes=SOURCE_SUFFIXES):
+    """Paths of the source files under root, skipping SKIP_DIRS and benchmark commands."""
+    for directory, directories, files in os.walk(root):
+        directories[:] = [name for name in directories if name not in SKIP_DIRS]
+        for name in files:
+            if name.endswith(suffixes) and not name.startswith(SKIP_FILE_PREFIXES):
+                yield os.path.join(directory, name)
+
+
+class RetrievalIndex:
+    """BM25 over source chunks and code patterns, updated incrementally."""
+
+    def __init__(self, root, path=None):
+        self.root = Path(root)
+        self.path = Path(path) if path else None
+        self.documents = {}
+        self.postings = defaultdict(dict)
+        self.sources = {}
+        self.source_documents = defaultdict(list)
+        # pattern source -> terms of its pattern_type, see match_pattern
+        self.pattern_types = {}
+        self.total_length = 0
+        self.next_id = 0
+        self.refreshed_at = 0.0
+        self._trigram_terms = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_trigram_terms'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, root, path):
+        """The index pickled at path if it is for root, else an empty one."""
+        try:
+            with open(path, 'rb') as file:
+                index_format, index = pickle.load(file)
+            if index_format == INDEX_FORMAT and index.root == Path(root):
+                index.path = Path(path)
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Discarding unreadable retrieval index {path}: {str(e)}")
+        return cls(root, path)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix('.tmp')
+        with open(temporary, 'wb') as file:
+            pickle.dump((INDEX_FORMAT, self), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    def add(self, source, line, text, title=''):
+        terms = Counter(tokenize(f'{title}\n{text}'))
+        document_id = self.next_id
+        self.next_id += 1
+        self.documents[document_id] = (source, line, text, sum(terms.values()), terms)
+        for term, count in terms.items():
+            self.postings[term][document_id] = count
+        self.total_length += sum(terms.values())
+        self.source_documents[source].append(document_id)
+        self._trigram_terms = None
+
+    def remove(self, source):
+        for document_id in self.source_documents.pop(source, []):
+            _, _, _, length, terms = self.documents.pop(document_id)
+            for term in terms:
+                postings = self.postings[term]
+                del postings[document_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= length
+        self.sources.pop(source, None)
+        self.pattern_types.pop(source, None)
+        self._trigram_terms = None
+
+    def refresh(self, patterns=True):
+        """
+        Re-index changed, new and removed files and patterns. Returns the number
+        of sources re-indexed, and saves the index when there were any.
+        """
+        with self._lock:
+            changed = 0
+            seen = set()
+            for path in source_files(self.root):
+                source = os.path.relpath(path, self.root)
+                seen.add(source)
+                mtime = os.stat(path).st_mtime
+                if self.sources.get(source) == mtime:
+                    continue
+                self.remove(source)
+                try:
+                    with open(path, encoding='utf-8') as file:
+                        text = file.read()
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"Skipping {path} in retrieval index: {str(e)}")
+                    continue
+                for line, chunk in chunk_source(text, os.path.splitext(path)[1]):
+                    self.add(source, line, chunk, title=source)
+                self.sources[source] = mtime
+                changed += 1
+
+            if patterns:
+                # Versioned by the text that is indexed, not by last_used, which every match updates
+                fields = ('name', 'pattern_type', 'description', 'code_template')
+                for pattern_id, *values in CodePattern.objects.values_list('id', *fields):
+                    source = f'pattern:{pattern_id}'
+                    seen.add(source)
+                    version = hashlib.sha1('\0'.join(values).encode()).hexdigest()
+                    if self.sources.get(source) == version:
+                        continue
+                    name, pattern_type, description, code_template = values
+                    self.remove(source)
+                    self.add(source, 0, code_template, title=f'{name} {pattern_type} {description}')
+                    self.sources[source] = version
+                    self.pattern_types[source] = frozenset(tokenize(pattern_type))
+                    changed += 1
+
+            for source in set(self.sources) - seen:
+                if patterns or not source.startswith('pattern:'):
+                    self.remove(source)
+                    changed += 1
+
+            if self._trigram_terms is None:
+                # Built here rather than by the first query that needs it
+                self._index_trigrams()
+            self.refreshed_at = time.monotonic()
+            if changed and self.path:
+                self.save()
+            return changed
+
+    def _index_trigrams(self):
+        trigram_terms = defaultdict(list)
+        for indexed in self.postings:
+            for trigram in trigrams(indexed):
+                trigram_terms[trigram].append(indexed)
+        self._trigram_terms = trigram_terms
+
+    def expand(self, term):
+        """Indexed terms sharing most of term's trigrams, for terms not in the index."""
+        if self._trigram_terms is None:
+            self._index_trigrams()
+        wanted = trigrams(term)
+        shared = Counter(indexed for trigram in wanted for indexed in self._trigram_terms.get(trigram, ()))
+        similar = [
+            (count / len(wanted | trigrams(indexed)), indexed) for indexed, count in shared.items()
+        ]
+        similar = [item for item in similar if item[0] >= MIN_TRIGRAM_SIMILARITY]
+        return [indexed for _, indexed in sorted(similar, reverse=True)[:MAX_EXPANSIONS]]
+
+    def search(self, text, k=3, exclude_source=None):
+        """
+        The k best (score, source, line, text) matches for the text, best first.
+        Chunks from exclude_source, usually the file being edited, are skipped.
+        """
+        with self._lock:
+            return self._search(text, k, exclude_source)
+
+    def match_pattern(self, text):
+        """
+        Id of the CodePattern whose pattern_type terms all appear in text, or
+        None. Among several, the most specific pattern_type wins, then the best
+        BM25 match.
+        """
+        with self._lock:
+            terms = set(tokenize(text))
+            candidates = {source: len(types) for source, types in self.pattern_types.items() if types and types <= terms}
+            if not candidates:
+                return None
+            scores = self._scores(text)
+            best = max(
+                (document_id for source in candidates for document_id in self.source_documents[source]),
+                key=lambda document_id: (candidates[self.documents[document_id][0]], scores.get(document_id, 0.0))
+            )
+            return int(self.documents[best][0].split(':')[1])
+
+    def _search(self, text, k, exclude_source):
+        results = []
+        for document_id, score in sorted(self._scores(text).items(), key=lambda item: item[1], reverse=True):
+            source, line, chunk, _, _ = self.documents[document_id]
+            if source == exclude_source:
+                continue
+            results.append((score, source, line, chunk))
+            if len(results) == k:
+                break
+        return results
+
+    def _scores(self, text):
+        """BM25 score of every document matching a term of text."""
+        if not self.documents:
+            return {}
+        terms = Counter(tokenize(text))
+        for term in [term for term in terms if term not in self.postings]:
+            for expansion in self.expand(term):
+                terms[expansion] += terms[term]
+            del terms[term]
+        count = len(self.documents)
+        # The rarest terms say the most about the query
+        idf = {term: math.log(1 + (count - len(self.postings[term]) + 0.5) / (len(self.postings[term]) + 0.5))
+               for term in terms}
+        best_terms = sorted(terms, key=idf.get, reverse=True)[:MAX_QUERY_TERMS]
+        average_length = self.total_length / count
+        scores = defaultdict(float)
+        for term in best_terms:
+            weight = idf[term] * (BM25_K1 + 1)
+            for document_id, frequency in self.postings[term].items():
+                length = self.documents[document_id][3]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[document_id] += weight * frequency / (frequency + norm)
+        return scores
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_source_index(refresh=True):
+    """The process's index, loaded from disk first and refreshed every REFRESH_INTERVAL seconds."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            root = getattr(settings, 'AI_ASSISTANT_SOURCE_ROOT', Path(settings.BASE_DIR) / 'repositories' / 'LedgerLink')
+            path = getattr(settings, 'AI_ASSISTANT_INDEX_PATH', Path(settings.BASE_DIR) / '.cache' / 'ai_assistant_index.pickle')
+            _index = RetrievalIndex.load(root, path)
+    if refresh and time.monotonic() - _index.refreshed_at > REFRESH_INTERVAL:
+        _index.refresh()
+    return _index
+
+
+def related_code(query, file_path='', k=None, budget=None):
+    """
+    Retrieved snippets for a suggestion prompt, each headed by its source,
+    within budget estimated tokens.
+    """
+    k = k or getattr(settings, 'AI_ASSISTANT_RETRIEVAL_K', 3)
+    budget = budget or getattr(settings, 'AI_ASSISTANT_RETRIEVAL_TOKENS', 800)
+    index = get_source_index()
+    exclude = os.path.relpath(file_path, index.root) if os.path.isabs(file_path) else file_path
+    snippets = []
+    used = 0
+    for _, source, line, text in index.search(query, k=k, exclude_source=exclude):
+        snippet = f'# {source}:{line}\n{text.rstrip()}' if line else f'# {source}\n{text.rstrip()}'
+        cost = estimate_tokens(snippet)
+        if used + cost > budget:
+            continue
+        snippets.append(snippet)
+        used += cost
+    return '\n\n'.join(snippets)
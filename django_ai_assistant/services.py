@@ -1,43 +1,57 @@
-from django.conf import settings
-from typing import Dict, Any, List, Generator
-from anthropic import Anthropic
+from django.db.models import F
+from django.utils import timezone
+from typing import Dict, Any, List, AsyncIterator, Optional
+from channels.db import database_sync_to_async
 import json
+import logging
+import re
 
-# Initialize Anthropic client
-if not settings.ANTHROPIC_API_KEY:
-    raise ValueError('ANTHROPIC_API_KEY environment variable is required')
+from .cache import content_hash, response_cache, row_fields
+from .client import LLMClient
+from .context import build_suggestion_context
+from .models import CodeAnalysis, CodePattern
+from .retrieval import get_source_index, related_code
+from .write_behind import analysis_writes
 
-anthropic = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+logger = logging.getLogger(__name__)
+
+# Pooled, retrying Anthropic client; a missing API key fails calls, not the import
+llm = LLMClient()
 
 # the newest Anthropic model is "claude-3-5-sonnet-20241022" which was released October 22, 2024
 MODEL = "claude-3-5-sonnet-20241022"
 
-def generate_code_suggestion(
-    code: str,
-    cursor: int,
-    language: str,
-    file_path: str
-) -> Dict[str, Any]:
-    """Generate code suggestions using Anthropic's Claude model."""
-    try:
-        # Build a comprehensive prompt that includes project context
-        prompt = f"""You are an expert programmer specialized in Django and Python development for the LedgerLink project.
+# Lines before the cursor matched against pattern types, and the confidence
+# reported for a suggestion taken from a pattern
+PATTERN_CONTEXT_LINES = 3
+PATTERN_CONFIDENCE = 0.6
+
+def build_suggestion_prompt(code: str, cursor: int, language: str, file_path: str) -> str:
+    # A token-budgeted window around the cursor, not the whole file, see context.py
+    context = build_suggestion_context(code, cursor, language)
+    # Real LedgerLink code near the cursor's topic, from the local index in retrieval.py
+    related = related_code(f'{file_path}\n{context.before[-1500:]}\n{context.after[:500]}', file_path)
+    return f"""You are an expert programmer specialized in Django and Python development for the LedgerLink project,
+        a Django financial management and accounting system.
         You need to generate code that follows LedgerLink's patterns and best practices.
 
-        Context:
-        - LedgerLink is a financial management and accounting system
-        - Uses Django for backend with RESTful APIs
-        - Focuses on secure financial transactions and data handling
-        - Implements comprehensive audit logging
-        - Uses PostgreSQL for data persistence
-        - Follows Django best practices and design patterns
-        - Emphasizes clean code and maintainability
+        Related code from LedgerLink:
+        {related}
 
         Current file: {file_path}
         Programming Language: {language}
 
+        Imports:
+        {context.imports}
+
+        Enclosing definitions:
+        {context.scopes}
+
         Code before cursor:
-        {code[:cursor]}
+        {context.before}
+
+        Code after cursor:
+        {context.after}
 
         Please provide a completion that:
         1. Matches LedgerLink's existing coding style and patterns
@@ -63,45 +77,196 @@ def generate_code_suggestion(
         }}
         """
 
-        response = anthropic.messages.create(
-            model=MODEL,
-            max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        # Extract JSON from the response
-        content = response.content[0].text
-        try:
-            result = json.loads(content)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, format the response manually
-            result = {
-                "suggestion": content,
-                "confidence": 0.7,
-                "explanation": "Generated code suggestion",
-                "related_files": [],
-                "tests": "No test cases generated",
-                "security_considerations": [],
-                "audit_points": []
-            }
 
-        return result
-    except Exception as e:
-        print(f"Error generating code suggestion: {str(e)}")
+def parse_suggestion(content: str) -> Dict[str, Any]:
+    """Suggestion fields from the model's reply, which should be JSON."""
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        # If JSON parsing fails, format the response manually
         return {
-            "suggestion": "",
-            "confidence": 0.0,
-            "explanation": f"Error: {str(e)}",
+            "suggestion": content,
+            "confidence": 0.7,
+            "explanation": "Generated code suggestion",
             "related_files": [],
-            "tests": "",
+            "tests": "No test cases generated",
             "security_considerations": [],
             "audit_points": []
         }
 
-def analyze_code(code: str) -> Dict[str, List[str]]:
-    """Analyze code for potential improvements, bugs, and security issues."""
+def suggestion_error(error: Exception) -> Dict[str, Any]:
+    return {
+        "suggestion": "",
+        "confidence": 0.0,
+        "explanation": f"Error: {str(error)}",
+        "related_files": [],
+        "tests": "",
+        "security_considerations": [],
+        "audit_points": []
+    }
+
+def pattern_suggestion(pattern: CodePattern) -> Dict[str, Any]:
+    """A stored CodePattern as a suggestion, flagged with its source."""
+    return {
+        "suggestion": pattern.code_template,
+        "confidence": PATTERN_CONFIDENCE,
+        "explanation": f"From the {pattern.name} pattern: {pattern.description}",
+        "related_files": [],
+        "tests": "",
+        "security_considerations": [],
+        "audit_points": [],
+        "source": "pattern",
+        "pattern_id": pattern.id
+    }
+
+def match_code_pattern(code: str, cursor: int) -> Optional[Dict[str, Any]]:
+    """
+    A suggestion from the CodePattern whose pattern_type appears in the last
+    few lines before the cursor, or None. Counts the use of the pattern.
+    """
+    recent = [line for line in code[max(0, cursor - 1000):cursor].splitlines() if line.strip()]
+    pattern_id = get_source_index().match_pattern('\n'.join(recent[-PATTERN_CONTEXT_LINES:]))
+    if pattern_id is None:
+        return None
+    pattern = CodePattern.objects.filter(id=pattern_id).first()
+    if pattern is None:
+        return None
+    CodePattern.objects.filter(id=pattern_id).update(usage_count=F('usage_count') + 1, last_used=timezone.now())
+    return pattern_suggestion(pattern)
+
+def generate_code_suggestion(
+    code: str,
+    cursor: int,
+    language: str,
+    file_path: str
+) -> Dict[str, Any]:
+    """
+    Generate code suggestions using Anthropic's Claude model, or answer
+    straight from a matching CodePattern without calling the model.
+    """
+    try:
+        pattern = match_code_pattern(code, cursor)
+        if pattern:
+            return pattern
+
+        response = llm.create(
+            'suggestion',
+            model=MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": build_suggestion_prompt(code, cursor, language, file_path)}]
+        )
+        return parse_suggestion(response.content[0].text)
+    except Exception as e:
+        logger.error(f"Error generating code suggestion: {str(e)}")
+        return suggestion_error(e)
+
+class SuggestionTextStream:
+    """
+    Decodes the "suggestion" string of a JSON reply while the reply is still
+    arriving, so its text can be shown before the reply is complete. Replies
+    that don't start as JSON are passed through unchanged, as parse_suggestion
+    falls back to using the whole reply. The parsed reply is authoritative.
+    """
+    VALUE_START = re.compile(r'"suggestion"\s*:\s*"')
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = None
+        self.raw = None
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        """Add a chunk of the reply; returns the suggestion text it completes."""
+        self.buffer += text
+        if self.raw is None:
+            stripped = self.buffer.lstrip()
+            if not stripped:
+                return ''
+            self.raw = not stripped.startswith('{')
+        if self.raw:
+            return text
+        if self.done:
+            return ''
+        if self.position is None:
+            match = self.VALUE_START.search(self.buffer)
+            if not match:
+                return ''
+            self.position = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        # Stops before an escape sequence that hasn't fully arrived yet
+        buffer, position = self.buffer, self.position
+        decoded = []
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self.done = True
+                position += 1
+                break
+            if char != '\\':
+                decoded.append(char)
+                position += 1
+                continue
+            if position + 1 == len(buffer):
+                break
+            if buffer[position + 1] != 'u':
+                decoded.append(self.ESCAPES.get(buffer[position + 1], buffer[position + 1]))
+                position += 2
+                continue
+            if position + 6 > len(buffer):
+                break
+            code = int(buffer[position + 2:position + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # High surrogate: wait for the low half and combine them
+                if position + 12 > len(buffer):
+                    break
+                low = int(buffer[position + 8:position + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                position += 6
+            decoded.append(chr(code))
+            position += 6
+        self.position = position
+        return ''.join(decoded)
+
+async def astream_code_suggestion(
+    code: str,
+    cursor: int,
+    language: str,
+    file_path: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a code suggestion from the async client. Yields {"delta": text}
+    as the suggestion text arrives, then {"result": ...} with the parsed
+    reply in generate_code_suggestion's format, once the reply is complete.
+    """
+    reader = SuggestionTextStream()
+    chunks = []
     try:
-        prompt = f"""Analyze this Django code in the context of LedgerLink, a financial management system.
+        # Retrieval may refresh its index from the CodePattern table
+        prompt = await database_sync_to_async(build_suggestion_prompt)(code, cursor, language, file_path)
+        # Closing the stream on cancellation aborts the request upstream
+        async with llm.astream(
+            'suggestion',
+            model=MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": prompt}]
+        ) as events:
+            async for event in events:
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    chunks.append(event.delta.text)
+                    text = reader.feed(event.delta.text)
+                    if text:
+                        yield {"delta": text}
+    except Exception as e:
+        logger.error(f"Error generating code suggestion: {str(e)}")
+        yield {"result": suggestion_error(e)}
+        return
+    yield {"result": parse_suggestion(''.join(chunks))}
+
+def build_analysis_prompt(code: str) -> str:
+    return f"""Analyze this Django code in the context of LedgerLink, a financial management system.
         Code to analyze:
         {code}
 
@@ -129,50 +294,87 @@ def analyze_code(code: str) -> Dict[str, List[str]]:
             "audit_completeness": ["list", "of", "audit", "logging", "gaps"]
         }}"""
 
-        response = anthropic.messages.create(
+ANALYSIS_KEYS = [
+    "suggestions", "improvements", "security", "patterns", "database_impact",
+    "api_considerations", "financial_safety", "audit_completeness"
+]
+
+def analysis_error(message: str) -> Dict[str, List[str]]:
+    return {key: [message] if key == "suggestions" else [] for key in ANALYSIS_KEYS}
+
+def analyze_code(code: str) -> Dict[str, List[str]]:
+    """
+    Analyze code for potential improvements, bugs, and security issues.
+    Responses are cached by content hash, see cache.py.
+    """
+    try:
+        key = content_hash('analysis', MODEL, code)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = llm.create(
+            'analysis',
             model=MODEL,
             max_tokens=2000,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": build_analysis_prompt(code)}]
         )
 
         # Extract JSON from the response
-        content = response.content[0].text
         try:
-            return json.loads(content)
+            result = json.loads(response.content[0].text)
+        except json.JSONDecodeError:
+            return analysis_error("Error parsing analysis results")
+        response_cache.set(key, 'analysis', MODEL, code, result)
+        return result
+    except Exception as e:
+        logger.error(f"Error analyzing code: {str(e)}")
+        return analysis_error(f"Error: {str(e)}")
+
+async def aanalyze_code(code: str) -> Dict[str, List[str]]:
+    """analyze_code on the async client; only the cache read runs in a thread."""
+    try:
+        key = content_hash('analysis', MODEL, code)
+        cached = await database_sync_to_async(response_cache.get)(key)
+        if cached is not None:
+            return cached
+
+        response = await llm.acreate(
+            'analysis',
+            model=MODEL,
+            max_tokens=2000,
+            messages=[{"role": "user", "content": build_analysis_prompt(code)}]
+        )
+
+        try:
+            result = json.loads(response.content[0].text)
         except json.JSONDecodeError:
-            return {
-                "suggestions": ["Error parsing analysis results"],
-                "improvements": [],
-                "security": [],
-                "patterns": [],
-                "database_impact": [],
-                "api_considerations": [],
-                "financial_safety": [],
-                "audit_completeness": []
-            }
+            return analysis_error("Error parsing analysis results")
+        # The row is written behind the reply; the in-memory cache serves it meanwhile
+        response_cache.remember(key, result)
+        analysis_writes.put(CodeAnalysis(content_hash=key, **row_fields('analysis', MODEL, code, result)))
+        return result
     except Exception as e:
-        print(f"Error analyzing code: {str(e)}")
-        return {
-            "suggestions": [f"Error: {str(e)}"],
-            "improvements": [],
-            "security": [],
-            "patterns": [],
-            "database_impact": [],
-            "api_considerations": [],
-            "financial_safety": [],
-            "audit_completeness": []
-        }
+        logger.error(f"Error analyzing code: {str(e)}")
+        return analysis_error(f"Error: {str(e)}")
 
 def explain_code(code: str) -> str:
-    """Generate a detailed explanation of the code."""
+    """
+    Generate a detailed explanation of the code.
+    Responses are cached by content hash, see cache.py.
+    """
     try:
-        response = anthropic.messages.create(
+        key = content_hash('explanation', MODEL, code)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = llm.create(
+            'explanation',
             model=MODEL,
             max_tokens=1000,
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are an expert Django developer explaining code for the LedgerLink project.
+            # The Messages API takes instructions as system, not as a message
+            system="""You are an expert Django developer explaining code for the LedgerLink project.
                     Focus on:
                     1. Code purpose and functionality
                     2. Integration with LedgerLink's architecture
@@ -183,8 +385,8 @@ def explain_code(code: str) -> str:
                     7. Transaction management
                     8. Audit logging
                     9. Data validation
-                    10. Error handling strategies"""
-                },
+                    10. Error handling strategies""",
+            messages=[
                 {
                     "role": "user",
                     "content": code
@@ -192,46 +394,42 @@ def explain_code(code: str) -> str:
             ]
         )
 
-        return response.content[0].text
+        explanation = response.content[0].text
+        response_cache.set(key, 'explanation', MODEL, code, explanation)
+        return explanation
     except Exception as e:
-        print(f"Error explaining code: {str(e)}")
+        logger.error(f"Error explaining code: {str(e)}")
         return f"Error: {str(e)}"
 
-def generate_chat_response(content: str, conversation_id: int = None) -> Generator[Dict[str, str], None, None]:
-    """Generate streaming chat responses with LedgerLink context."""
+CHAT_SYSTEM_PROMPT = """You are an AI assistant specialized for the LedgerLink project. Your role is to:
+    1. Help users understand and work with the LedgerLink codebase
+    2. Provide guidance on Django best practices for financial systems
+    3. Assist with accounting and financial software concepts
+    4. Maintain a professional and helpful tone
+    5. Generate code that follows LedgerLink's patterns
+    6. Suggest improvements while maintaining system integrity
+    7. Consider security implications for financial data
+    8. Explain technical concepts clearly
+    9. Guide on proper transaction management
+    10. Advise on audit logging best practices"""
+
+async def astream_chat_response(content: str, conversation_id: int = None) -> AsyncIterator[Dict[str, str]]:
+    """
+    Stream a chat reply with LedgerLink context. Cancelling the iteration
+    closes the stream, which aborts the request upstream.
+    """
     try:
-        messages = [
-            {
-                "role": "assistant",
-                "content": """You are an AI assistant specialized for the LedgerLink project. Your role is to:
-                1. Help users understand and work with the LedgerLink codebase
-                2. Provide guidance on Django best practices for financial systems
-                3. Assist with accounting and financial software concepts
-                4. Maintain a professional and helpful tone
-                5. Generate code that follows LedgerLink's patterns
-                6. Suggest improvements while maintaining system integrity
-                7. Consider security implications for financial data
-                8. Explain technical concepts clearly
-                9. Guide on proper transaction management
-                10. Advise on audit logging best practices"""
-            },
-            {
-                "role": "user",
-                "content": content
-            }
-        ]
-
-        stream = anthropic.messages.create(
+        async with llm.astream(
+            'chat',
             model=MODEL,
             max_tokens=2048,
-            messages=messages,
-            stream=True
-        )
-
-        for chunk in stream:
-            if chunk.type == "content_block_delta":
-                yield {"text": chunk.delta.text}
+            system=CHAT_SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": content}]
+        ) as stream:
+            async for chunk in stream:
+                if chunk.type == "content_block_delta":
+                    yield {"text": chunk.delta.text}
 
     except Exception as e:
-        print(f"Error generating chat response: {str(e)}")
-        yield {"error": str(e)}
\ No newline at end of file
+        logger.error(f"Error generating chat response: {str(e)}")
+        yield {"error": str(e)}
@@ -0,0 +1,189 @@
+"""
+A local stand-in for the Anthropic Messages API, for tests and load tests.
+
+StubAnthropicServer answers POST /v1/messages from a background thread, one
+thread per request, after `delay` seconds. It records the request bodies and
+the highest number of requests it saw in flight at once. Requests with
+"stream": true get server-sent events, `chunk_size` characters per
+content_block_delta with `chunk_delay` seconds between them; `aborted` counts
+streams the client hung up on. Status codes put in `errors` are answered, one
+per request and in order, with an API error instead of a message.
+
+ConsumerClient drives a WebSocket consumer in-process, like channels'
+WebsocketCommunicator, which can't be imported without daphne installed.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from asgiref.testing import ApplicationCommunicator
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 refuses connections under load
+    request_queue_size = 256
+
+
+class StubAnthropicServer:
+    def __init__(self, text='{}', delay=0.0, chunk_size=8, chunk_delay=0.0, errors=()):
+        # text may be a string or a callable taking the request body
+        self.text = text
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.errors = list(errors)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.aborted = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), self._handler_class())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reply_text(self, body):
+        return self.text(body) if callable(self.text) else self.text
+
+    def message(self, body, text):
+        return {
+            'id': f'msg_stub_{len(self.requests)}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'stub'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': len(json.dumps(body.get('messages', []))) // 4,
+                      'output_tokens': len(text) // 4},
+        }
+
+    def events(self, body, text):
+        """The server-sent events of a streamed reply, as (event, data) pairs."""
+        message = self.message(body, '')
+        message['content'] = []
+        message['stop_reason'] = None
+        yield 'message_start', {'type': 'message_start', 'message': message}
+        yield 'content_block_start', {
+            'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}
+        }
+        for start in range(0, len(text), self.chunk_size):
+            yield 'content_block_delta', {
+                'type': 'content_block_delta', 'index': 0,
+                'delta': {'type': 'text_delta', 'text': text[start:start + self.chunk_size]},
+            }
+        yield 'content_block_stop', {'type': 'content_block_stop', 'index': 0}
+        yield 'message_delta', {
+            'type': 'message_delta',
+            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+            'usage': {'output_tokens': len(text) // 4},
+        }
+        yield 'message_stop', {'type': 'message_stop'}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with stub._lock:
+                    stub.requests.append(body)
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status = stub.errors.pop(0) if stub.errors else None
+                try:
+                    time.sleep(stub.delay)
+                    if status:
+                        self.respond_error(status)
+                    elif body.get('stream'):
+                        self.respond_stream(body)
+                    else:
+                        self.respond(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out or went away
+                    self.close_connection = True
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def respond(self, body):
+                payload = json.dumps(stub.message(body, stub.reply_text(body))).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def respond_error(self, status):
+                kind = 'rate_limit_error' if status == 429 else 'api_error'
+                payload = json.dumps({'type': 'error', 'error': {'type': kind, 'message': f'Stub error {status}'}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('retry-after', '0')
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def respond_stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event, data in stub.events(body, stub.reply_text(body)):
+                        if event == 'content_block_delta' and stub.chunk_delay:
+                            time.sleep(stub.chunk_delay)
+                        self.wfile.write(f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode())
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with stub._lock:
+                        stub.aborted += 1
+
+        return Handler
+
+
+class ConsumerClient(ApplicationCommunicator):
+    def __init__(self, application, path):
+        super().__init__(application, {'type': 'websocket', 'path': path, 'headers': [], 'subprotocols': []})
+
+    async def connect(self, timeout=1):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output(timeout)
+        if response['type'] != 'websocket.accept':
+            raise ConnectionError(f"Connection refused: {response}")
+
+    async def send_json(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json(self, timeout=1):
+        response = await self.receive_output(timeout)
+        return json.loads(response['text'])
+
+    async def disconnect(self, code=1000, timeout=1):
+        await self.send_input({'type': 'websocket.disconnect', 'code': code})
+        await self.wait(timeout)
@@ -0,0 +1,872 @@
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import anthropic
+from anthropic import AsyncAnthropic
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from django_ai_assistant.bulk_analysis import BulkAnalysisJob, TokenBucket
+from django_ai_assistant.cache import response_cache, row_fields
+from django_ai_assistant.client import CircuitOpenError, LLMClient, metrics
+from django_ai_assistant.consumers import CodeAssistantConsumer
+from django_ai_assistant.context import build_suggestion_context, python_scopes
+from django_ai_assistant.models import CodeAnalysis, CodePattern, CodeSuggestion
+from django_ai_assistant.retrieval import RetrievalIndex, get_source_index
+from django_ai_assistant.services import (
+    CHAT_SYSTEM_PROMPT, SuggestionTextStream, analyze_code, build_suggestion_prompt, explain_code, generate_code_suggestion
+)
+from django_ai_assistant.stub_server import ConsumerClient, StubAnthropicServer
+from django_ai_assistant.write_behind import WriteBehindBuffer, analysis_writes, suggestion_writes
+
+
+def fake_message(text):
+    return SimpleNamespace(
+        content=[SimpleNamespace(text=text)], usage=SimpleNamespace(input_tokens=100, output_tokens=len(text) // 4)
+    )
+
+
+def closes_llm(test):
+    """
+    Closes self.llm's async client at the end of an async test, on the test's
+    event loop; left to garbage collection it would close on a finished loop.
+    """
+    @functools.wraps(test)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            await test(self, *args, **kwargs)
+        finally:
+            await self.llm.aclose()
+    return wrapper
+
+
+def mock_llm():
+    """Patches services.llm with an LLMClient around a mock SDK client."""
+    return mock.patch('django_ai_assistant.services.llm', LLMClient(client=mock.MagicMock()))
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        patcher = mock_llm()
+        self.client_mock = patcher.start().client
+        self.addCleanup(patcher.stop)
+        self.analysis = {'suggestions': ['a'], 'improvements': [], 'security': ['s']}
+        self.client_mock.messages.create.return_value = fake_message(json.dumps(self.analysis))
+
+    def test_identical_code_is_analyzed_once(self):
+        self.assertEqual(analyze_code('def f():\n    return 1\n'), self.analysis)
+        # Same code with different indentation and line endings
+        self.assertEqual(analyze_code('    def f():  \r\n        return 1'), self.analysis)
+        self.assertEqual(self.client_mock.messages.create.call_count, 1)
+        row = CodeAnalysis.objects.get()
+        self.assertEqual((row.operation, row.security_concerns), ('analysis', ['s']))
+
+        # A new process starts with an empty LRU and reads the stored row
+        response_cache.clear()
+        self.assertEqual(analyze_code('def f():\n    return 1'), self.analysis)
+        self.assertEqual(self.client_mock.messages.create.call_count, 1)
+        stats = response_cache.stats()
+        self.assertEqual((stats['db_hits'], stats['misses'], stats['hit_rate']), (1, 0, 1.0))
+
+    def test_explanations_are_cached_separately(self):
+        analyze_code('x = 1')
+        self.client_mock.messages.create.return_value = fake_message('Sets x.')
+        self.assertEqual(explain_code('x = 1'), 'Sets x.')
+        self.assertEqual(explain_code('x = 1'), 'Sets x.')
+        self.assertEqual(self.client_mock.messages.create.call_count, 2)
+
+    def test_expired_and_old_version_entries_are_misses(self):
+        analyze_code('x = 1')
+        response_cache.clear()
+        CodeAnalysis.objects.update(created_at=timezone.now() - timedelta(seconds=response_cache.ttl + 1))
+        analyze_code('x = 1')
+        self.assertEqual(self.client_mock.messages.create.call_count, 2)
+        self.assertEqual(CodeAnalysis.objects.count(), 1)
+
+        with override_settings(AI_ASSISTANT_CACHE_VERSION=2):
+            analyze_code('x = 1')
+        self.assertEqual(self.client_mock.messages.create.call_count, 3)
+
+    def test_errors_are_not_cached(self):
+        self.client_mock.messages.create.side_effect = RuntimeError('down')
+        self.assertEqual(analyze_code('x = 1')['suggestions'], ['Error: down'])
+        self.assertFalse(CodeAnalysis.objects.exists())
+
+    def test_stats_endpoint(self):
+        analyze_code('x = 1')
+        analyze_code('x = 1')
+        stats = self.client.get(reverse('django_ai_assistant:cache_stats')).json()
+        self.assertEqual((stats['memory_hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class ConsumerConcurrencyTest(TransactionTestCase):
+    """Model calls from different sockets overlap instead of queueing on one thread."""
+
+    def setUp(self):
+        # Suggestions still queued are written before the database is reset
+        self.addCleanup(suggestion_writes.close_sync)
+        self.stub = StubAnthropicServer(
+            text=json.dumps({'suggestion': 'pass', 'confidence': 0.9}), delay=0.3
+        ).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch(
+            'django_ai_assistant.services.llm', LLMClient(api_key='test', base_url=self.stub.url)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def request_suggestion(self, index):
+        communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+        await communicator.connect()
+        await communicator.receive_json()
+        await communicator.send_json({
+            'type': 'suggestion',
+            'content': {'code': f'x = {index}', 'file': f'f{index}.py'},
+        })
+        reply = await communicator.receive_json(timeout=10)
+        while reply['type'] == 'suggestion_delta':
+            reply = await communicator.receive_json(timeout=10)
+        await communicator.disconnect()
+        return reply
+
+    async def test_suggestions_run_concurrently(self):
+        started = time.monotonic()
+        replies = await asyncio.gather(*(self.request_suggestion(i) for i in range(10)))
+        elapsed = time.monotonic() - started
+
+        self.assertEqual({reply['content']['suggestion'] for reply in replies}, {'pass'})
+        self.assertGreater(self.stub.max_in_flight, 1)
+        # Ten 0.3s calls one after another would take 3s
+        self.assertLess(elapsed, 2)
+        await suggestion_writes.flush()
+        self.assertEqual(await CodeSuggestion.objects.acount(), 10)
+
+
+class SuggestionTextStreamTest(TestCase):
+
+    def feed_in_chunks(self, reply, size):
+        reader = SuggestionTextStream()
+        return ''.join(reader.feed(reply[start:start + size]) for start in range(0, len(reply), size))
+
+    def test_decodes_suggestion_across_chunk_boundaries(self):
+        suggestion = 'def total(lines):\n    return sum(l["amount"] for l in lines)  # \u00a3 \U0001f4b8\\'
+        reply = json.dumps({'suggestion': suggestion, 'confidence': 0.8, 'explanation': 'ignored'})
+        for size in (1, 2, 5, 7, len(reply)):
+            self.assertEqual(self.feed_in_chunks(reply, size), suggestion)
+
+    def test_passes_through_replies_that_are_not_json(self):
+        self.assertEqual(self.feed_in_chunks('Use a Decimal here.', 3), 'Use a Decimal here.')
+
+
+class SuggestionStreamingTest(TransactionTestCase):
+
+    def setUp(self):
+        # Suggestions still queued are written before the database is reset
+        self.addCleanup(suggestion_writes.close_sync)
+        self.reply = {'suggestion': 'from decimal import Decimal\n' * 20, 'confidence': 0.9, 'explanation': 'Use Decimal'}
+        self.stub = StubAnthropicServer(text=json.dumps(self.reply), chunk_size=16, chunk_delay=0.01).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch(
+            'django_ai_assistant.services.llm', LLMClient(api_key='test', base_url=self.stub.url)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_deltas_then_parsed_reply_then_record(self):
+        communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+        await communicator.connect()
+        await communicator.receive_json()
+        started = time.monotonic()
+        await communicator.send_json({'type': 'suggestion', 'content': {'code': 'x = 1', 'file': 'a.py'}})
+
+        frame = await communicator.receive_json(timeout=5)
+        first_delta_after = time.monotonic() - started
+        deltas = []
+        while frame['type'] == 'suggestion_delta':
+            deltas.append(frame['content'])
+            frame = await communicator.receive_json(timeout=5)
+        total = time.monotonic() - started
+        await communicator.disconnect()
+
+        self.assertGreater(len(deltas), 1)
+        self.assertLess(first_delta_after, total / 2)
+        self.assertEqual(''.join(deltas), self.reply['suggestion'])
+        self.assertEqual(frame, {'type': 'suggestion', 'id': 'auto-1', 'content': self.reply})
+        self.assertEqual(self.stub.requests[0]['stream'], True)
+        await suggestion_writes.flush()
+        stored = await CodeSuggestion.objects.aget()
+        self.assertEqual((stored.suggestion, stored.confidence), (self.reply['suggestion'], 0.9))
+
+
+class RequestMultiplexingTest(TransactionTestCase):
+
+    def setUp(self):
+        # Suggestions still queued are written before the database is reset
+        self.addCleanup(suggestion_writes.close_sync)
+        self.reply = {'suggestion': 'x = 1\n' * 10, 'confidence': 0.9}
+        self.stub = StubAnthropicServer(text=json.dumps(self.reply), chunk_size=4, chunk_delay=0.02).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch(
+            'django_ai_assistant.services.llm', LLMClient(api_key='test', base_url=self.stub.url)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self):
+        communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+        await communicator.connect()
+        await communicator.receive_json()
+        return communicator
+
+    async def suggest(self, communicator, request_id, file_path):
+        await communicator.send_json({
+            'type': 'suggestion', 'id': request_id, 'content': {'code': 'x = 1', 'file': file_path},
+        })
+
+    async def frames_until(self, communicator, frame_type, request_id):
+        """Frames received up to and including the first frame_type frame for request_id."""
+        frames = []
+        while True:
+            frame = await communicator.receive_json(timeout=5)
+            frames.append(frame)
+            if (frame['type'], frame['id']) == (frame_type, request_id):
+                return frames
+
+    async def test_requests_on_one_socket_run_concurrently(self):
+        communicator = await self.connect()
+        await self.suggest(communicator, 'a', 'a.py')
+        await self.suggest(communicator, 'b', 'b.py')
+        frames = []
+        while len([f for f in frames if f['type'] == 'suggestion']) < 2:
+            frames.append(await communicator.receive_json(timeout=5))
+        await communicator.disconnect()
+
+        for request_id in 'ab':
+            deltas = [f['content'] for f in frames if f['type'] == 'suggestion_delta' and f['id'] == request_id]
+            self.assertEqual(''.join(deltas), self.reply['suggestion'])
+        self.assertEqual(self.stub.max_in_flight, 2)
+
+    async def test_newer_request_for_a_file_supersedes_the_older(self):
+        communicator = await self.connect()
+        await self.suggest(communicator, 1, 'a.py')
+        await self.frames_until(communicator, 'suggestion_delta', 1)
+        await self.suggest(communicator, 2, 'a.py')
+        frames = await self.frames_until(communicator, 'suggestion', 2)
+        await communicator.disconnect()
+
+        self.assertIn({'type': 'cancelled', 'id': 1, 'content': {'reason': 'superseded'}}, frames)
+        cancelled_at = frames.index({'type': 'cancelled', 'id': 1, 'content': {'reason': 'superseded'}})
+        self.assertFalse([f for f in frames[cancelled_at:] if f['id'] == 1 and f['type'] != 'cancelled'])
+        await suggestion_writes.flush()
+        self.assertEqual(await CodeSuggestion.objects.acount(), 1)
+        # The first backend stream was closed rather than read to the end
+        for _ in range(50):
+            if self.stub.aborted:
+                break
+            await asyncio.sleep(0.05)
+        self.assertEqual(self.stub.aborted, 1)
+
+    async def test_cancel(self):
+        communicator = await self.connect()
+        await self.suggest(communicator, 'slow', 'a.py')
+        await self.frames_until(communicator, 'suggestion_delta', 'slow')
+        await communicator.send_json({'type': 'cancel', 'id': 'slow'})
+        frame = await communicator.receive_json()
+        while frame['type'] == 'suggestion_delta':
+            frame = await communicator.receive_json()
+        self.assertEqual(frame, {'type': 'cancelled', 'id': 'slow', 'content': {'reason': 'cancelled'}})
+        self.assertTrue(await communicator.receive_nothing(0.2))
+        await communicator.disconnect()
+        await suggestion_writes.flush()
+        self.assertFalse(await CodeSuggestion.objects.aexists())
+
+    async def test_requests_over_the_limit_are_refused(self):
+        communicator = await self.connect()
+        with mock.patch('django_ai_assistant.consumers.MAX_IN_FLIGHT', 1):
+            await self.suggest(communicator, 'a', 'a.py')
+            await self.suggest(communicator, 'b', 'b.py')
+            frames = await self.frames_until(communicator, 'suggestion', 'a')
+        await communicator.disconnect()
+
+        refused = [f for f in frames if f['id'] == 'b']
+        self.assertEqual(len(refused), 1)
+        self.assertEqual((refused[0]['type'], refused[0]['code']), ('error', 'busy'))
+
+
+class SuggestionContextTest(TestCase):
+
+    def setUp(self):
+        methods = ''.join(
+            f'    def method_{i}(self, amount):\n        total = amount * {i}\n        return total\n\n'
+            for i in range(1000)
+        )
+        self.code = (
+            'from decimal import Decimal\n'
+            'from django.db import (\n    models,\n    transaction,\n)\n\n'
+            'class Calculator:\n' + methods +
+            '    def apply(self,\n              order):\n        amount = order.total\n'
+            '        ' + 'CURSOR\n        return amount\n' + methods.replace('method_', 'other_')
+        )
+        self.cursor = self.code.index('CURSOR')
+
+    def test_window_stays_within_budget(self):
+        context = build_suggestion_context(self.code, self.cursor, 'python', budget=500)
+        self.assertLessEqual(context.tokens, 500)
+        self.assertTrue(context.before.endswith('        amount = order.total\n        '))
+        self.assertTrue(context.after.startswith('CURSOR\n        return amount\n'))
+
+    def test_imports_and_enclosing_signatures(self):
+        context = build_suggestion_context(self.code, self.cursor, 'python', budget=500)
+        self.assertEqual(
+            context.imports,
+            'from decimal import Decimal\nfrom django.db import (\n    models,\n    transaction,\n)'
+        )
+        # apply's signature is inside the window, so only the class is repeated
+        self.assertEqual(context.scopes, 'class Calculator:')
+
+        scopes = python_scopes(self.code, self.cursor, budget=100)
+        self.assertEqual(
+            [signature for _, signature in scopes],
+            ['class Calculator:', '    def apply(self,\n              order):']
+        )
+        # Over budget, the innermost signature is kept
+        self.assertEqual(len(python_scopes(self.code, self.cursor, budget=12)), 1)
+
+    def test_small_files_are_sent_whole_without_repeats(self):
+        code = 'import os\n\ndef f():\n    return os.getcwd()\n'
+        context = build_suggestion_context(code, code.index('return'), 'python')
+        self.assertEqual((context.imports, context.scopes), ('', ''))
+        self.assertEqual(context.before + context.after, code)
+
+    def test_other_languages_get_the_window_only(self):
+        code = "import x from 'y';\n" + 'const a = 1;\n' * 5000
+        context = build_suggestion_context(code, len(code) // 2, 'javascript', budget=300)
+        self.assertEqual((context.imports, context.scopes), ('', ''))
+        self.assertLessEqual(context.tokens, 300)
+
+    def test_prompt_size_does_not_grow_with_the_file(self):
+        prompt = build_suggestion_prompt(self.code, self.cursor, 'python', 'calculator.py')
+        self.assertLess(len(prompt), 20000)
+        self.assertIn('CURSOR', prompt)
+        self.assertNotIn('method_5(', prompt)
+
+
+class RetrievalIndexTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, 'src')
+        os.makedirs(os.path.join(self.root, 'billing', 'migrations'))
+        self.path = os.path.join(directory.name, 'index.pickle')
+        self.write('billing/calculator.py', (
+            'from decimal import Decimal\n\n'
+            'def calculate_invoice_total(lines):\n    return sum(line.amount for line in lines)\n\n'
+            'class ShippingRate:\n    def rate_for_weight(self, weightLb):\n        return Decimal("1.5") * weightLb\n'
+        ))
+        self.write('billing/views.py', 'def invoice_list(request):\n    return render(request, "invoices.html")\n')
+        self.write('billing/migrations/0001_initial.py', 'def calculate_invoice_total():\n    pass\n')
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        # Make sure a rewrite within the same clock tick still changes the mtime
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def sources(self, results):
+        return [(source, line) for _, source, line, _ in results]
+
+    def test_search_finds_definitions(self):
+        index = RetrievalIndex(self.root, self.path)
+        self.assertEqual(index.refresh(), 2)
+        self.assertEqual(self.sources(index.search('invoice total', k=1)), [('billing/calculator.py', 3)])
+        # camelCase parts, and a partial word expanded through trigrams
+        self.assertEqual(self.sources(index.search('weight lb', k=1)), [('billing/calculator.py', 7)])
+        self.assertEqual(self.sources(index.search('ShippingRat', k=1)), [('billing/calculator.py', 6)])
+        self.assertEqual(index.search('invoice', k=5, exclude_source='billing/calculator.py')[0][1], 'billing/views.py')
+
+    def test_refresh_only_reindexes_changed_sources(self):
+        index = RetrievalIndex(self.root, self.path)
+        index.refresh()
+        self.assertEqual(index.refresh(), 0)
+
+        self.write('billing/views.py', 'def credit_note_list(request):\n    pass\n')
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(self.sources(index.search('credit note', k=1)), [('billing/views.py', 1)])
+        self.assertEqual(index.search('invoice', k=5)[0][1], 'billing/calculator.py')
+
+        os.remove(os.path.join(self.root, 'billing', 'views.py'))
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(index.search('credit note'), [])
+
+    def test_index_is_persisted(self):
+        RetrievalIndex(self.root, self.path).refresh()
+        index = RetrievalIndex.load(self.root, self.path)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(index.refresh(), 0)
+        # An index built for another tree is not reused
+        self.assertEqual(len(RetrievalIndex.load(os.path.join(self.root, 'billing'), self.path)), 0)
+
+    def test_code_patterns_are_indexed(self):
+        index = RetrievalIndex(self.root, self.path)
+        index.refresh()
+        pattern = CodePattern.objects.create(
+            name='Audit log entry', pattern_type='audit', description='Record who changed a ledger entry',
+            code_template='AuditLog.objects.create(user=request.user, action=action)',
+        )
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(self.sources(index.search('audit log', k=1)), [(f'pattern:{pattern.id}', 0)])
+        # Using a pattern doesn't re-index it; editing it does
+        CodePattern.objects.filter(id=pattern.id).update(usage_count=5, last_used=timezone.now())
+        self.assertEqual(index.refresh(), 0)
+        CodePattern.objects.filter(id=pattern.id).update(description='Record who voided a ledger entry')
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(self.sources(index.search('voided', k=1)), [(f'pattern:{pattern.id}', 0)])
+        pattern.delete()
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(index.search('audit'), [])
+
+    def test_queries_on_the_ledgerlink_tree_are_fast(self):
+        index = get_source_index()
+        self.assertGreater(len(index), 100)
+        code = (index.root / 'billing' / 'billing_calculator.py').read_text()
+        timings = []
+        for offset in range(0, len(code) - 2000, len(code) // 50):
+            started = time.perf_counter()
+            index.search(code[offset:offset + 2000])
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        self.assertLess(timings[len(timings) // 2], 0.01)
+
+
+LIST_VIEW_TEMPLATE = """class OrderListView(ListView):
+    model = Order
+    COLUMN_DEFINITIONS = {}
+"""
+
+
+class PatternFastPathTest(TransactionTestCase):
+
+    def setUp(self):
+        # Suggestions still queued are written before the database is reset
+        self.addCleanup(suggestion_writes.close_sync)
+        self.pattern = CodePattern.objects.create(
+            name='List view', pattern_type='ListView', code_template=LIST_VIEW_TEMPLATE,
+            description='A ListView with column definitions',
+        )
+        CodePattern.objects.create(
+            name='API view', pattern_type='api_view', code_template='@api_view(["GET"])\ndef detail(request, pk):\n',
+            description='A DRF function view',
+        )
+        get_source_index().refresh()
+        self.code = 'from django.views.generic import ListView\n\nclass InvoiceListView(ListView):\n    '
+
+    def test_matching_boilerplate_skips_the_model(self):
+        with mock_llm() as llm:
+            suggestion = generate_code_suggestion(self.code, len(self.code), 'python', 'billing/views.py')
+        llm.client.messages.create.assert_not_called()
+        self.assertEqual(
+            (suggestion['source'], suggestion['pattern_id'], suggestion['suggestion']),
+            ('pattern', self.pattern.id, LIST_VIEW_TEMPLATE)
+        )
+        self.pattern.refresh_from_db()
+        self.assertEqual(self.pattern.usage_count, 1)
+
+    def test_other_code_goes_to_the_model(self):
+        code = 'class InvoiceList(View):\n    '
+        with mock_llm() as llm:
+            llm.client.messages.create.return_value = fake_message(json.dumps({'suggestion': 'pass', 'confidence': 0.5}))
+            suggestion = generate_code_suggestion(code, len(code), 'python', 'billing/views.py')
+        self.assertEqual(suggestion, {'suggestion': 'pass', 'confidence': 0.5})
+        self.assertEqual(CodePattern.objects.get(id=self.pattern.id).usage_count, 0)
+
+    async def suggest(self, content):
+        stub = StubAnthropicServer(text=json.dumps({'suggestion': 'refined', 'confidence': 0.9}), delay=0.5)
+        stub.start()
+        self.addCleanup(stub.stop)
+        with mock.patch('django_ai_assistant.services.llm', LLMClient(api_key='test', base_url=stub.url)):
+            communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+            await communicator.connect()
+            await communicator.receive_json()
+            started = time.monotonic()
+            await communicator.send_json({'type': 'suggestion', 'id': 1, 'content': content})
+            first = await communicator.receive_json(timeout=5)
+            first_after = time.monotonic() - started
+            frames = [first]
+            while not await communicator.receive_nothing(0.7):
+                frames.append(await communicator.receive_json())
+            await communicator.disconnect()
+        return stub, first_after, frames
+
+    async def test_pattern_answers_first_then_the_model_refines(self):
+        stub, first_after, frames = await self.suggest({'code': self.code, 'cursor': len(self.code), 'file': 'a.py'})
+        self.assertEqual((frames[0]['type'], frames[0]['content']['source']), ('suggestion', 'pattern'))
+        self.assertLess(first_after, 0.4)
+        self.assertEqual(frames[-1], {'type': 'suggestion', 'id': 1, 'content': {'suggestion': 'refined', 'confidence': 0.9}})
+        self.assertEqual(len(stub.requests), 1)
+        await suggestion_writes.flush()
+        stored = await CodeSuggestion.objects.aget()
+        self.assertEqual((stored.suggestion, stored.context), ('refined', {'pattern_id': self.pattern.id}))
+
+    async def test_pattern_only_when_refining_is_off(self):
+        stub, _, frames = await self.suggest(
+            {'code': self.code, 'cursor': len(self.code), 'file': 'a.py', 'refine': False}
+        )
+        self.assertEqual([frame['content'].get('source') for frame in frames], ['pattern'])
+        self.assertEqual(stub.requests, [])
+        await suggestion_writes.flush()
+        stored = await CodeSuggestion.objects.aget()
+        self.assertEqual(stored.suggestion, LIST_VIEW_TEMPLATE)
+
+
+class BulkAnalysisTest(TransactionTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.write('ledger.py', 'def post(entry):\n    entry.save()\n\n\ndef void(entry):\n    entry.delete()\n')
+        self.write('billing.py', 'class Invoice:\n    total = 0\n')
+        analysis = {'suggestions': ['Validate amounts'], 'improvements': [], 'security': ['Check permissions']}
+        self.stub = StubAnthropicServer(text=json.dumps(analysis)).start()
+        self.addCleanup(self.stub.stop)
+
+    def write(self, name, text):
+        with open(os.path.join(self.root, name), 'w') as file:
+            file.write(text)
+
+    async def run_job(self, **options):
+        options = {'concurrency': 2, 'requests_per_minute': 60000, 'base_backoff': 0.01, **options}
+        # The job closes the client when it finishes, on this test's event loop
+        client = AsyncAnthropic(api_key='test', base_url=self.stub.url)
+        return await BulkAnalysisJob(self.root, client=client, **options).run()
+
+    async def test_analyzes_each_chunk_once(self):
+        stats = await self.run_job()
+        self.assertEqual((stats.files, stats.chunks, stats.analyzed, stats.skipped), (2, 3, 3, 0))
+        self.assertEqual(await CodeAnalysis.objects.acount(), 3)
+        row = await CodeAnalysis.objects.aget(code_snippet__startswith='class Invoice')
+        self.assertEqual((row.operation, row.security_concerns), ('analysis', ['Check permissions']))
+
+        # Unchanged chunks are skipped; only the edited function is sent again
+        self.write('ledger.py', 'def post(entry):\n    entry.save()\n\n\ndef void(entry):\n    entry.void()\n')
+        stats = await self.run_job()
+        self.assertEqual((stats.analyzed, stats.skipped), (1, 2))
+        self.assertEqual(len(self.stub.requests), 4)
+
+        # The rows are what analyze_code finds in the response cache
+        response_cache.clear()
+        with mock_llm() as llm:
+            await database_sync_to_async(analyze_code)('class Invoice:\n    total = 0\n')
+        llm.client.messages.create.assert_not_called()
+
+    async def test_retries_rate_limits_and_server_errors(self):
+        metrics.clear()
+        self.stub.errors = [429, 503, 529]
+        stats = await self.run_job(concurrency=1)
+        self.assertEqual((stats.analyzed, stats.failed, stats.retries), (3, 0, 3))
+        # Through LLMClient, so the calls are in the client metrics too
+        analysis = metrics.snapshot()['analysis']
+        self.assertEqual((analysis['calls'], analysis['retries']), (3, 3))
+
+    async def test_gives_up_on_client_errors_and_after_max_attempts(self):
+        self.stub.errors = [400, 500, 500]
+        stats = await self.run_job(concurrency=1, max_attempts=2)
+        self.assertEqual((stats.analyzed, stats.failed, stats.retries), (1, 2, 1))
+        self.assertEqual(await CodeAnalysis.objects.acount(), 1)
+
+    def test_fake_latency_runs_leave_no_rows(self):
+        out = StringIO()
+        call_command('analyze_repository', root=self.root, fake_latency=0, requests_per_minute=60000, stdout=out)
+        self.assertIn('3 analyzed', out.getvalue())
+        self.assertFalse(CodeAnalysis.objects.exists())
+
+    async def test_request_rate_is_limited(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+
+class LLMClientTest(TestCase):
+
+    def setUp(self):
+        metrics.clear()
+        self.stub = StubAnthropicServer(text=json.dumps({'suggestion': 'pass'})).start()
+        self.addCleanup(self.stub.stop)
+
+    def llm(self, **options):
+        llm = LLMClient(api_key='test', base_url=self.stub.url, base_backoff=0.01, **options)
+        self.addCleanup(llm.close)
+        return llm
+
+    def create(self, llm, operation='analysis'):
+        return llm.create(operation, model='stub', max_tokens=100, messages=[{'role': 'user', 'content': 'x = 1'}])
+
+    def test_transient_errors_are_retried(self):
+        self.stub.errors = [529, 503]
+        response = self.create(self.llm())
+        self.assertEqual(response.content[0].text, json.dumps({'suggestion': 'pass'}))
+        self.assertEqual(len(self.stub.requests), 3)
+        analysis = metrics.snapshot()['analysis']
+        self.assertEqual((analysis['calls'], analysis['retries'], analysis['errors']), (1, 2, 0))
+        self.assertEqual(analysis['input_tokens']['count'], 1)
+
+    def test_client_errors_and_timeouts(self):
+        self.stub.errors = [400]
+        with self.assertRaises(anthropic.BadRequestError):
+            self.create(self.llm())
+        self.assertEqual(len(self.stub.requests), 1)
+
+        self.stub.delay = 0.5
+        with self.assertRaises(anthropic.APITimeoutError):
+            self.create(self.llm(timeout=0.1, max_attempts=2))
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(metrics.snapshot()['analysis']['errors'], 2)
+
+    def test_circuit_breaker(self):
+        self.stub.errors = [500, 500, 500]
+        llm = self.llm(max_attempts=2, breaker_threshold=3, breaker_reset=0.2)
+        for _ in range(2):
+            with self.assertRaises(anthropic.InternalServerError):
+                self.create(llm)
+        self.assertEqual(llm.breaker.state, 'open')
+        # While open, calls fail without reaching the API
+        with self.assertRaises(CircuitOpenError):
+            self.create(llm)
+        self.assertEqual(len(self.stub.requests), 3)
+        self.assertEqual(metrics.snapshot()['analysis']['rejected'], 1)
+
+        time.sleep(0.25)
+        self.assertEqual(llm.breaker.state, 'half_open')
+        self.create(llm)
+        self.assertEqual(llm.breaker.state, 'closed')
+
+    def test_cancelled_trial_lets_the_next_call_through(self):
+        self.stub.errors = [500]
+        llm = self.llm(max_attempts=1, breaker_threshold=1, breaker_reset=0.05)
+
+        async def cancel_trial():
+            with self.assertRaises(anthropic.InternalServerError):
+                await llm.acreate('analysis', model='stub', max_tokens=100, messages=[])
+            await asyncio.sleep(0.06)
+            self.stub.delay = 0.5
+            trial = asyncio.create_task(llm.acreate('analysis', model='stub', max_tokens=100, messages=[]))
+            await asyncio.sleep(0.1)
+            trial.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await trial
+            self.stub.delay = 0
+            await llm.acreate('analysis', model='stub', max_tokens=100, messages=[])
+            await llm.aclose()
+
+        asyncio.run(cancel_trial())
+        self.assertEqual(llm.breaker.state, 'closed')
+
+    @override_settings(ANTHROPIC_API_KEY=None)
+    def test_missing_api_key_fails_calls_only(self):
+        with mock.patch('django_ai_assistant.services.llm', LLMClient()):
+            self.assertIn('ANTHROPIC_API_KEY', explain_code('x = 1'))
+
+    def test_streams_and_metrics_endpoint(self):
+        self.stub.text = 'Hello from the stub'
+        with self.llm().stream('chat', model='stub', max_tokens=100, messages=[]) as events:
+            text = ''.join(event.delta.text for event in events if event.type == 'content_block_delta')
+        self.assertEqual(text, 'Hello from the stub')
+        self.create(self.llm(), 'explanation')
+
+        stats = self.client.get(reverse('django_ai_assistant:client_metrics')).json()
+        self.assertEqual(set(stats), {'chat', 'explanation'})
+        chat = stats['chat']
+        self.assertEqual((chat['calls'], chat['output_tokens']['sum']), (1, len(text) // 4))
+        self.assertEqual(chat['latency_ms']['buckets']['+Inf'], 1)
+
+
+class ChatStreamTest(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubAnthropicServer(text='Debits on the left, credits on the right.').start()
+        self.addCleanup(self.stub.stop)
+        self.llm = LLMClient(api_key='test', base_url=self.stub.url)
+        patcher = mock.patch('django_ai_assistant.services.llm', self.llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def chat(self, content):
+        body = json.dumps({'content': content}).encode()
+        communicator = ApplicationCommunicator(ASGIHandler(), {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': reverse('django_ai_assistant:chat_message'), 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')],
+        })
+        return communicator, communicator.send_input({'type': 'http.request', 'body': body})
+
+    async def read(self, communicator):
+        """The response's status and body, read to the end."""
+        start = await communicator.receive_output(5)
+        chunks = []
+        while True:
+            message = await communicator.receive_output(5)
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return start['status'], b''.join(chunks).decode()
+
+    @closes_llm
+    async def test_streams_events_with_a_system_prompt(self):
+        communicator, request = self.chat('Which side are debits on?')
+        await request
+        status, body = await self.read(communicator)
+        self.assertEqual(status, 200)
+        events = [line[len('data: '):] for line in body.split('\n\n') if line.startswith('data: ')]
+        self.assertEqual(events[-1], '[DONE]')
+        text = ''.join(json.loads(event)['text'] for event in events[:-1])
+        self.assertEqual(text, 'Debits on the left, credits on the right.')
+
+        sent = self.stub.requests[0]
+        self.assertEqual(sent['system'], CHAT_SYSTEM_PROMPT)
+        self.assertEqual(sent['messages'], [{'role': 'user', 'content': 'Which side are debits on?'}])
+
+    @override_settings(AI_ASSISTANT_SSE_HEARTBEAT=0.05)
+    @closes_llm
+    async def test_heartbeats_while_waiting_for_the_model(self):
+        self.stub.delay = 0.3
+        communicator, request = self.chat('Hello')
+        await request
+        status, body = await self.read(communicator)
+        self.assertTrue(body.startswith(': heartbeat\n\n'))
+        self.assertTrue(body.endswith('data: [DONE]\n\n'))
+
+    @closes_llm
+    async def test_disconnect_aborts_the_model_stream(self):
+        self.stub.chunk_delay = 0.05
+        communicator, request = self.chat('Hello')
+        await request
+        await communicator.receive_output(5)
+        await communicator.receive_output(5)
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(5)
+        for _ in range(50):
+            if self.stub.aborted:
+                break
+            await asyncio.sleep(0.05)
+        self.assertEqual(self.stub.aborted, 1)
+
+    @closes_llm
+    async def test_concurrent_chats_share_the_process(self):
+        self.stub.delay = 0.5
+
+        async def chat():
+            communicator, request = self.chat('Hello')
+            await request
+            return await self.read(communicator)
+
+        started = time.monotonic()
+        replies = await asyncio.gather(*(chat() for _ in range(100)))
+        elapsed = time.monotonic() - started
+        self.assertTrue(all(body.endswith('data: [DONE]\n\n') for _, body in replies))
+        # Serialized, 100 half-second replies would take 50s
+        self.assertLess(elapsed, 5)
+        self.assertEqual(self.stub.max_in_flight, 100)
+
+    def test_content_is_required(self):
+        response = self.client.post(
+            reverse('django_ai_assistant:chat_message'), {'content': ''}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class WriteBehindTest(TransactionTestCase):
+
+    def suggestion(self, number):
+        return CodeSuggestion(
+            file_path=f'f{number}.py', code_snippet='x', suggestion='pass', confidence=0.5, language='python'
+        )
+
+    async def test_writes_every_batch_size_rows(self):
+        buffer = WriteBehindBuffer(CodeSuggestion, batch_size=5, interval_ms=10000)
+        for number in range(12):
+            buffer.put(self.suggestion(number))
+        await asyncio.sleep(0.2)
+        self.assertEqual(await CodeSuggestion.objects.acount(), 10)
+        # Closing writes the rest
+        await buffer.close()
+        self.assertEqual(await CodeSuggestion.objects.acount(), 12)
+        self.assertEqual((buffer.stats()['batches'], buffer.stats()['pending']), (3, 0))
+
+    async def test_writes_after_interval(self):
+        buffer = WriteBehindBuffer(CodeSuggestion, batch_size=100, interval_ms=50)
+        for number in range(3):
+            buffer.put(self.suggestion(number))
+        await asyncio.sleep(0.3)
+        self.assertEqual(await CodeSuggestion.objects.acount(), 3)
+        await buffer.close()
+
+    async def test_full_queue_drops_rows(self):
+        buffer = WriteBehindBuffer(CodeSuggestion, max_queue=3)
+        for number in range(5):
+            buffer.put(self.suggestion(number))
+        await buffer.close()
+        stats = buffer.stats()
+        self.assertEqual(
+            (stats['queued'], stats['dropped'], stats['written'], stats['high_water']), (3, 2, 3, 3)
+        )
+        self.assertEqual(await CodeSuggestion.objects.acount(), 3)
+
+    async def test_upserts_keep_the_last_row_per_key(self):
+        buffer = WriteBehindBuffer(CodeAnalysis, **analysis_writes.bulk_options)
+        for suggestions in (['first'], ['second']):
+            buffer.put(CodeAnalysis(content_hash='k', **row_fields('analysis', 'm', 'x = 1', {'suggestions': suggestions})))
+        await buffer.close()
+        self.assertEqual(await CodeAnalysis.objects.values_list('suggestions', flat=True).aget(), ['second'])
+
+    @closes_llm
+    async def test_replies_before_rows_are_written(self):
+        stub = StubAnthropicServer(text=json.dumps({'suggestion': 'pass', 'confidence': 0.9})).start()
+        self.addCleanup(stub.stop)
+        self.llm = LLMClient(api_key='test', base_url=stub.url)
+        self.addCleanup(self.llm.close)
+        suggestions = WriteBehindBuffer(CodeSuggestion, interval_ms=10000)
+        analyses = WriteBehindBuffer(CodeAnalysis, interval_ms=10000, **analysis_writes.bulk_options)
+        with mock.patch('django_ai_assistant.services.llm', self.llm), \
+                mock.patch('django_ai_assistant.consumers.suggestion_writes', suggestions), \
+                mock.patch('django_ai_assistant.services.analysis_writes', analyses):
+            communicator = ConsumerClient(CodeAssistantConsumer.as_asgi(), '/ws/codeassistant/')
+            await communicator.connect()
+            await communicator.receive_json()
+            await communicator.send_json({'type': 'suggestion', 'id': 1, 'content': {'code': 'x = 1'}})
+            frame = await communicator.receive_json(timeout=5)
+            while frame['type'] == 'suggestion_delta':
+                frame = await communicator.receive_json(timeout=5)
+            await communicator.send_json({'type': 'analysis', 'id': 2, 'content': {'code': 'x = 1'}})
+            self.assertEqual((await communicator.receive_json(timeout=5))['type'], 'analysis')
+            await communicator.disconnect()
+
+        self.assertEqual(frame['content']['suggestion'], 'pass')
+        self.assertFalse(await CodeSuggestion.objects.aexists())
+        self.assertFalse(await CodeAnalysis.objects.aexists())
+        self.assertEqual(suggestions.stats()['pending'], 1)
+
+        await suggestions.close()
+        await analyses.close()
+        self.assertEqual(await CodeSuggestion.objects.acount(), 1)
+        self.assertEqual(await CodeAnalysis.objects.acount(), 1)
+        stats = (await self.async_client.get(reverse('django_ai_assistant:write_stats'))).json()
+        self.assertEqual(set(stats), {'CodeSuggestion', 'CodeAnalysis'})
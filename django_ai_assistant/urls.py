@@ -7,6 +7,9 @@ urlpatterns = [
     path('code/suggest/', views.code_suggestion, name='code_suggestion'),
     path('code/analyze/', views.code_analysis, name='code_analysis'),
     path('code/explain/', views.code_explanation, name='code_explanation'),
+    path('code/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('code/metrics/', views.client_metrics, name='client_metrics'),
+    path('code/write-stats/', views.write_stats, name='write_stats'),
     path('chat/message/', views.chat_message, name='chat_message'),
     path('code/test-generation/', views.test_code_generation, name='test_code_generation'),
 ]
\ No newline at end of file
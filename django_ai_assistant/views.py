@@ -1,13 +1,57 @@
+from django.conf import settings
 from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+import asyncio
 import json
-from .services import generate_code_suggestion, analyze_code, explain_code
+from .cache import response_cache
+from .client import metrics
+from .write_behind import buffers
+from .services import generate_code_suggestion, analyze_code, explain_code, astream_chat_response
 from django.core.exceptions import ValidationError
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Seconds of silence after which an SSE comment is sent, so proxies keep the stream open
+DEFAULT_HEARTBEAT_SECONDS = 15
+
+async def sse_events(chunks, heartbeat):
+    """
+    The dicts from chunks as server-sent events, ending with [DONE], and a
+    comment line whenever heartbeat seconds pass without one. If the client
+    disconnects, Django cancels the iteration and chunks is cancelled too.
+    """
+    queue = asyncio.Queue()
+
+    async def read():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except Exception as e:
+            logger.error(f"Error generating chat response: {str(e)}")
+            await queue.put({'error': str(e)})
+        await queue.put(None)
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if chunk is None:
+                break
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        reader.cancel()
+        try:
+            await reader
+        except asyncio.CancelledError:
+            pass
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def test_code_generation(request):
@@ -121,10 +165,29 @@ def code_explanation(request):
         logger.error(f"Error explaining code: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@require_http_methods(["GET"])
+def cache_stats(request):
+    """Hit counts and hit rate of the analysis and explanation response cache."""
+    return JsonResponse(response_cache.stats())
+
+@require_http_methods(["GET"])
+def write_stats(request):
+    """Queued, written and dropped row counts of the write-behind buffers."""
+    return JsonResponse({buffer.model.__name__: buffer.stats() for buffer in buffers})
+
+@require_http_methods(["GET"])
+def client_metrics(request):
+    """Per-operation call counts and latency and token histograms of the Anthropic client."""
+    return JsonResponse(metrics.snapshot())
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def chat_message(request):
-    """Handle chat messages with streaming response."""
+async def chat_message(request):
+    """
+    Stream a chat reply as server-sent events. The view is async, so under
+    ASGI an open stream holds no worker thread; a client that disconnects
+    cancels the model's stream.
+    """
     try:
         data = json.loads(request.body)
         conversation_id = data.get('conversation_id')
@@ -133,26 +196,18 @@ def chat_message(request):
         if not content:
             raise ValidationError("Message content is required")
 
-        def generate_response():
-            try:
-                for chunk in generate_chat_response(content, conversation_id):
-                    if isinstance(chunk, dict):
-                        yield f"data: {json.dumps(chunk)}\n\n"
-                yield "data: [DONE]\n\n"
-            except Exception as e:
-                logger.error(f"Error generating chat response: {str(e)}")
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
+        heartbeat = getattr(settings, 'AI_ASSISTANT_SSE_HEARTBEAT', DEFAULT_HEARTBEAT_SECONDS)
         response = StreamingHttpResponse(
-            generate_response(),
+            sse_events(astream_chat_response(content, conversation_id), heartbeat),
             content_type='text/event-stream'
         )
         response['Cache-Control'] = 'no-cache'
-        response['Connection'] = 'keep-alive'
+        # Stops nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
         return response
 
     except ValidationError as e:
         return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logger.error(f"Error processing chat message: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,208 @@
+"""
+Write-behind persistence for rows written on the WebSocket path.
+
+Instead of saving a CodeSuggestion or CodeAnalysis before it can move on,
+the consumer hands the unsaved instance to a WriteBehindBuffer and replies
+straight away. A background task on the event loop writes the buffer with
+bulk_create once it holds AI_ASSISTANT_WRITE_BATCH_SIZE rows, or
+AI_ASSISTANT_WRITE_INTERVAL_MS after the first row of a batch arrived.
+
+The queue is bounded by AI_ASSISTANT_WRITE_QUEUE_SIZE: when the database
+falls that far behind, new rows are dropped and counted rather than held in
+memory without limit. Buffers are flushed on ASGI lifespan shutdown, see
+LifespanApp, and as a last resort at interpreter exit.
+"""
+import asyncio
+import atexit
+import logging
+from typing import Dict, List
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .cache import ROW_UPDATE_FIELDS
+from .models import CodeAnalysis, CodeSuggestion
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_INTERVAL_MS = 200
+DEFAULT_QUEUE_SIZE = 10000
+
+buffers = []
+
+
+class WriteBehindBuffer:
+    """
+    Rows queued for bulk_create on the running event loop. bulk_options are
+    passed to bulk_create, e.g. to update rows with the same unique key.
+    """
+
+    def __init__(self, model, batch_size: int = None, interval_ms: int = None, max_queue: int = None,
+                 **bulk_options):
+        self.model = model
+        self.batch_size = batch_size or getattr(settings, 'AI_ASSISTANT_WRITE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.interval = (interval_ms or getattr(settings, 'AI_ASSISTANT_WRITE_INTERVAL_MS', DEFAULT_INTERVAL_MS)) / 1000
+        self.max_queue = max_queue or getattr(settings, 'AI_ASSISTANT_WRITE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        self.bulk_options = bulk_options
+        self.counts = {'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'failed': 0}
+        self.high_water = 0
+        # The queue and the task writing it belong to one event loop
+        self._loop = None
+        self._queue = None
+        self._task = None
+        # Set when a batch's worth of rows is waiting
+        self._full = None
+        # Rows taken off the queue and not yet handed to bulk_create
+        self._pending = []
+
+    def put(self, obj) -> None:
+        """Queue an unsaved instance to be written; call from the event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._loop is not None and self._loop.is_running():
+                # Another thread's loop (async_to_sync); the queue isn't safe to touch from here
+                self._loop.call_soon_threadsafe(self._put, obj)
+                return
+            self._start(loop)
+        self._put(obj)
+
+    def _put(self, obj):
+        try:
+            self._queue.put_nowait(obj)
+        except asyncio.QueueFull:
+            self.counts['dropped'] += 1
+            if self.counts['dropped'] % 1000 == 1:
+                logger.warning(
+                    f"{self.model.__name__} write-behind queue is full ({self.max_queue}); "
+                    f"{self.counts['dropped']} rows dropped so far"
+                )
+            return
+        self.counts['queued'] += 1
+        self.high_water = max(self.high_water, self._queue.qsize())
+        if len(self._pending) + self._queue.qsize() >= self.batch_size:
+            self._full.set()
+
+    def _start(self, loop):
+        # Rows left behind by a loop that has since closed are carried over
+        leftovers = self._drain()
+        self._loop = loop
+        self._queue = asyncio.Queue(self.max_queue)
+        self._full = asyncio.Event()
+        self._task = loop.create_task(self._run())
+        self._pending = leftovers
+
+    def _drain(self) -> List:
+        rows, self._pending = self._pending, []
+        while self._queue is not None and not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                # Taken off the queue in this task's own step, so a row is
+                # always either queued or pending when flush looks
+                self._pending.append(await self._queue.get())
+            if len(self._pending) + self._queue.qsize() < self.batch_size:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            rows, self._pending = self._pending, []
+            while len(rows) < self.batch_size and not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            await self._write(rows)
+
+    def _bulk_create(self, rows):
+        if not rows:
+            return
+        unique_fields = self.bulk_options.get('unique_fields')
+        if unique_fields:
+            # An upsert can't touch the same row twice in one statement; the last one wins
+            rows = list({tuple(getattr(row, name) for name in unique_fields): row for row in rows}.values())
+        try:
+            self.model.objects.bulk_create(rows, batch_size=self.batch_size, **self.bulk_options)
+        except Exception as e:
+            self.counts['failed'] += len(rows)
+            logger.error(f"Error writing {len(rows)} {self.model.__name__} rows: {str(e)}")
+            return
+        self.counts['written'] += len(rows)
+        self.counts['batches'] += 1
+
+    async def _write(self, rows):
+        # Writes run one at a time on the database thread, so this also
+        # waits for a write the background task has in progress
+        await database_sync_to_async(self._bulk_create)(rows)
+
+    async def flush(self) -> None:
+        """Write everything queued so far, without stopping the buffer."""
+        await self._write(self._drain())
+
+    async def close(self) -> None:
+        """Stop the background task and write what is left."""
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._loop = None
+        await self._write(self._drain())
+
+    def close_sync(self) -> None:
+        """close for when no event loop is running, such as at interpreter exit."""
+        self._task = None
+        self._loop = None
+        self._bulk_create(self._drain())
+
+    def stats(self) -> Dict:
+        return {
+            **self.counts,
+            'pending': len(self._pending) + (self._queue.qsize() if self._queue is not None else 0),
+            'high_water': self.high_water,
+            'max_queue': self.max_queue,
+            'batch_size': self.batch_size,
+            'interval_ms': self.interval * 1000,
+        }
+
+
+def write_behind(model, **options) -> WriteBehindBuffer:
+    """A WriteBehindBuffer flushed by close_all."""
+    buffer = WriteBehindBuffer(model, **options)
+    buffers.append(buffer)
+    return buffer
+
+
+suggestion_writes = write_behind(CodeSuggestion)
+# Replaces the expired cache row for the same content, as ResponseCache.set does
+analysis_writes = write_behind(
+    CodeAnalysis, update_conflicts=True, unique_fields=['content_hash'], update_fields=ROW_UPDATE_FIELDS
+)
+
+
+async def close_all() -> None:
+    for buffer in buffers:
+        await buffer.close()
+
+
+@atexit.register
+def _close_at_exit():
+    for buffer in buffers:
+        try:
+            buffer.close_sync()
+        except Exception as e:
+            logger.error(f"Error flushing {buffer.model.__name__} rows at exit: {str(e)}")
+
+
+class LifespanApp:
+    """ASGI lifespan handler that flushes the write-behind buffers on shutdown."""
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
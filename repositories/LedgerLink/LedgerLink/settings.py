@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from django.contrib.messages import constants as messages
 
 
@@ -225,3 +226,9 @@ LOGGING = {
         },
     },
 }
+
+# Test runs log to the console only, so they don't append to the tracked debug.log
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    for logger_config in LOGGING['loggers'].values():
+        logger_config['handlers'] = ['console']
+    del LOGGING['handlers']['file']
@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import UploadJob
+
+
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ['original_name', 'kind', 'status', 'processed_rows', 'total_rows',
+                    'created_count', 'updated_count', 'error_count', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'dry_run']
+    search_fields = ['original_name']
+    readonly_fields = ['total_rows', 'processed_rows', 'created_count', 'updated_count', 'error_count',
+                       'error_report', 'error_message', 'created_at', 'started_at', 'finished_at']
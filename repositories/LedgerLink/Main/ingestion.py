@@ -0,0 +1,67 @@
+# Main/ingestion.py
+
+from collections import defaultdict
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+
+def read_chunks(file, chunk_size=5000):
+    """
+    Yield DataFrames of at most chunk_size rows, all values as strings, from a
+    CSV or Excel file. Only one chunk is held in memory at a time: CSVs are read
+    with read_csv(chunksize=...) and workbooks with openpyxl in read-only mode.
+    """
+    if file.name.endswith('.csv'):
+        yield from pd.read_csv(file, dtype=str, keep_default_na=False, chunksize=chunk_size)
+    elif file.name.endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = ['' if value is None else str(value) for value in header]
+            width = len(columns)
+            batch = []
+            for row in rows:
+                values = ['' if value is None else str(value) for value in row[:width]]
+                batch.append(values + [''] * (width - len(values)))
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=columns, dtype=str)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, dtype=str)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError('Unsupported file type')
+
+
+def clean_text(series):
+    """Strip a column to strings, with blanks as NA."""
+    text = series.astype('string').str.strip()
+    return text.mask(text == '')
+
+
+def to_number(series):
+    """Parse a column to float64, with anything unparseable as NaN."""
+    numbers = pd.to_numeric(series, errors='coerce')
+    return pd.Series(numbers.to_numpy(dtype='float64', na_value=np.nan), index=series.index)
+
+
+class RowErrors:
+    """Collects validation messages by row position."""
+
+    def __init__(self):
+        self.messages = defaultdict(list)
+
+    def add(self, mask, message):
+        if isinstance(mask, pd.Series):
+            mask = mask.fillna(False).to_numpy(dtype=bool)
+        for position in np.flatnonzero(mask):
+            self.messages[int(position)].append(message)
+
+    def __contains__(self, position):
+        return position in self.messages
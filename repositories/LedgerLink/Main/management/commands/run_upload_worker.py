@@ -0,0 +1,35 @@
+# Main/management/commands/run_upload_worker.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from Main.uploads import claim_next_job, process_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Process stored product and order uploads in the background. Run one or more alongside the web server. "
+        "Jobs left running by a worker that stopped are picked up again once their lease expires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no pending jobs are left')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between checks for new jobs')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Processing {job}")
+            job = process_job(job)
+            style = self.style.SUCCESS if job.status == 'completed' else self.style.ERROR
+            self.stdout.write(style(
+                f"{job}: {job.processed_rows} rows, {job.created_count} created, "
+                f"{job.updated_count} updated, {job.error_count} rejected"
+            ))
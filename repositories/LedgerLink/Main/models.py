@@ -1,3 +1,71 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class UploadJobQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Jobs the user created; staff see every job."""
+        if user.is_staff:
+            return self
+        return self.filter(created_by=user)
+
+
+class UploadJob(models.Model):
+    """
+    A product or order file stored for processing by the upload worker
+    (`manage.py run_upload_worker`), with its progress and error report.
+    """
+    KIND_CHOICES = [
+        ('products', 'Products'),
+        ('orders', 'Orders'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(upload_to='uploads/%Y/%m/')
+    original_name = models.CharField(max_length=255)
+    # Null for jobs uploaded anonymously, which only staff can see
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='upload_jobs')
+    dry_run = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    error_report = models.FileField(upload_to='uploads/errors/%Y/%m/', blank=True)
+    error_message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker after every chunk; a running job whose heartbeat is
+    # older than the lease is reclaimed by another worker
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    objects = UploadJobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} upload {self.original_name} ({self.status})"
+
+    @property
+    def progress(self):
+        """Percentage of rows processed, or None while the row count is unknown."""
+        if self.status == 'completed':
+            return 100
+        if not self.total_rows:
+            return None
+        return min(100, round(self.processed_rows * 100 / self.total_rows))
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
@@ -1,3 +1,166 @@
-from django.test import TestCase
+import csv
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer
+from orders.models import Order
+from products.models import Product
+from .models import UploadJob
+from .uploads import LEASE_TIMEOUT, LeaseLost, claim_next_job, process_job, save_progress
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UploadJobTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            company_name='Test Company',
+            legal_business_name='Test Legal Name',
+            email='test@example.com'
+        )
+        self.user = get_user_model().objects.create_user(username='uploader', password='password')
+        self.client.force_login(self.user)
+
+    def product_csv(self):
+        rows = ''.join(f'SKU{i},{self.customer.id},Box,{i}\n' for i in range(12))
+        return ('sku,customer_id,labeling_unit_1,labeling_quantity_1\n' + rows + 'BAD,999,Box,1\n').encode()
+
+    def test_background_upload_returns_immediately(self):
+        response = self.client.post(reverse('products:product_upload'), {
+            'file': SimpleUploadedFile('products.csv', self.product_csv(), content_type='text/csv'),
+            'background': 'on',
+        })
+        job = UploadJob.objects.get()
+        self.assertRedirects(response, reverse('main:upload_job', args=[job.pk]))
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.created_by, self.user)
+        self.assertEqual(Product.objects.count(), 0)
+
+        status = self.client.get(reverse('main:upload_job_status', args=[job.pk])).json()
+        self.assertEqual(status['status'], 'pending')
+        self.assertFalse(status['finished'])
+
+    def test_worker_processes_chunks_and_writes_error_report(self):
+        job = UploadJob.objects.create(
+            kind='products',
+            file=SimpleUploadedFile('products.csv', self.product_csv()),
+            original_name='products.csv',
+            created_by=self.user
+        )
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(claim_next_job())
+
+        with mock.patch('Main.uploads.CHUNK_SIZE', 5):
+            process_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.total_rows, job.processed_rows), (13, 13))
+        self.assertEqual((job.created_count, job.updated_count, job.error_count), (12, 0, 1))
+        self.assertEqual(Product.objects.count(), 12)
+
+        status = self.client.get(reverse('main:upload_job_status', args=[job.pk])).json()
+        self.assertEqual(status['progress'], 100)
+        self.assertTrue(status['finished'])
+
+        response = self.client.get(status['error_report_url'])
+        report = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(report, [['Row', 'SKU', 'Errors'], ['13', 'BAD', 'Customer does not exist']])
+
+    def test_worker_reads_xlsx_orders(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['transaction_id', 'customer_id', 'reference_number', 'weight_lb'])
+        sheet.append([501, self.customer.id, 'R1', 2.5])
+        sheet.append([502, self.customer.id, None, 1])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        job = UploadJob.objects.create(
+            kind='orders',
+            file=SimpleUploadedFile('orders.xlsx', content.getvalue()),
+            original_name='orders.xlsx'
+        )
+        process_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.created_count, job.error_count), (1, 1))
+        self.assertEqual(str(Order.objects.get(transaction_id=501).weight_lb), '2.50')
+
+    def test_jobs_are_visible_to_their_creator_and_staff(self):
+        job = UploadJob.objects.create(
+            kind='products',
+            file=SimpleUploadedFile('products.csv', self.product_csv()),
+            original_name='products.csv',
+            created_by=self.user
+        )
+        urls = [reverse(name, args=[job.pk]) for name in ('main:upload_job', 'main:upload_job_status')]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username='other', password='password'))
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(User.objects.create_user(username='staff', password='password', is_staff=True))
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.logout()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_failed_job_records_error(self):
+        job = UploadJob.objects.create(
+            kind='products',
+            file=SimpleUploadedFile('products.csv', b'name\nfoo\n'),
+            original_name='products.csv',
+            created_by=self.user
+        )
+        process_job(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Missing required columns', job.error_message)
+        self.assertEqual(self.client.get(reverse('main:upload_job_errors', args=[job.pk])).status_code, 404)
+
+    def test_expired_lease_is_reclaimed(self):
+        job = UploadJob.objects.create(
+            kind='products',
+            file=SimpleUploadedFile('products.csv', self.product_csv()),
+            original_name='products.csv'
+        )
+        crashed = claim_next_job()
+        self.assertIsNone(claim_next_job())
+
+        # The worker died without finishing; once its heartbeat is older than the lease the job is claimable
+        UploadJob.objects.filter(id=job.pk).update(
+            processed_rows=5, heartbeat_at=timezone.now() - LEASE_TIMEOUT - timedelta(seconds=1)
+        )
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts, reclaimed.processed_rows), (job.pk, 2, 0))
+        with self.assertRaises(LeaseLost):
+            save_progress(crashed, 'processed_rows')
+
+        process_job(reclaimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.created_count), ('completed', 13, 12))
@@ -0,0 +1,156 @@
+# Main/uploads.py
+
+import csv
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+import openpyxl
+from django.core.files import File
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.ingestion import update_fields_for, upsert_orders, validate_orders
+from products.ingestion import upsert_products, validate_products
+from .ingestion import read_chunks
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+# How long a running job may go without a heartbeat before its worker is presumed dead
+LEASE_TIMEOUT = timedelta(minutes=10)
+
+
+class LeaseLost(Exception):
+    """The job was reclaimed by another worker after its lease expired."""
+
+
+def count_rows(file):
+    """
+    Estimate the number of data rows without loading the file: newlines for
+    CSV (quoted line breaks overcount), the sheet dimensions for Excel.
+    """
+    if file.name.endswith('.csv'):
+        lines = 0
+        last = b''
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+        if last and last != b'\n':
+            lines += 1
+        return max(lines - 1, 0)
+
+    workbook = openpyxl.load_workbook(file, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+    finally:
+        workbook.close()
+    return max(max_row - 1, 0) if max_row else None
+
+
+def claim_next_job():
+    """
+    Mark the oldest pending job as running and return it, or None if there is none.
+    Running jobs whose lease has expired, because their worker crashed or was
+    killed, are claimed again and start over.
+    """
+    now = timezone.now()
+    claimable = Q(status='pending') | Q(status='running', heartbeat_at__lt=now - LEASE_TIMEOUT)
+    for job_id in UploadJob.objects.filter(claimable).order_by('created_at').values_list('id', flat=True)[:10]:
+        # The conditional update makes sure only one worker claims a job
+        claimed = UploadJob.objects.filter(claimable, id=job_id).update(
+            status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+            processed_rows=0, created_count=0, updated_count=0, error_count=0
+        )
+        if claimed:
+            job = UploadJob.objects.get(id=job_id)
+            if job.attempts > 1:
+                logger.warning(f"Reclaimed upload job {job.pk} after its lease expired (attempt {job.attempts})")
+            return job
+    return None
+
+
+def save_progress(job, *fields):
+    """
+    Save fields of a running job and renew its lease. Raises LeaseLost if another
+    worker has claimed the job since, so the two don't both write it.
+    """
+    job.heartbeat_at = timezone.now()
+    values = {name: getattr(job, name) for name in (*fields, 'heartbeat_at')}
+    if not UploadJob.objects.filter(id=job.pk, attempts=job.attempts).update(**values):
+        raise LeaseLost(f"Upload job {job.pk} was claimed by another worker")
+
+
+def process_job(job):
+    """
+    Process an upload job chunk by chunk, saving progress after each chunk.
+    Only one chunk is in memory at a time; rejected rows are written straight to
+    a temporary CSV that becomes the job's error report.
+    """
+    report = tempfile.NamedTemporaryFile('w+', newline='', suffix='.csv', delete=False)
+    writer = csv.writer(report)
+    writer.writerow(['Row', 'SKU' if job.kind == 'products' else 'Transaction ID', 'Errors'])
+
+    try:
+        with job.file.open('rb') as file:
+            job.total_rows = count_rows(file)
+            save_progress(job, 'total_rows')
+            file.seek(0)
+
+            first_row = 1
+            for frame in read_chunks(file, chunk_size=CHUNK_SIZE):
+                if job.kind == 'products':
+                    products, errors = validate_products(frame, first_row=first_row)
+                    results = upsert_products(products, dry_run=job.dry_run)
+                    created = sum(1 for result in results if result['message'] == 'Product created')
+                    updated = len(results) - created
+                    writer.writerows([error['row'], error['sku'], error['message']] for error in errors)
+                else:
+                    orders, errors = validate_orders(frame, first_row=first_row)
+                    created, updated = upsert_orders(orders, update_fields_for(frame.columns), dry_run=job.dry_run)
+                    writer.writerows(
+                        [error['row'], error['transaction_id'] or '', '; '.join(error['errors'])]
+                        for error in errors
+                    )
+
+                first_row += len(frame)
+                job.processed_rows += len(frame)
+                job.created_count += created
+                job.updated_count += updated
+                job.error_count += len(errors)
+                save_progress(job, 'processed_rows', 'created_count', 'updated_count', 'error_count')
+
+        job.status = 'completed'
+    except LeaseLost:
+        # The worker that reclaimed the job owns it now
+        logger.warning(f"Upload job {job.pk} was reclaimed by another worker, stopping")
+        report.close()
+        os.unlink(report.name)
+        return job
+    except Exception as e:
+        logger.exception(f"Upload job {job.pk} failed")
+        job.status = 'failed'
+        job.error_message = str(e)
+
+    try:
+        if job.error_count:
+            report.seek(0)
+            stem = os.path.splitext(os.path.basename(job.original_name))[0]
+            job.error_report.save(f'{stem}_errors.csv', File(report), save=False)
+    finally:
+        report.close()
+        os.unlink(report.name)
+    job.finished_at = timezone.now()
+    try:
+        save_progress(job, 'status', 'error_message', 'error_report', 'finished_at')
+    except LeaseLost:
+        logger.warning(f"Upload job {job.pk} was reclaimed by another worker before it finished")
+        return job
+
+    logger.info(
+        f"Upload job {job.pk} {job.status}: {job.processed_rows} rows, {job.created_count} created, "
+        f"{job.updated_count} updated, {job.error_count} rejected"
+    )
+    return job
@@ -1,10 +1,15 @@
 # Main/urls.py
 from django.urls import path
-from .views import HomeView, DashboardView
+from .views import (
+    HomeView, DashboardView, UploadJobDetailView, UploadJobStatusView, UploadJobErrorReportView
+)
 
 app_name = 'main'
 
 urlpatterns = [
     path('', HomeView.as_view(), name='home'),
     path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('uploads/<int:pk>/', UploadJobDetailView.as_view(), name='upload_job'),
+    path('uploads/<int:pk>/status/', UploadJobStatusView.as_view(), name='upload_job_status'),
+    path('uploads/<int:pk>/errors/', UploadJobErrorReportView.as_view(), name='upload_job_errors'),
 ]
\ No newline at end of file
@@ -1,7 +1,15 @@
 # Main/views.py
-from django.views.generic import TemplateView
+import os
+
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views import View
+from django.views.generic import DetailView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 
+from .models import UploadJob
+
 class HomeView(TemplateView):
     template_name = 'main/home.html'
 
@@ -17,4 +25,47 @@ class DashboardView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Dashboard - LedgerLink'
-        return context
\ No newline at end of file
+        return context
+
+class UploadJobDetailView(LoginRequiredMixin, DetailView):
+    template_name = 'main/upload_job.html'
+    context_object_name = 'job'
+
+    def get_queryset(self):
+        return UploadJob.objects.visible_to(self.request.user)
+
+
+class UploadJobStatusView(LoginRequiredMixin, View):
+    """Progress of an upload job as JSON, for polling."""
+
+    def get(self, request, pk):
+        job = get_object_or_404(UploadJob.objects.visible_to(request.user), pk=pk)
+        return JsonResponse({
+            'id': job.pk,
+            'kind': job.kind,
+            'file': job.original_name,
+            'dry_run': job.dry_run,
+            'status': job.status,
+            'progress': job.progress,
+            'total_rows': job.total_rows,
+            'processed_rows': job.processed_rows,
+            'created': job.created_count,
+            'updated': job.updated_count,
+            'errors': job.error_count,
+            'error_message': job.error_message,
+            'error_report_url': reverse('main:upload_job_errors', args=[job.pk]) if job.error_report else None,
+            'finished': job.is_finished,
+        })
+
+
+class UploadJobErrorReportView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(UploadJob.objects.visible_to(request.user), pk=pk)
+        if not job.error_report:
+            raise Http404('This upload has no error report.')
+        return FileResponse(
+            job.error_report.open('rb'),
+            as_attachment=True,
+            filename=os.path.basename(job.error_report.name),
+            content_type='text/csv'
+        )
@@ -1,22 +1,34 @@
 # billing_calculator.py
 
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, List, Optional, Union
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union
 import json
+import re
+from time import perf_counter_ns
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
 import logging
 
-from orders.models import Order
+from orders.models import Order, canonical_sku_quantity
 from customers.models import Customer
 from services.models import Service
-from rules.models import Rule, RuleGroup
+from rules.models import AdvancedRule, Rule, RuleGroup, RuleStatistics
 from customer_services.models import CustomerService
+from products.models import Product, normalize_sku
 
 logger = logging.getLogger(__name__)
 
+# Order fields that rules compare numerically and as plain strings
+NUMERIC_FIELDS = ['weight_lb', 'line_items', 'total_item_qty', 'volume_cuft', 'packages']
+STRING_FIELDS = ['reference_number', 'ship_to_name', 'ship_to_company',
+                 'ship_to_city', 'ship_to_state', 'ship_to_country',
+                 'carrier', 'notes']
+
 
 @dataclass
 class ServiceCost:
@@ -42,24 +54,6 @@ class BillingReport:
     total_amount: Decimal = Decimal('0')
 
 
-def normalize_sku(sku: str) -> str:
-    """
-    Normalize SKU format for consistent comparison.
-    Examples:
-        'pack boxes' -> 'PACKBOXES'
-        'TestSKU' -> 'TESTSKU'
-        '6pack boxes' -> '6PACKBOXES'
-        '  Pack  Boxes  ' -> 'PACKBOXES'
-    """
-    try:
-        if not sku:
-            return ''
-        # Remove extra spaces and convert to uppercase
-        return ''.join(str(sku).split()).upper()
-    except (AttributeError, TypeError):
-        return ''
-
-
 def convert_sku_format(sku_data) -> Dict:
     """
     Convert SKU data from JSON array format to dictionary format
@@ -68,7 +62,12 @@ def convert_sku_format(sku_data) -> Dict:
     """
     try:
         if isinstance(sku_data, str):
-            sku_data = json.loads(sku_data)
+            # Legacy rows hold the list as a JSON string
+            try:
+                sku_data = canonical_sku_quantity(sku_data) or []
+            except ValueError as e:
+                logger.error(f"Invalid SKU data: {str(e)}")
+                return {}
 
         if not isinstance(sku_data, list):
             logger.error(f"SKU data must be a list, got {type(sku_data)}")
@@ -105,7 +104,7 @@ def convert_sku_format(sku_data) -> Dict:
             sku_dict[sku] = sku_dict.get(sku, 0) + quantity
 
         return sku_dict
-    except (json.JSONDecodeError, TypeError, KeyError) as e:
+    except (TypeError, KeyError) as e:
         logger.error(f"Error converting SKU format: {str(e)}")
         return {}
 
@@ -113,9 +112,6 @@ def convert_sku_format(sku_data) -> Dict:
 def validate_sku_quantity(sku_data) -> bool:
     """Validate SKU quantity data format and content."""
     try:
-        if isinstance(sku_data, str):
-            sku_data = json.loads(sku_data)
-
         if not isinstance(sku_data, list):
             return False
 
@@ -142,6 +138,95 @@ def validate_sku_quantity(sku_data) -> bool:
         return False
 
 
+class SkuIndex:
+    """
+    Normalized SKU lookup structure for a single order's sku_quantity.
+
+    SKU rule operators have the following semantics (all comparisons are made
+    on normalized SKUs, see normalize_sku):
+        contains / ncontains:     an order SKU is exactly equal to one of the rule values
+        in / ni:                  one of the rule values appears inside an order SKU
+                                  (substring match; an exact match also counts)
+        startswith / endswith:    an order SKU starts / ends with one of the rule values
+
+    Exact matches are a set intersection. Prefix matches bisect a sorted list of
+    the SKUs, suffix matches bisect the sorted reversed SKUs and substring
+    matches bisect the sorted list of every SKU suffix.
+    """
+
+    __slots__ = ('skus', '_sorted', '_reversed', '_suffixes')
+
+    def __init__(self, skus: Iterable[str]):
+        self.skus = frozenset(skus)
+        self._sorted = sorted(self.skus)
+        self._reversed = None
+        self._suffixes = None
+
+    @classmethod
+    def from_sku_quantity(cls, sku_quantity) -> 'SkuIndex':
+        """Build the index from raw order sku_quantity data."""
+        return cls(convert_sku_format(sku_quantity).keys())
+
+    def __bool__(self) -> bool:
+        return bool(self.skus)
+
+    @staticmethod
+    def _has_prefix(sorted_values: List[str], prefix: str) -> bool:
+        position = bisect_left(sorted_values, prefix)
+        return position < len(sorted_values) and sorted_values[position].startswith(prefix)
+
+    def has_any(self, values: FrozenSet[str]) -> bool:
+        """Return True if any of the normalized values is an order SKU."""
+        return not self.skus.isdisjoint(values)
+
+    def has_prefix(self, values: FrozenSet[str]) -> bool:
+        """Return True if any order SKU starts with one of the normalized values."""
+        return any(self._has_prefix(self._sorted, v) for v in values)
+
+    def has_suffix(self, values: FrozenSet[str]) -> bool:
+        """Return True if any order SKU ends with one of the normalized values."""
+        if self._reversed is None:
+            self._reversed = sorted(sku[::-1] for sku in self.skus)
+        return any(self._has_prefix(self._reversed, v[::-1]) for v in values)
+
+    def has_substring(self, values: FrozenSet[str]) -> bool:
+        """Return True if one of the normalized values appears inside an order SKU."""
+        if self.has_any(values):
+            return True
+        if self._suffixes is None:
+            self._suffixes = sorted({sku[i:] for sku in self.skus for i in range(len(sku))})
+        return any(self._has_prefix(self._suffixes, v) for v in values)
+
+
+def get_order_sku_index(order: Order) -> SkuIndex:
+    """
+    Return the SkuIndex for an order, building it only once per order instance.
+    The index is rebuilt if sku_quantity is reassigned on the instance.
+    """
+    sku_quantity = getattr(order, 'sku_quantity', None)
+    cached = getattr(order, '_sku_index', None)
+    if cached is not None and cached[0] is sku_quantity:
+        return cached[1]
+
+    index = SkuIndex.from_sku_quantity(sku_quantity) if sku_quantity else SkuIndex(())
+    order._sku_index = (sku_quantity, index)
+    return index
+
+
+def get_rule_sku_values(rule: Rule) -> FrozenSet[str]:
+    """
+    Return the rule's values as a frozenset of normalized SKUs, computed once per
+    rule instance and recomputed if the rule value changes.
+    """
+    cached = getattr(rule, '_sku_values', None)
+    if cached is not None and cached[0] == rule.value:
+        return cached[1]
+
+    values = frozenset(filter(None, (normalize_sku(v) for v in rule.get_values_as_list())))
+    rule._sku_values = (rule.value, values)
+    return values
+
+
 class RuleEvaluator:
     @staticmethod
     def evaluate_rule(rule: Rule, order: Order) -> bool:
@@ -154,8 +239,7 @@ class RuleEvaluator:
             values = rule.get_values_as_list()
 
             # Handle numeric fields
-            numeric_fields = ['weight_lb', 'line_items', 'total_item_qty', 'volume_cuft', 'packages']
-            if rule.field in numeric_fields:
+            if rule.field in NUMERIC_FIELDS:
                 try:
                     field_value = float(field_value) if field_value is not None else 0
                     value = float(values[0]) if values else 0
@@ -177,10 +261,7 @@ class RuleEvaluator:
                     return False
 
             # Handle string fields
-            string_fields = ['reference_number', 'ship_to_name', 'ship_to_company',
-                             'ship_to_city', 'ship_to_state', 'ship_to_country',
-                             'carrier', 'notes']
-            if rule.field in string_fields:
+            if rule.field in STRING_FIELDS:
                 field_value = str(field_value) if field_value is not None else ''
 
                 if rule.operator == 'eq':
@@ -202,32 +283,24 @@ class RuleEvaluator:
 
             # Handle SKU quantity
             if rule.field == 'sku_quantity':
-                if field_value is None:
+                sku_index = get_order_sku_index(order)
+                if not sku_index:
                     return False
 
-                try:
-                    if isinstance(field_value, str):
-                        field_value = json.loads(field_value)
-
-                    if not validate_sku_quantity(field_value):
-                        return False
+                values = get_rule_sku_values(rule)
 
-                    # Extract SKUs for comparison
-                    sku_dict = convert_sku_format(field_value)
-                    # Normalize SKUs for comparison
-                    skus = [normalize_sku(sku) for sku in sku_dict.keys()]
-
-                    if rule.operator == 'contains':
-                        return any(normalize_sku(v) in skus for v in values)
-                    elif rule.operator == 'ncontains':
-                        return not any(normalize_sku(v) in skus for v in values)
-                    elif rule.operator == 'in':
-                        return any(normalize_sku(v) in str(sku_dict) for v in values)
-                    elif rule.operator == 'ni':
-                        return not any(normalize_sku(v) in str(sku_dict) for v in values)
-                except (json.JSONDecodeError, AttributeError):
-                    logger.error(f"Error processing SKU quantity")
-                    return False
+                if rule.operator == 'contains':
+                    return sku_index.has_any(values)
+                elif rule.operator == 'ncontains':
+                    return not sku_index.has_any(values)
+                elif rule.operator == 'in':
+                    return sku_index.has_substring(values)
+                elif rule.operator == 'ni':
+                    return not sku_index.has_substring(values)
+                elif rule.operator == 'startswith':
+                    return sku_index.has_prefix(values)
+                elif rule.operator == 'endswith':
+                    return sku_index.has_suffix(values)
 
             logger.warning(f"Unhandled field {rule.field} or operator {rule.operator}")
             return False
@@ -237,35 +310,554 @@ class RuleEvaluator:
             return False
 
     @staticmethod
-    def evaluate_rule_group(rule_group: RuleGroup, order: Order) -> bool:
+    def evaluate_rule_group(rule_group: RuleGroup, order: Order,
+                            stats: Optional['RuleStatsCollector'] = None) -> bool:
         try:
             rules = rule_group.rules.all()
             if not rules:
                 logger.warning(f"No rules found in rule group {rule_group.id}")
                 return False
 
-            results = [RuleEvaluator.evaluate_rule(rule, order) for rule in rules]
-
-            if rule_group.logic_operator == 'AND':
-                return all(results)
-            elif rule_group.logic_operator == 'OR':
-                return any(results)
-            elif rule_group.logic_operator == 'NOT':
-                return not any(results)
-            elif rule_group.logic_operator == 'XOR':
-                return sum(results) == 1
-            elif rule_group.logic_operator == 'NAND':
-                return not all(results)
-            elif rule_group.logic_operator == 'NOR':
-                return not any(results)
-
-            logger.warning(f"Unknown logic operator {rule_group.logic_operator}")
-            return False
+            rules = RuleEvaluator.order_rules(rule_group, rules)
+            if stats is None:
+                results = (RuleEvaluator.evaluate_rule(rule, order) for rule in rules)
+            else:
+                results = (stats.evaluate(rule, RuleEvaluator.evaluate_rule, order) for rule in rules)
+            return RuleEvaluator.combine_results(rule_group, results)
 
         except Exception as e:
             logger.error(f"Error evaluating rule group: {str(e)}")
             return False
 
+    @staticmethod
+    def combine_results(rule_group: RuleGroup, results: Iterable[bool]) -> bool:
+        """
+        Combine per-rule results using the rule group's logic operator.
+        Results are consumed lazily and evaluation stops as soon as the outcome is decided.
+        """
+        if rule_group.logic_operator == 'AND':
+            return all(results)
+        elif rule_group.logic_operator == 'OR':
+            return any(results)
+        elif rule_group.logic_operator == 'NOT':
+            return not any(results)
+        elif rule_group.logic_operator == 'XOR':
+            matched = False
+            for result in results:
+                if result:
+                    if matched:
+                        return False
+                    matched = True
+            return matched
+        elif rule_group.logic_operator == 'NAND':
+            return not all(results)
+        elif rule_group.logic_operator == 'NOR':
+            return not any(results)
+
+        logger.warning(f"Unknown logic operator {rule_group.logic_operator}")
+        return False
+
+    # Logic operators decided by the first rule returning this result
+    DECISIVE_RESULTS = {'AND': False, 'NAND': False, 'OR': True, 'NOT': True, 'NOR': True}
+
+    # Estimated evaluation cost in nanoseconds for rules without statistics
+    DEFAULT_RULE_COST_NS = 1_000
+    SKU_RULE_COST_NS = 20_000
+
+    @staticmethod
+    def order_rules(rule_group: RuleGroup, rules: Iterable[Rule]) -> List[Rule]:
+        """
+        Order rules so that cheap rules likely to decide the group's outcome are
+        evaluated first. Each rule is scored by its expected cost per decisive
+        result, using RuleStatistics collected in earlier billing runs (only if
+        they were loaded with the rules) or a per-field estimate otherwise.
+        XOR groups and unknown operators keep their original order.
+        """
+        rules = list(rules)
+        decisive = RuleEvaluator.DECISIVE_RESULTS.get(rule_group.logic_operator)
+        if decisive is None or len(rules) < 2:
+            return rules
+
+        def score(rule):
+            statistics = get_loaded_rule_statistics(rule)
+            if statistics is not None and statistics.evaluation_count:
+                cost = statistics.average_time_ns
+                pass_rate = statistics.pass_rate
+            else:
+                cost = (RuleEvaluator.SKU_RULE_COST_NS if rule.field == 'sku_quantity'
+                        else RuleEvaluator.DEFAULT_RULE_COST_NS)
+                pass_rate = 0.5
+            probability = pass_rate if decisive else 1 - pass_rate
+            return cost / max(probability, 0.01)
+
+        return sorted(rules, key=score)
+
+
+def get_loaded_rule_statistics(rule: Rule) -> Optional[RuleStatistics]:
+    """Return the rule's statistics if they were loaded with the rule, without querying."""
+    if not Rule.statistics.is_cached(rule):
+        return None
+    try:
+        return rule.statistics
+    except RuleStatistics.DoesNotExist:
+        return None
+
+
+def rules_with_statistics() -> Prefetch:
+    """Prefetch for a rule group's rules together with their statistics."""
+    return Prefetch('rules', queryset=Rule.objects.select_related('statistics'))
+
+
+class RuleStatsCollector:
+    """
+    Collects per-rule evaluation counts, pass counts and evaluation time during a
+    billing run and adds them to the stored RuleStatistics with save().
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def evaluate(self, rule: Rule, evaluate, *args) -> bool:
+        """Call evaluate(rule, *args), recording its result and duration for the rule."""
+        started = perf_counter_ns()
+        result = evaluate(rule, *args)
+        elapsed = perf_counter_ns() - started
+
+        counts = self.counts.get(rule.id)
+        if counts is None:
+            counts = self.counts[rule.id] = [0, 0, 0]
+        counts[0] += 1
+        counts[1] += bool(result)
+        counts[2] += elapsed
+        return result
+
+    def save(self) -> None:
+        """Add the collected counts to the stored statistics."""
+        counts = {rule_id: c for rule_id, c in self.counts.items() if rule_id is not None}
+        if not counts:
+            return
+
+        with transaction.atomic():
+            RuleStatistics.objects.bulk_create(
+                [RuleStatistics(rule_id=rule_id) for rule_id in counts],
+                ignore_conflicts=True
+            )
+            for rule_id, (evaluations, passes, elapsed) in counts.items():
+                RuleStatistics.objects.filter(rule_id=rule_id).update(
+                    evaluation_count=F('evaluation_count') + evaluations,
+                    pass_count=F('pass_count') + passes,
+                    total_time_ns=F('total_time_ns') + elapsed,
+                    updated_at=timezone.now()
+                )
+        self.counts = {}
+
+
+def _never(resolution) -> bool:
+    return False
+
+
+class _StringFieldTable:
+    """eq/ne/in/ni rules on one string field, resolved with one dict lookup per operator."""
+
+    OPERATORS = ('eq', 'ne', 'in', 'ni')
+
+    def __init__(self):
+        self.lookup = {op: {} for op in self.OPERATORS}
+
+    def add(self, rule: Rule):
+        values = rule.get_values_as_list()
+        if rule.operator in ('eq', 'ne'):
+            if not values:
+                return _never
+            values = values[:1]
+
+        lookup = self.lookup[rule.operator]
+        for value in values:
+            lookup.setdefault(value, set()).add(rule.id)
+
+        if rule.operator in ('eq', 'in'):
+            return lambda resolution, op=rule.operator, rule_id=rule.id: rule_id in resolution[op]
+        return lambda resolution, op=rule.operator, rule_id=rule.id: rule_id not in resolution[op]
+
+    def finalize(self):
+        pass
+
+    def resolve(self, field_value) -> Dict[str, set]:
+        field_value = str(field_value)
+        return {op: lookup.get(field_value, ()) for op, lookup in self.lookup.items()}
+
+
+class _NumericFieldTable:
+    """
+    Numeric rules on one field. gt/ge/lt/le thresholds are kept sorted so a single
+    bisect per operator yields a cut position: a rule's result is then a comparison
+    of its position in the sorted thresholds against that cut.
+    """
+
+    THRESHOLD_OPERATORS = ('gt', 'ge', 'lt', 'le')
+
+    def __init__(self):
+        self.thresholds = {op: [] for op in self.THRESHOLD_OPERATORS}
+        self.equals = {}
+        self.not_equals = {}
+
+    def add(self, rule: Rule):
+        values = rule.get_values_as_list()
+        try:
+            value = float(values[0]) if values else 0
+        except (ValueError, TypeError):
+            return _never
+        if value != value:  # NaN never compares true and can't be bisected
+            return _never
+
+        if rule.operator == 'eq':
+            self.equals.setdefault(value, set()).add(rule.id)
+            return lambda resolution, rule_id=rule.id: rule_id in resolution['eq']
+        if rule.operator == 'ne':
+            self.not_equals.setdefault(value, set()).add(rule.id)
+            return lambda resolution, rule_id=rule.id: rule_id not in resolution['ne']
+
+        # The position is only known once all thresholds are sorted in finalize()
+        slot = [value, 0]
+        self.thresholds[rule.operator].append(slot)
+        if rule.operator in ('gt', 'ge'):
+            return lambda resolution, op=rule.operator, slot=slot: slot[1] < resolution[op]
+        return lambda resolution, op=rule.operator, slot=slot: slot[1] >= resolution[op]
+
+    def finalize(self):
+        self.sorted_thresholds = {}
+        for op, slots in self.thresholds.items():
+            slots.sort(key=lambda slot: slot[0])
+            for position, slot in enumerate(slots):
+                slot[1] = position
+            self.sorted_thresholds[op] = [slot[0] for slot in slots]
+
+    def resolve(self, field_value) -> Optional[Dict]:
+        try:
+            value = float(field_value)
+        except (ValueError, TypeError):
+            return None
+
+        thresholds = self.sorted_thresholds
+        return {
+            # threshold < value
+            'gt': bisect_left(thresholds['gt'], value),
+            # threshold <= value
+            'ge': bisect_right(thresholds['ge'], value),
+            # threshold > value
+            'lt': bisect_right(thresholds['lt'], value),
+            # threshold >= value
+            'le': bisect_left(thresholds['le'], value),
+            'eq': self.equals.get(value, ()),
+            'ne': self.not_equals.get(value, ()),
+        }
+
+
+class RuleDecisionTable:
+    """
+    Shared-subexpression evaluation of all rules of a customer.
+
+    When the table is built, rules are grouped by the order field they test.
+    For each order every field is then resolved at most once:
+        string eq/ne/in/ni:     one dict lookup per operator on the field value
+        numeric eq/ne:          one dict lookup on the numeric value
+        numeric gt/ge/lt/le:    one bisect per operator over the sorted thresholds
+    after which each rule's result is a constant-time check. Rules that can't
+    be tabled (sku_quantity, string contains/startswith/...) fall back to
+    RuleEvaluator.evaluate_rule. Results are identical to evaluating each rule
+    group with RuleEvaluator.evaluate_rule_group.
+
+    Rules within each group are ordered once with RuleEvaluator.order_rules and
+    evaluated with short-circuiting. If a RuleStatsCollector is given, every
+    rule evaluation is recorded in it.
+    """
+
+    def __init__(self, rule_groups: Iterable[RuleGroup], stats: Optional[RuleStatsCollector] = None):
+        self.rule_groups = list(rule_groups)
+        self.stats = stats
+        self.group_rules = {}
+        self.checks = {}
+        self.fields = {}
+
+        for rule_group in self.rule_groups:
+            rules = RuleEvaluator.order_rules(rule_group, rule_group.rules.all())
+            self.group_rules[rule_group.id] = rules
+            for rule in rules:
+                self._compile(rule)
+
+        for table in self.fields.values():
+            table.finalize()
+
+    @classmethod
+    def for_customer(cls, customer_id: int, stats: Optional[RuleStatsCollector] = None) -> 'RuleDecisionTable':
+        """Build the table from every rule group of the customer's services."""
+        return cls(
+            RuleGroup.objects.filter(
+                customer_service__customer_id=customer_id
+            ).prefetch_related(rules_with_statistics()),
+            stats=stats
+        )
+
+    def _compile(self, rule: Rule):
+        if rule.field in STRING_FIELDS and rule.operator in _StringFieldTable.OPERATORS:
+            table_class = _StringFieldTable
+        elif rule.field in NUMERIC_FIELDS and rule.operator in ('eq', 'ne') + _NumericFieldTable.THRESHOLD_OPERATORS:
+            table_class = _NumericFieldTable
+        else:
+            return
+
+        table = self.fields.get(rule.field)
+        if table is None:
+            table = self.fields[rule.field] = table_class()
+        self.checks[rule.id] = (rule.field, table.add(rule))
+
+    def evaluate(self, order: Order) -> 'OrderDecisions':
+        """Return the rule and rule group decisions for one order."""
+        return OrderDecisions(self, order)
+
+
+class OrderDecisions:
+    """Per-order view of a RuleDecisionTable. Fields are resolved lazily and only once."""
+
+    def __init__(self, table: RuleDecisionTable, order: Order):
+        self.table = table
+        self.order = order
+        self.resolved = {}
+
+    def _resolve(self, field_name: str):
+        if field_name not in self.resolved:
+            field_value = getattr(self.order, field_name, None)
+            self.resolved[field_name] = (
+                None if field_value is None else self.table.fields[field_name].resolve(field_value)
+            )
+        return self.resolved[field_name]
+
+    def rule_result(self, rule: Rule) -> bool:
+        if self.table.stats is not None:
+            return self.table.stats.evaluate(rule, self._rule_result)
+        return self._rule_result(rule)
+
+    def _rule_result(self, rule: Rule) -> bool:
+        compiled = self.table.checks.get(rule.id)
+        if compiled is None:
+            return RuleEvaluator.evaluate_rule(rule, self.order)
+
+        field_name, check = compiled
+        resolution = self._resolve(field_name)
+        if resolution is None:
+            return False
+        return check(resolution)
+
+    def group_result(self, rule_group: RuleGroup) -> bool:
+        rules = self.table.group_rules.get(rule_group.id)
+        if rules is None:
+            return RuleEvaluator.evaluate_rule_group(rule_group, self.order, self.table.stats)
+        if not rules:
+            logger.warning(f"No rules found in rule group {rule_group.id}")
+            return False
+
+        results = (self.rule_result(rule) for rule in rules)
+        return RuleEvaluator.combine_results(rule_group, results)
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value))
+
+
+def _parse_range(expected) -> tuple:
+    """Parse an in_range/not_in_range value: [min, max], "min,max" or "min-max"."""
+    if isinstance(expected, (list, tuple)):
+        low, high = expected
+    else:
+        text = str(expected).strip()
+        if ',' in text:
+            low, high = text.split(',', 1)
+        else:
+            # Skip a leading minus sign so negative minimums parse
+            separator = text.index('-', 1)
+            low, high = text[:separator], text[separator + 1:]
+    return float(low), float(high)
+
+
+def compile_condition(field_name: str, operator: str, expected):
+    """
+    Compile one AdvancedRule condition into a predicate taking the order.
+
+    Numeric fields are compared as floats and string fields as strings. Values for
+    in/ni are split on semicolons like Rule values, in_range values are parsed once
+    and regexes are compiled once. Conditions on sku_quantity use SkuIndex semantics.
+    """
+    if field_name == 'sku_quantity':
+        values = frozenset(filter(None, (normalize_sku(v) for v in str(expected).split(';'))))
+        sku_operators = {
+            'contains': lambda index: index.has_any(values),
+            'ncontains': lambda index: not index.has_any(values),
+            'in': lambda index: index.has_substring(values),
+            'ni': lambda index: not index.has_substring(values),
+            'startswith': lambda index: index.has_prefix(values),
+            'starts_with': lambda index: index.has_prefix(values),
+            'endswith': lambda index: index.has_suffix(values),
+            'ends_with': lambda index: index.has_suffix(values),
+            'is_empty': lambda index: not index,
+            'is_not_empty': lambda index: bool(index),
+        }
+        if operator not in sku_operators:
+            raise ValueError(f"Unsupported operator {operator} for sku_quantity")
+        check = sku_operators[operator]
+        return lambda order: check(get_order_sku_index(order))
+
+    if operator in ('is_null', 'is_not_null', 'is_empty', 'is_not_empty'):
+        checks = {
+            'is_null': lambda actual: actual is None,
+            'is_not_null': lambda actual: actual is not None,
+            'is_empty': lambda actual: not actual,
+            'is_not_empty': lambda actual: bool(actual),
+        }
+        check = checks[operator]
+        return lambda order: check(getattr(order, field_name, None))
+
+    numeric = field_name in NUMERIC_FIELDS
+    convert = float if numeric else str
+
+    if operator in ('in', 'ni'):
+        values = frozenset(convert(v.strip()) for v in str(expected).split(';') if v.strip())
+        check = (lambda actual: actual in values) if operator == 'in' else (lambda actual: actual not in values)
+    elif operator in ('in_range', 'not_in_range'):
+        low, high = _parse_range(expected)
+        if operator == 'in_range':
+            check = lambda actual: low <= float(actual) <= high
+        else:
+            check = lambda actual: not low <= float(actual) <= high
+    elif operator == 'regex':
+        pattern = re.compile(str(expected))
+        check = lambda actual: pattern.search(str(actual)) is not None
+    else:
+        expected = convert(expected)
+        checks = {
+            'eq': lambda actual: actual == expected,
+            'ne': lambda actual: actual != expected,
+            'gt': lambda actual: actual > expected,
+            'lt': lambda actual: actual < expected,
+            'ge': lambda actual: actual >= expected,
+            'le': lambda actual: actual <= expected,
+            'contains': lambda actual: expected in actual,
+            'ncontains': lambda actual: expected not in actual,
+            'startswith': lambda actual: actual.startswith(expected),
+            'starts_with': lambda actual: actual.startswith(expected),
+            'endswith': lambda actual: actual.endswith(expected),
+            'ends_with': lambda actual: actual.endswith(expected),
+        }
+        if operator not in checks:
+            raise ValueError(f"Unsupported operator {operator}")
+        check = checks[operator]
+        if numeric or operator not in ('eq', 'ne'):
+            inner = check
+            check = lambda actual: inner(convert(actual))
+
+    def predicate(order):
+        actual = getattr(order, field_name, None)
+        if actual is None:
+            return False
+        try:
+            return check(actual)
+        except (ValueError, TypeError):
+            return False
+
+    return predicate
+
+
+def compile_calculation(calc: dict):
+    """
+    Compile one AdvancedRule calculation step into a function (order, amount) -> amount.
+    All arithmetic is done in Decimal.
+    """
+    calc_type = calc['type']
+
+    if calc_type == 'tiered_percentage':
+        # AdvancedRule.clean() validates the tiers
+        tiers = [
+            (_to_decimal(t['min']), _to_decimal(t['max']), _to_decimal(t['percentage']) / 100)
+            for t in calc['tiers']
+        ]
+
+        def tiered_percentage(order, amount):
+            # The first tier in list order whose inclusive range holds the amount
+            for minimum, maximum, percentage in tiers:
+                if minimum <= amount <= maximum:
+                    return amount + amount * percentage
+            return amount
+
+        return tiered_percentage
+
+    if calc_type == 'product_specific':
+        rates = {normalize_sku(sku): _to_decimal(rate) for sku, rate in (calc.get('rates') or {}).items()}
+
+        def product_specific(order, amount):
+            for sku, quantity in convert_sku_format(order.sku_quantity or []).items():
+                rate = rates.get(sku)
+                if rate is not None:
+                    amount += _to_decimal(quantity) * rate
+            return amount
+
+        return product_specific
+
+    value = _to_decimal(calc['value'])
+    if calc_type == 'flat_fee':
+        return lambda order, amount: amount + value
+    elif calc_type == 'percentage':
+        percentage = value / 100
+        return lambda order, amount: amount + amount * percentage
+    elif calc_type == 'per_unit':
+        return lambda order, amount: amount + _to_decimal(order.total_item_qty or 0) * value
+    elif calc_type == 'weight_based':
+        return lambda order, amount: amount + _to_decimal(order.weight_lb) * value if order.weight_lb else amount
+    elif calc_type == 'volume_based':
+        return lambda order, amount: amount + _to_decimal(order.volume_cuft) * value if order.volume_cuft else amount
+
+    raise ValueError(f"Invalid calculation type: {calc_type}")
+
+
+class CompiledAdvancedRule:
+    """
+    An AdvancedRule compiled once into a condition predicate and a calculation
+    pipeline. The rule matches an order when its base rule and every condition
+    match; its calculations are then applied in order to the service amount.
+    """
+
+    def __init__(self, rule: AdvancedRule):
+        self.rule = rule
+        self.conditions = [
+            compile_condition(field_name, operator, expected)
+            for field_name, criteria in (rule.conditions or {}).items()
+            for operator, expected in criteria.items()
+        ]
+        self.calculations = [compile_calculation(calc) for calc in rule.calculations or []]
+
+    def matches(self, order: Order) -> bool:
+        if not RuleEvaluator.evaluate_rule(self.rule, order):
+            return False
+        return all(condition(order) for condition in self.conditions)
+
+    def apply(self, order: Order, amount: Decimal) -> Decimal:
+        try:
+            for calculation in self.calculations:
+                amount = calculation(order, amount)
+            return amount
+        except Exception as e:
+            logger.error(f"Error applying calculations of advanced rule {self.rule.id}: {str(e)}")
+            return amount
+
+
+def compile_advanced_rules(advanced_rules: Iterable[AdvancedRule]) -> Dict[int, List[CompiledAdvancedRule]]:
+    """Compile advanced rules, grouped by rule group id. Rules that fail to compile are skipped."""
+    compiled = {}
+    for rule in advanced_rules:
+        try:
+            compiled.setdefault(rule.rule_group_id, []).append(CompiledAdvancedRule(rule))
+        except Exception as e:
+            logger.error(f"Error compiling advanced rule {rule.id}: {str(e)}")
+    return compiled
+
 
 class BillingCalculator:
     def __init__(self, customer_id: int, start_date: datetime, end_date: datetime):
@@ -273,6 +865,16 @@ class BillingCalculator:
         self.start_date = start_date
         self.end_date = end_date
         self.report = BillingReport(customer_id, start_date, end_date)
+        self.advanced_rules = {}
+        # Assigned SKUs by customer service id, read once per run
+        self.sku_sets = {}
+
+    def get_sku_set(self, customer_service: CustomerService) -> FrozenSet[str]:
+        """Normalized SKUs assigned to a customer service, as of the first time this run asked."""
+        sku_set = self.sku_sets.get(customer_service.pk)
+        if sku_set is None:
+            sku_set = self.sku_sets[customer_service.pk] = customer_service.get_sku_set()
+        return sku_set
 
     def validate_input(self) -> None:
         """Validate input parameters"""
@@ -305,7 +907,7 @@ class BillingCalculator:
             # Handle SKU-specific quantity-based services
             if customer_service.service.charge_type == 'quantity':
                 # Get assigned SKUs and normalize them
-                assigned_skus = {normalize_sku(sku) for sku in customer_service.get_sku_list()}
+                assigned_skus = self.get_sku_set(customer_service)
 
                 # If service has assigned SKUs, only calculate for those specific SKUs
                 if assigned_skus:
@@ -348,7 +950,7 @@ class BillingCalculator:
                             f"(Service ID: {customer_service.service.id}):\n"
                             f"- Customer Service ID: {customer_service.id}\n"
                             f"- Base Price: ${base_price}\n"
-                            f"- Assigned SKUs (normalized): {sorted(assigned_skus)}\n"
+                            f"- Assigned SKUs (normalized): {len(assigned_skus)}\n"
                             f"- Order SKUs (original): {sorted(sku_dict.keys())}\n"
                             f"- Matching Details:\n  " + "\n  ".join(matching_details) + "\n"
                                                                                          f"- Matched SKUs: {matched_skus}\n"
@@ -374,15 +976,13 @@ class BillingCalculator:
                 # Handle Pick Cost and Case Pick services
                 elif service_name in ['pick cost', 'case pick']:
                     try:
-                        from products.models import Product
-
                         # Get all SKUs assigned to quantity-based services
                         excluded_skus = set()
                         for cs in CustomerService.objects.filter(
                                 customer_id=order.customer_id,
                                 service__charge_type='quantity'
                         ).exclude(skus=None):
-                            excluded_skus.update(normalize_sku(sku) for sku in cs.get_sku_list())
+                            excluded_skus.update(self.get_sku_set(cs))
 
                         sku_quantity = getattr(order, 'sku_quantity', None)
                         if sku_quantity is None:
@@ -408,61 +1008,59 @@ class BillingCalculator:
                         total_cost = Decimal('0')
                         calculation_details = []
 
+                        # One query for every SKU in the order, matched on the normalized SKU
+                        products = Product.objects.resolve_skus(order.customer_id, filtered_sku_dict)
+
                         for sku, quantity in filtered_sku_dict.items():
-                            try:
-                                product = Product.objects.get(
-                                    sku=sku,
-                                    customer_id=order.customer_id
-                                )
+                            product = products.get(normalize_sku(sku))
+                            if product is None:
+                                logger.warning(f"Product not found for SKU {sku}")
+                                continue
 
-                                case_size = None
-                                if (product.labeling_unit_1 and
-                                        product.labeling_unit_1.lower() == 'case' and
-                                        product.labeling_quantity_1):
-                                    case_size = product.labeling_quantity_1
-
-                                if service_name == 'case pick':
-                                    if case_size:
-                                        cases = quantity // case_size
-                                        if cases > 0:
-                                            case_cost = base_price * Decimal(str(cases))
-                                            total_cost += case_cost
-                                            calculation_details.append(
-                                                f"SKU {sku}:\n"
-                                                f"  - Quantity: {quantity}\n"
-                                                f"  - Case size: {case_size}\n"
-                                                f"  - Full cases: {cases}\n"
-                                                f"  - Cost: ${case_cost}"
-                                            )
-                                else:  # pick cost
-                                    if case_size:
-                                        remaining_units = quantity % case_size
-                                        if remaining_units > 0:
-                                            unit_cost = base_price * Decimal(str(remaining_units))
-                                            total_cost += unit_cost
-                                            calculation_details.append(
-                                                f"SKU {sku}:\n"
-                                                f"  - Quantity: {quantity}\n"
-                                                f"  - Remaining units: {remaining_units}\n"
-                                                f"  - Cost: ${unit_cost}"
-                                            )
-                                    else:
-                                        unit_cost = base_price * Decimal(str(quantity))
+                            case_size = None
+                            if (product.labeling_unit_1 and
+                                    product.labeling_unit_1.lower() == 'case' and
+                                    product.labeling_quantity_1):
+                                case_size = product.labeling_quantity_1
+
+                            if service_name == 'case pick':
+                                if case_size:
+                                    cases = quantity // case_size
+                                    if cases > 0:
+                                        case_cost = base_price * Decimal(str(cases))
+                                        total_cost += case_cost
+                                        calculation_details.append(
+                                            f"SKU {sku}:\n"
+                                            f"  - Quantity: {quantity}\n"
+                                            f"  - Case size: {case_size}\n"
+                                            f"  - Full cases: {cases}\n"
+                                            f"  - Cost: ${case_cost}"
+                                        )
+                            else:  # pick cost
+                                if case_size:
+                                    remaining_units = quantity % case_size
+                                    if remaining_units > 0:
+                                        unit_cost = base_price * Decimal(str(remaining_units))
                                         total_cost += unit_cost
                                         calculation_details.append(
                                             f"SKU {sku}:\n"
                                             f"  - Quantity: {quantity}\n"
+                                            f"  - Remaining units: {remaining_units}\n"
                                             f"  - Cost: ${unit_cost}"
                                         )
-
-                            except Product.DoesNotExist:
-                                logger.warning(f"Product not found for SKU {sku}")
-                                continue
+                                else:
+                                    unit_cost = base_price * Decimal(str(quantity))
+                                    total_cost += unit_cost
+                                    calculation_details.append(
+                                        f"SKU {sku}:\n"
+                                        f"  - Quantity: {quantity}\n"
+                                        f"  - Cost: ${unit_cost}"
+                                    )
 
                         logger.info(
                             f"{service_name} calculation details:\n"
                             f"- Original SKUs: {sku_dict}\n"
-                            f"- Excluded SKUs: {excluded_skus}\n"
+                            f"- Excluded SKUs: {len(excluded_skus)}\n"
                             f"- Filtered SKUs: {filtered_sku_dict}\n"
                             f"- Calculations:\n{chr(10).join(calculation_details)}\n"
                             f"- Total cost: ${total_cost}"
@@ -510,6 +1108,13 @@ class BillingCalculator:
             logger.error(f"Error calculating service cost: {str(e)}")
             return Decimal('0')
 
+    def apply_advanced_rules(self, rule_group: RuleGroup, order: Order, amount: Decimal) -> Decimal:
+        """Apply the calculations of the group's matching advanced rules to a service amount"""
+        for compiled_rule in self.advanced_rules.get(rule_group.id, ()):
+            if compiled_rule.matches(order):
+                amount = compiled_rule.apply(order, amount)
+        return amount
+
     def generate_report(self) -> BillingReport:
         """Generate the billing report"""
         try:
@@ -524,32 +1129,53 @@ class BillingCalculator:
                 logger.info(f"No orders found for customer {self.customer_id} in date range")
                 return self.report
 
-            customer_services = CustomerService.objects.filter(
+            customer_services = list(CustomerService.objects.filter(
                 customer_id=self.customer_id
-            ).select_related('service')
+            ).select_related('service').prefetch_related(
+                Prefetch('rulegroup_set', queryset=RuleGroup.objects.prefetch_related(rules_with_statistics()))
+            ))
+
+            self.advanced_rules = compile_advanced_rules(
+                AdvancedRule.objects.filter(rule_group__customer_service__customer_id=self.customer_id)
+            )
+
+            # Compile every rule of the customer once so rules testing the same
+            # field share a single lookup per order
+            rule_stats = RuleStatsCollector()
+            decision_table = RuleDecisionTable(
+                (rule_group
+                 for cs in customer_services
+                 for rule_group in cs.rulegroup_set.all()),
+                stats=rule_stats
+            )
 
             for order in orders:
                 try:
                     order_cost = OrderCost(order_id=order.transaction_id)
                     applied_single_services = set()
+                    decisions = decision_table.evaluate(order)
 
                     for cs in customer_services:
                         if cs.service.charge_type == 'single' and cs.service.id in applied_single_services:
                             continue
 
-                        rule_groups = RuleGroup.objects.filter(customer_service=cs)
+                        rule_groups = cs.rulegroup_set.all()
                         service_applies = False
+                        matched_rule_group = None
 
-                        if not rule_groups.exists():
+                        if not rule_groups:
                             service_applies = True  # If no rules, service always applies
                         else:
                             for rule_group in rule_groups:
-                                if RuleEvaluator.evaluate_rule_group(rule_group, order):
+                                if decisions.group_result(rule_group):
                                     service_applies = True
+                                    matched_rule_group = rule_group
                                     break
 
                         if service_applies:
                             cost = self.calculate_service_cost(cs, order)
+                            if matched_rule_group is not None:
+                                cost = self.apply_advanced_rules(matched_rule_group, order, cost)
 
                             service_cost = ServiceCost(
                                 service_id=cs.service.id,
@@ -573,6 +1199,11 @@ class BillingCalculator:
                     logger.error(f"Error processing order {order.transaction_id}: {str(e)}")
                     continue
 
+            try:
+                rule_stats.save()
+            except Exception as e:
+                logger.error(f"Error saving rule statistics: {str(e)}")
+
             return self.report
 
         except Exception as e:
@@ -0,0 +1,122 @@
+# billing/management/commands/benchmark_advanced_rules.py
+
+from decimal import Decimal
+from time import perf_counter
+import random
+
+from django.core.management.base import BaseCommand
+
+from billing.billing_calculator import CompiledAdvancedRule
+from orders.models import Order
+from rules.models import AdvancedRule
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark AdvancedRule evaluation with many conditions: rules compiled once "
+        "per billing run against compiling them for every order. Uses unsaved objects only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conditions', type=int, default=50, help='Conditions per rule')
+        parser.add_argument('--rules', type=int, default=20, help='Number of advanced rules')
+        parser.add_argument('--orders', type=int, default=2000, help='Number of orders')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rules = [self.build_rule(rng, options['conditions']) for _ in range(options['rules'])]
+        orders = [self.build_order(rng, i) for i in range(options['orders'])]
+
+        started = perf_counter()
+        per_order_total = Decimal('0')
+        for order in orders:
+            for rule in rules:
+                compiled = CompiledAdvancedRule(rule)
+                if compiled.matches(order):
+                    per_order_total += compiled.apply(order, Decimal('10'))
+        per_order_time = perf_counter() - started
+
+        started = perf_counter()
+        compiled_rules = [CompiledAdvancedRule(rule) for rule in rules]
+        compiled_total = Decimal('0')
+        for order in orders:
+            for compiled in compiled_rules:
+                if compiled.matches(order):
+                    compiled_total += compiled.apply(order, Decimal('10'))
+        compiled_time = perf_counter() - started
+
+        if per_order_total != compiled_total:
+            self.stderr.write(self.style.ERROR("Results differ between compiled and per-order evaluation"))
+
+        evaluations = len(orders) * len(rules)
+        self.stdout.write(
+            f"{len(rules)} rules x {options['conditions']} conditions x {len(orders)} orders\n"
+            f"- compiled per order: {per_order_time:.3f}s "
+            f"({per_order_time / evaluations * 1e6:.1f} us/rule evaluation)\n"
+            f"- compiled once:      {compiled_time:.3f}s "
+            f"({compiled_time / evaluations * 1e6:.1f} us/rule evaluation)\n"
+            f"- speedup:            {per_order_time / compiled_time:.1f}x"
+        )
+
+    STRING_CRITERIA = [('regex', r'^[A-Z]'), ('ncontains', 'ZZZ'), ('ni', 'XX;YY'),
+                       ('ne', 'ZZZ'), ('is_not_null', '')]
+    NUMERIC_CRITERIA = [('ge', '0'), ('in_range', '0,100000'), ('ne', '-1'),
+                        ('le', '100000'), ('is_not_null', '')]
+
+    @classmethod
+    def build_rule(cls, rng, condition_count):
+        """Build a rule whose conditions all pass, so every condition is evaluated."""
+        candidates = [
+            (field_name, criteria)
+            for field_name in ['ship_to_country', 'carrier', 'reference_number', 'ship_to_name',
+                               'ship_to_company', 'ship_to_city', 'ship_to_state', 'notes']
+            for criteria in cls.STRING_CRITERIA
+        ] + [
+            (field_name, criteria)
+            for field_name in ['weight_lb', 'packages', 'total_item_qty', 'line_items', 'volume_cuft']
+            for criteria in cls.NUMERIC_CRITERIA
+        ]
+        conditions = {}
+        for field_name, (operator, value) in rng.sample(candidates, min(condition_count, len(candidates))):
+            conditions.setdefault(field_name, {})[operator] = value
+
+        return AdvancedRule(
+            field='weight_lb',
+            operator='ge',
+            value='0',
+            conditions=conditions,
+            calculations=[
+                {'type': 'flat_fee', 'value': 1.5},
+                {'type': 'percentage', 'value': 10},
+                {'type': 'per_unit', 'value': 0.25},
+                {'type': 'tiered_percentage', 'value': 0,
+                 'tiers': [{'min': 0, 'max': 50, 'percentage': 5},
+                           {'min': 50, 'max': 1000, 'percentage': 2}]},
+                {'type': 'product_specific', 'value': 0,
+                 'rates': {f'SKU-{i}': 0.1 for i in range(200)}},
+            ]
+        )
+
+    @staticmethod
+    def build_order(rng, i):
+        return Order(
+            transaction_id=i,
+            reference_number=f'REF-{i}',
+            ship_to_name=f'NAME {i}',
+            ship_to_company=f'COMPANY {i}',
+            ship_to_city=rng.choice(['TORONTO', 'DALLAS', 'MONTERREY']),
+            ship_to_state=rng.choice(['ON', 'TX', 'NL']),
+            ship_to_country=rng.choice(['US', 'CA', 'MX']),
+            carrier=rng.choice(['UPS', 'FedEx', 'USPS']),
+            notes='NOTES',
+            weight_lb=Decimal(rng.randint(1, 100)),
+            volume_cuft=Decimal(rng.randint(1, 20)),
+            packages=rng.randint(1, 5),
+            line_items=rng.randint(1, 8),
+            total_item_qty=rng.randint(1, 50),
+            sku_quantity=[
+                {'sku': f'SKU-{rng.randint(0, 400)}', 'quantity': rng.randint(1, 10)}
+                for _ in range(rng.randint(1, 8))
+            ]
+        )
@@ -12,12 +12,18 @@ from django.core.exceptions import ValidationError
 from billing.billing_calculator import (
     validate_sku_quantity,
     BillingCalculator,
-    RuleEvaluator
+    RuleEvaluator,
+    SkuIndex,
+    get_order_sku_index,
+    RuleDecisionTable,
+    RuleStatsCollector,
+    CompiledAdvancedRule,
+    compile_calculation
 )
 from orders.models import Order
 from customers.models import Customer
 from services.models import Service
-from rules.models import Rule, RuleGroup
+from rules.models import AdvancedRule, Rule, RuleGroup, RuleStatistics
 from customer_services.models import CustomerService
 
 class TestSKUQuantityValidation(TestCase):
@@ -344,4 +350,331 @@ class TestRuleEvaluation(TestCase):
 
         rule.operator = 'ncontains'
         rule.value = 'ABO-999'
-        self.assertTrue(RuleEvaluator.evaluate_rule(rule, order))
\ No newline at end of file
+        self.assertTrue(RuleEvaluator.evaluate_rule(rule, order))
+
+
+class TestSkuIndex(TestCase):
+    def setUp(self):
+        self.order = Order(
+            transaction_id=1001,
+            sku_quantity=[
+                {"sku": "ABO-012", "quantity": 12},
+                {"sku": "pack boxes", "quantity": 3}
+            ]
+        )
+
+    def evaluate(self, operator, value):
+        return RuleEvaluator.evaluate_rule(
+            Rule(field='sku_quantity', operator=operator, value=value),
+            self.order
+        )
+
+    def test_exact_match(self):
+        """contains/ncontains match whole normalized SKUs only"""
+        self.assertTrue(self.evaluate('contains', 'abo-012'))
+        self.assertTrue(self.evaluate('contains', 'XYZ; Pack Boxes'))
+        self.assertFalse(self.evaluate('contains', 'ABO'))
+        self.assertTrue(self.evaluate('ncontains', 'ABO'))
+        self.assertFalse(self.evaluate('ncontains', 'PACKBOXES'))
+
+    def test_substring_match(self):
+        """in/ni match any part of a SKU but never quantities"""
+        self.assertTrue(self.evaluate('in', 'BO-0'))
+        self.assertTrue(self.evaluate('in', 'ABO-012'))
+        self.assertFalse(self.evaluate('in', '12.0'))
+        self.assertTrue(self.evaluate('ni', 'XYZ'))
+        self.assertFalse(self.evaluate('ni', 'BOXES'))
+
+    def test_prefix_and_suffix_match(self):
+        self.assertTrue(self.evaluate('startswith', 'ABO-'))
+        self.assertFalse(self.evaluate('startswith', 'BO-'))
+        self.assertTrue(self.evaluate('endswith', 'boxes'))
+        self.assertFalse(self.evaluate('endswith', 'ABO'))
+
+    def test_empty_sku_quantity(self):
+        self.order.sku_quantity = []
+        self.assertFalse(self.evaluate('ncontains', 'ABO-012'))
+        self.assertFalse(SkuIndex.from_sku_quantity('not json'))
+
+    def test_index_built_once_per_order(self):
+        index = get_order_sku_index(self.order)
+        self.assertIs(get_order_sku_index(self.order), index)
+
+        self.order.sku_quantity = [{"sku": "NEW-1", "quantity": 1}]
+        self.assertEqual(get_order_sku_index(self.order).skus, {'NEW-1'})
+
+
+class TestRuleDecisionTable(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            company_name="Decision Table Company",
+            email="table@example.com"
+        )
+        service = Service.objects.create(service_name="Table Service", charge_type="single")
+        cls.customer_service = CustomerService.objects.create(
+            customer=cls.customer,
+            service=service,
+            unit_price=Decimal("5.00")
+        )
+
+        rule_specs = [
+            ('weight_lb', 'gt', '10'), ('weight_lb', 'gt', '5'), ('weight_lb', 'ge', '10'),
+            ('weight_lb', 'lt', '10'), ('weight_lb', 'le', '10'), ('weight_lb', 'eq', '10'),
+            ('weight_lb', 'ne', '10'), ('weight_lb', 'gt', 'heavy'), ('weight_lb', 'in', '10'),
+            ('packages', 'ge', '2'), ('packages', 'lt', '2'),
+            ('ship_to_country', 'eq', 'US'), ('ship_to_country', 'ne', 'US'),
+            ('ship_to_country', 'in', 'CA; MX'), ('ship_to_country', 'ni', 'CA; MX'),
+            ('carrier', 'in', 'UPS;FedEx'), ('carrier', 'contains', 'Ex'), ('carrier', 'eq', ''),
+            ('sku_quantity', 'contains', 'ABO-012'),
+        ]
+        cls.rule_groups = []
+        for logic_operator in ['AND', 'OR', 'NOT', 'XOR', 'NAND', 'NOR']:
+            for start in range(0, len(rule_specs), 4):
+                rule_group = RuleGroup.objects.create(
+                    customer_service=cls.customer_service,
+                    logic_operator=logic_operator
+                )
+                for field_name, operator, value in rule_specs[start:start + 5]:
+                    Rule.objects.create(
+                        rule_group=rule_group,
+                        field=field_name,
+                        operator=operator,
+                        value=value
+                    )
+                cls.rule_groups.append(rule_group)
+
+        cls.orders = [
+            Order(transaction_id=1, customer=cls.customer, weight_lb=Decimal('10'), packages=2,
+                  ship_to_country='US', carrier='UPS',
+                  sku_quantity=[{"sku": "ABO-012", "quantity": 1}]),
+            Order(transaction_id=2, customer=cls.customer, weight_lb=Decimal('7.5'), packages=1,
+                  ship_to_country='CA', carrier='FedEx'),
+            Order(transaction_id=3, customer=cls.customer, weight_lb=Decimal('12'),
+                  ship_to_country='MX', carrier='DHL'),
+            Order(transaction_id=4, customer=cls.customer),
+        ]
+
+    def test_matches_rule_evaluator(self):
+        """Table decisions are identical to evaluating every rule group independently"""
+        table = RuleDecisionTable.for_customer(self.customer.id)
+
+        for order in self.orders:
+            decisions = table.evaluate(order)
+            for rule_group in self.rule_groups:
+                for rule in rule_group.rules.all():
+                    self.assertEqual(
+                        decisions.rule_result(rule),
+                        RuleEvaluator.evaluate_rule(rule, order),
+                        f"{rule} on order {order.transaction_id}"
+                    )
+                self.assertEqual(
+                    decisions.group_result(rule_group),
+                    RuleEvaluator.evaluate_rule_group(rule_group, order),
+                    f"{rule_group} on order {order.transaction_id}"
+                )
+
+    def test_fields_resolved_once(self):
+        table = RuleDecisionTable.for_customer(self.customer.id)
+        decisions = table.evaluate(self.orders[0])
+        for rule_group in self.rule_groups:
+            decisions.group_result(rule_group)
+
+        self.assertEqual(
+            set(decisions.resolved),
+            {'weight_lb', 'packages', 'ship_to_country', 'carrier'}
+        )
+
+    def test_generate_report(self):
+        close_date = datetime.now(timezone.utc)
+        for order in self.orders:
+            order.close_date = close_date
+            order.reference_number = f"REF-{order.transaction_id}"
+            order.save()
+
+        calculator = BillingCalculator(
+            customer_id=self.customer.id,
+            start_date=close_date,
+            end_date=close_date
+        )
+        report = calculator.generate_report()
+
+        expected = sum(
+            Decimal("5.00")
+            for order in Order.objects.filter(customer=self.customer)
+            if any(RuleEvaluator.evaluate_rule_group(rg, order) for rg in self.rule_groups)
+        )
+        self.assertEqual(len(report.order_costs), len(self.orders))
+        self.assertEqual(report.total_amount, expected)
+
+
+class TestAdaptiveRuleOrdering(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            company_name="Ordering Company",
+            email="ordering@example.com"
+        )
+        service = Service.objects.create(service_name="Ordering Service", charge_type="single")
+        cls.customer_service = CustomerService.objects.create(
+            customer=cls.customer,
+            service=service,
+            unit_price=Decimal("1.00")
+        )
+        cls.rule_group = RuleGroup.objects.create(
+            customer_service=cls.customer_service,
+            logic_operator='AND'
+        )
+        cls.sku_rule = Rule.objects.create(
+            rule_group=cls.rule_group,
+            field='sku_quantity',
+            operator='contains',
+            value='ABO-012'
+        )
+        cls.weight_rule = Rule.objects.create(
+            rule_group=cls.rule_group,
+            field='weight_lb',
+            operator='gt',
+            value='10'
+        )
+        cls.order = Order.objects.create(
+            transaction_id=2001,
+            customer=cls.customer,
+            close_date=datetime.now(timezone.utc),
+            weight_lb=Decimal('5'),
+            sku_quantity=[{"sku": "ABO-012", "quantity": 1}]
+        )
+
+    def test_short_circuit_skips_expensive_rules(self):
+        """A failing cheap rule decides an AND group before the SKU rule runs"""
+        stats = RuleStatsCollector()
+        self.assertFalse(RuleEvaluator.evaluate_rule_group(self.rule_group, self.order, stats))
+        self.assertEqual(set(stats.counts), {self.weight_rule.id})
+
+    def test_statistics_reorder_rules(self):
+        RuleStatistics.objects.create(
+            rule=self.weight_rule, evaluation_count=100, pass_count=100, total_time_ns=100_000
+        )
+        RuleStatistics.objects.create(
+            rule=self.sku_rule, evaluation_count=100, pass_count=0, total_time_ns=500_000
+        )
+        table = RuleDecisionTable.for_customer(self.customer.id)
+        self.assertEqual(table.group_rules[self.rule_group.id], [self.sku_rule, self.weight_rule])
+
+    def test_billing_run_records_statistics(self):
+        calculator = BillingCalculator(
+            customer_id=self.customer.id,
+            start_date=self.order.close_date,
+            end_date=self.order.close_date
+        )
+        calculator.generate_report()
+        calculator.generate_report()
+
+        statistics = RuleStatistics.objects.get(rule=self.weight_rule)
+        self.assertEqual(statistics.evaluation_count, 2)
+        self.assertEqual(statistics.pass_count, 0)
+        self.assertEqual(statistics.pass_rate, 0)
+        self.assertFalse(RuleStatistics.objects.filter(rule=self.sku_rule).exists())
+
+
+class TestAdvancedRuleExecution(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(
+            company_name="Advanced Company",
+            email="advanced@example.com"
+        )
+        service = Service.objects.create(service_name="Advanced Service", charge_type="single")
+        cls.customer_service = CustomerService.objects.create(
+            customer=cls.customer,
+            service=service,
+            unit_price=Decimal("100.00")
+        )
+        cls.rule_group = RuleGroup.objects.create(
+            customer_service=cls.customer_service,
+            logic_operator='AND'
+        )
+        cls.advanced_rule = AdvancedRule.objects.create(
+            rule_group=cls.rule_group,
+            field='weight_lb',
+            operator='gt',
+            value='1',
+            conditions={
+                'reference_number': {'regex': r'^PO-\d+$'},
+                'packages': {'in_range': '1,3'},
+                'carrier': {'in': 'UPS;FedEx'},
+                'sku_quantity': {'contains': 'abo-012'},
+            },
+            calculations=[
+                {'type': 'flat_fee', 'value': 10},
+                {'type': 'percentage', 'value': 10},
+                {'type': 'tiered_percentage', 'value': 0,
+                 'tiers': [{'min': 0, 'max': 100, 'percentage': 1},
+                           {'min': 100, 'max': 1000, 'percentage': 5}]},
+                {'type': 'product_specific', 'value': 0, 'rates': {'ABO-012': 0.5}},
+            ]
+        )
+        cls.order = Order.objects.create(
+            transaction_id=3001,
+            customer=cls.customer,
+            close_date=datetime.now(timezone.utc),
+            reference_number='PO-77',
+            weight_lb=Decimal('2'),
+            packages=2,
+            carrier='UPS',
+            sku_quantity=[{"sku": "ABO-012", "quantity": 4}]
+        )
+
+    def test_conditions(self):
+        compiled = CompiledAdvancedRule(self.advanced_rule)
+        self.assertTrue(compiled.matches(self.order))
+
+        self.order.carrier = 'DHL'
+        self.assertFalse(compiled.matches(self.order))
+        self.order.carrier = 'UPS'
+        self.order.packages = 4
+        self.assertFalse(compiled.matches(self.order))
+
+    def test_calculations(self):
+        # (100 + 10) * 1.10 = 121.00, tier 100-1000 adds 5% = 127.05, 4 x 0.5 = 2.00
+        amount = CompiledAdvancedRule(self.advanced_rule).apply(self.order, Decimal('100.00'))
+        self.assertEqual(amount, Decimal('129.05'))
+
+    def test_tiers_match_first_in_list_order(self):
+        tiers = [{'min': 0, 'max': 100, 'percentage': 5}, {'min': 100, 'max': 1000, 'percentage': 10},
+                 {'min': 0, 'max': 5000, 'percentage': 1}]
+        apply = compile_calculation({'type': 'tiered_percentage', 'tiers': tiers})
+        self.assertEqual(apply(self.order, Decimal('100')), Decimal('105'))
+        self.assertEqual(apply(self.order, Decimal('200')), Decimal('220'))
+        self.assertEqual(apply(self.order, Decimal('2000')), Decimal('2020'))
+        self.assertEqual(apply(self.order, Decimal('9000')), Decimal('9000'))
+
+    def test_clean_validates_tiers_and_rates(self):
+        self.advanced_rule.clean()
+        # value is only required where it is used
+        self.advanced_rule.calculations = [
+            {'type': 'tiered_percentage', 'tiers': [{'min': 0, 'max': 100, 'percentage': 1}]},
+            {'type': 'product_specific', 'rates': {'ABO-012': '0.5'}},
+        ]
+        self.advanced_rule.clean()
+        for calc in (
+            {'type': 'flat_fee'},
+            {'type': 'tiered_percentage', 'tiers': None},
+            {'type': 'tiered_percentage', 'tiers': []},
+            {'type': 'tiered_percentage', 'tiers': [{'min': 0, 'max': 100}]},
+            {'type': 'tiered_percentage', 'tiers': [{'min': 0, 'max': 'x', 'percentage': 1}]},
+            {'type': 'product_specific'},
+            {'type': 'product_specific', 'rates': {'ABO-012': 'cheap'}},
+        ):
+            self.advanced_rule.calculations = [calc]
+            with self.subTest(calc=calc), self.assertRaises(ValidationError):
+                self.advanced_rule.clean()
+
+    def test_applied_to_service_amounts(self):
+        calculator = BillingCalculator(
+            customer_id=self.customer.id,
+            start_date=self.order.close_date,
+            end_date=self.order.close_date
+        )
+        report = calculator.generate_report()
+        self.assertEqual(report.total_amount, Decimal('129.05'))
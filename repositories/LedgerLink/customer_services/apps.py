@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CustomerServicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customer_services'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import CustomerService
+from .sku_assignment import ASSIGNMENT_MODES, parse_sku_text, read_sku_file
 from products.models import Product
 
 
@@ -76,4 +77,42 @@ class CustomerServiceForm(forms.ModelForm):
         if commit:
             instance.save()
             self.save_m2m()  # Save the many-to-many relations
-        return instance
\ No newline at end of file
+        return instance
+
+
+class SkuAssignmentForm(forms.Form):
+    skus = forms.CharField(
+        required=False,
+        label='SKUs',
+        widget=forms.Textarea(attrs={'rows': 8, 'placeholder': 'One SKU per line, or separated by commas'}),
+        help_text='Paste SKUs, or upload a file below. SKUs are matched regardless of spacing and case.'
+    )
+    file = forms.FileField(
+        required=False,
+        label='SKU File',
+        help_text='A CSV or Excel file with a "sku" column, or a text file with one SKU per line.'
+    )
+    mode = forms.ChoiceField(choices=ASSIGNMENT_MODES, initial='add', widget=forms.RadioSelect)
+
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if file:
+            if not file.name.endswith(('.csv', '.xlsx', '.txt')):
+                raise forms.ValidationError('Only CSV, Excel and text files are supported.')
+            if file.size > 10 * 1024 * 1024:  # 10MB limit
+                raise forms.ValidationError('File size must be under 10MB.')
+        return file
+
+    def clean(self):
+        cleaned_data = super().clean()
+        skus = parse_sku_text(cleaned_data.get('skus'))
+        file = cleaned_data.get('file')
+        if file:
+            try:
+                skus.extend(read_sku_file(file))
+            except (ValueError, UnicodeDecodeError) as e:
+                self.add_error('file', f'Could not read SKUs from the file: {e}')
+        if not skus and not self.errors:
+            raise ValidationError('Paste SKUs or upload a file.')
+        cleaned_data['sku_list'] = skus
+        return cleaned_data
@@ -0,0 +1,67 @@
+# customer_services/management/commands/benchmark_sku_assignment.py
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customer_services.models import CustomerService
+from customer_services.sku_assignment import assign_skus
+from customers.models import Customer
+from products.models import Product
+from services.models import Service
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark bulk SKU assignment against assigning the same SKUs one by one through "
+        "the M2M manager, and time billing's SKU set reads. Runs inside a transaction that "
+        "is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=20000, help='SKUs to assign')
+        parser.add_argument('--reads', type=int, default=10000, help='SKU set reads to time')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                company_name='Benchmark Customer',
+                legal_business_name='Benchmark Customer',
+                email='benchmark-sku-assignment@example.com'
+            )
+            service = Service.objects.create(service_name='Benchmark SKU Cost', charge_type='quantity')
+            bulk = CustomerService.objects.create(customer=customer, service=service, unit_price=1)
+            legacy = CustomerService.objects.create(
+                customer=customer,
+                service=Service.objects.create(service_name='Benchmark Legacy', charge_type='quantity'),
+                unit_price=1
+            )
+            skus = [f'SKU-{i:06d}' for i in range(options['skus'])]
+            Product.objects.bulk_create([
+                Product(sku=sku, normalized_sku=sku, customer=customer) for sku in skus
+            ], batch_size=5000)
+
+            started = perf_counter()
+            assign_skus(bulk, [sku.lower() for sku in skus])
+            self.stdout.write(f"assign_skus: {len(skus)} SKUs in {perf_counter() - started:.2f}s")
+            started = perf_counter()
+            assign_skus(bulk, skus[:len(skus) // 2], mode='replace')
+            self.stdout.write(f"assign_skus (replace, half removed): {perf_counter() - started:.2f}s")
+
+            started = perf_counter()
+            for sku in skus:
+                legacy.skus.add(Product.objects.get(customer=customer, sku=sku))
+            self.stdout.write(f"per-SKU add: {len(skus)} SKUs in {perf_counter() - started:.2f}s")
+
+            for label, read in (
+                ('get_sku_list', lambda cs: set(cs.get_sku_list())),
+                ('get_sku_set', lambda cs: cs.get_sku_set()),
+            ):
+                customer_service = CustomerService.objects.get(pk=legacy.pk)
+                started = perf_counter()
+                for _ in range(options['reads']):
+                    read(customer_service)
+                elapsed = perf_counter() - started
+                self.stdout.write(f"{label}: {elapsed / options['reads'] * 1e6:,.0f}us per read")
+            transaction.set_rollback(True)
@@ -26,4 +26,15 @@ class CustomerService(models.Model):
 
     def get_sku_list(self):
         """Get a list of SKU codes associated with this customer service."""
-        return list(self.skus.values_list('sku', flat=True))
\ No newline at end of file
+        return list(self.skus.values_list('sku', flat=True))
+
+    def get_sku_set(self):
+        """
+        Normalized SKUs assigned to this customer service, for billing.
+        Read once and kept on the instance, which billing holds for a single
+        run; changes made through this instance clear it.
+        """
+        sku_set = getattr(self, '_sku_set', None)
+        if sku_set is None:
+            sku_set = self._sku_set = frozenset(self.skus.values_list('normalized_sku', flat=True))
+        return sku_set
@@ -0,0 +1,13 @@
+# customer_services/signals.py
+
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import CustomerService
+
+
+@receiver(m2m_changed, sender=CustomerService.skus.through)
+def customer_service_skus_changed(sender, instance, action, reverse, **kwargs):
+    # The SKU set kept by get_sku_set is stale once SKUs are added or removed through this instance
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.__dict__.pop('_sku_set', None)
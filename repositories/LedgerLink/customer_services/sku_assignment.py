@@ -0,0 +1,88 @@
+# customer_services/sku_assignment.py
+
+import re
+
+from django.db import transaction
+from django.utils import timezone
+
+from Main.ingestion import clean_text, read_chunks
+from products.models import Product, normalize_sku
+from .models import CustomerService
+
+ASSIGNMENT_MODES = [
+    ('add', 'Add to the current SKUs'),
+    ('remove', 'Remove from the current SKUs'),
+    ('replace', 'Replace the current SKUs'),
+]
+
+
+def parse_sku_text(text):
+    """SKUs from pasted text: one per line, or separated by commas, semicolons or tabs."""
+    return [sku.strip() for sku in re.split(r'[\r\n,;\t]+', text or '') if sku.strip()]
+
+
+def read_sku_file(file):
+    """SKUs from the 'sku' column of a CSV or Excel file, or the lines of a text file."""
+    if not file.name.endswith(('.csv', '.xlsx')):
+        return parse_sku_text(file.read().decode('utf-8-sig'))
+    skus = []
+    for frame in read_chunks(file):
+        frame = frame.rename(columns=lambda c: str(c).strip().lower())
+        if 'sku' not in frame.columns:
+            raise ValueError("Missing required column: sku")
+        skus.extend(clean_text(frame['sku']).dropna().tolist())
+    return skus
+
+
+def assign_skus(customer_service, skus, mode='add', batch_size=1000):
+    """
+    Add, remove or replace the SKUs of a customer service in bulk.
+
+    SKUs are resolved to the customer's products by normalized SKU, diffed
+    against the current assignments and applied to the M2M through table with
+    bulk_create and batched deletes in one transaction. Returns counts and the
+    SKUs that matched no product.
+    """
+    if mode not in dict(ASSIGNMENT_MODES):
+        raise ValueError(f"Unknown assignment mode: {mode}")
+
+    requested = {}
+    for sku in skus:
+        requested.setdefault(normalize_sku(sku), sku)
+    requested.pop('', None)
+    products = Product.objects.only('id', 'normalized_sku').resolve_skus(customer_service.customer_id, requested)
+    product_ids = {product.id for product in products.values()}
+
+    Through = CustomerService.skus.through
+    assignments = Through.objects.filter(customerservice_id=customer_service.pk)
+    with transaction.atomic():
+        current = set(assignments.values_list('product_id', flat=True))
+        to_add = set() if mode == 'remove' else product_ids - current
+        if mode == 'add':
+            to_remove = set()
+        elif mode == 'remove':
+            to_remove = product_ids & current
+        else:
+            to_remove = current - product_ids
+
+        Through.objects.bulk_create(
+            [Through(customerservice_id=customer_service.pk, product_id=product_id) for product_id in to_add],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        to_remove = sorted(to_remove)
+        for start in range(0, len(to_remove), batch_size):
+            assignments.filter(product_id__in=to_remove[start:start + batch_size]).delete()
+
+        if to_add or to_remove:
+            # bulk_create and queryset deletes send no m2m_changed
+            customer_service.__dict__.pop('_sku_set', None)
+            CustomerService.objects.filter(pk=customer_service.pk).update(updated_at=timezone.now())
+
+    return {
+        'requested': len(requested),
+        'added': len(to_add),
+        'removed': len(to_remove),
+        'unchanged': len(product_ids) - len(to_remove if mode == 'remove' else to_add),
+        'unknown': sorted(sku for normalized, sku in requested.items() if normalized not in products),
+    }
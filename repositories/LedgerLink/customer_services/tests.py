@@ -1,3 +1,137 @@
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+
+from billing.billing_calculator import BillingCalculator
+from customers.models import Customer
+from products.models import Product
+from services.models import Service
+from .models import CustomerService
+from .sku_assignment import assign_skus
+
+
+class CustomerSkuSearchTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            company_name='Test Company',
+            legal_business_name='Test Legal Name',
+            email='test@example.com'
+        )
+        Product.objects.bulk_create([
+            Product(sku=sku, normalized_sku=sku.upper(), customer=self.customer)
+            for sku in ['abc-1', 'ABC-2', 'XABC', 'DEF']
+        ])
+        self.url = reverse('customer_services:search_customer_skus', args=[self.customer.id])
+
+    def test_search(self):
+        response = self.client.get(self.url, {'q': 'abc', 'mode': 'contains', 'limit': 2})
+        data = response.json()
+        self.assertEqual([item['sku'] for item in data['results']], ['abc-1', 'ABC-2'])
+        self.assertEqual(data['total'], 4)
+        self.assertTrue(data['truncated'])
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url, {'q': 'abc'})
+        etag = response['ETag']
+        response = self.client.get(self.url, {'q': 'abc'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Product.objects.create(sku='ABC-3', customer=self.customer)
+        full_list = reverse('customer_services:get_customer_skus', args=[self.customer.id])
+        response = self.client.get(full_list, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+
+        etag = response['ETag']
+        Product.objects.filter(sku='DEF').delete()
+        response = self.client.get(full_list, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 4)
+
+
+class SkuAssignmentTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer = Customer.objects.create(
+            company_name='Test Company',
+            legal_business_name='Test Legal Name',
+            email='test@example.com'
+        )
+        service = Service.objects.create(service_name='SKU Cost', charge_type='quantity')
+        self.customer_service = CustomerService.objects.create(
+            customer=self.customer, service=service, unit_price='1.00'
+        )
+        self.products = {
+            sku: Product.objects.create(sku=sku, customer=self.customer)
+            for sku in ['AB-1', 'AB-2', 'AB-3', 'AB-4']
+        }
+        self.customer_service.skus.add(self.products['AB-1'], self.products['AB-2'])
+
+    def assigned(self):
+        return set(self.customer_service.skus.values_list('sku', flat=True))
+
+    def test_add_resolves_normalized_skus(self):
+        with self.assertNumQueries(6):
+            result = assign_skus(self.customer_service, ['ab-2', ' ab-3 ', 'AB-3', 'NOPE'])
+        self.assertEqual(self.assigned(), {'AB-1', 'AB-2', 'AB-3'})
+        self.assertEqual((result['added'], result['removed'], result['unchanged']), (1, 0, 1))
+        self.assertEqual(result['unknown'], ['NOPE'])
+
+    def test_remove_and_replace(self):
+        result = assign_skus(self.customer_service, ['AB-1', 'AB-3'], mode='remove')
+        self.assertEqual((result['removed'], result['unchanged']), (1, 1))
+        self.assertEqual(self.assigned(), {'AB-2'})
+
+        result = assign_skus(self.customer_service, ['AB-3', 'AB-4'], mode='replace', batch_size=1)
+        self.assertEqual((result['added'], result['removed']), (2, 1))
+        self.assertEqual(self.assigned(), {'AB-3', 'AB-4'})
+
+    def test_sku_set_is_kept_per_instance_and_billing_run(self):
+        customer_service = CustomerService.objects.get(pk=self.customer_service.pk)
+        self.assertEqual(customer_service.get_sku_set(), {'AB-1', 'AB-2'})
+        with self.assertNumQueries(0):
+            customer_service.get_sku_set()
+
+        assign_skus(customer_service, ['AB-4'])
+        self.assertEqual(customer_service.get_sku_set(), {'AB-1', 'AB-2', 'AB-4'})
+        customer_service.skus.remove(self.products['AB-4'])
+        self.assertEqual(customer_service.get_sku_set(), {'AB-1', 'AB-2'})
+
+        # Another instance, as in another worker, sees changes made elsewhere straight away
+        self.products['AB-1'].delete()
+        self.assertEqual(CustomerService.objects.get(pk=customer_service.pk).get_sku_set(), {'AB-2'})
+
+        now = datetime.now(timezone.utc)
+        calculator = BillingCalculator(self.customer.id, now, now)
+        fresh = CustomerService.objects.get(pk=customer_service.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(calculator.get_sku_set(fresh), {'AB-2'})
+        # Other instances of the same customer service reuse the run's set
+        with self.assertNumQueries(0):
+            calculator.get_sku_set(CustomerService(pk=customer_service.pk))
+
+    def test_assign_view_and_api(self):
+        url = reverse('customer_services:customer_service_skus', args=[self.customer_service.pk])
+        response = self.client.post(url, {
+            'skus': 'ab-3\n',
+            'file': SimpleUploadedFile('skus.csv', b'sku,notes\nAB-4,x\nMISSING,y\n'),
+            'mode': 'replace',
+        })
+        self.assertEqual(response.context['result']['unknown'], ['MISSING'])
+        self.assertEqual(self.assigned(), {'AB-3', 'AB-4'})
 
-# Create your tests here.
+        url = reverse('customer_services:customer_service_skus_api', args=[self.customer_service.pk])
+        response = self.client.post(url, {'skus': ['AB-1'], 'mode': 'add'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('importer', password='secret'))
+        response = self.client.post(url, {'skus': ['AB-1'], 'mode': 'add'}, content_type='application/json')
+        self.assertEqual(response.json()['added'], 1)
+        response = self.client.post(url, {'skus': 'AB-1'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     CustomerServiceListView, CustomerServiceDetailView, CustomerServiceCreateView,
-    CustomerServiceUpdateView, CustomerServiceDeleteView, get_customer_skus
+    CustomerServiceUpdateView, CustomerServiceDeleteView, CustomerServiceSkuAssignView,
+    customer_service_skus_api, get_customer_skus, search_customer_skus
 )
 
 app_name = 'customer_services'
@@ -13,7 +14,10 @@ urlpatterns = [
     path('new/', CustomerServiceCreateView.as_view(), name='customer_service_create'),  # Changed from 'create'
     path('<int:pk>/edit/', CustomerServiceUpdateView.as_view(), name='customer_service_edit'),  # Changed from 'edit'
     path('<int:pk>/delete/', CustomerServiceDeleteView.as_view(), name='customer_service_delete'),  # Changed from 'delete'
+    path('<int:pk>/skus/', CustomerServiceSkuAssignView.as_view(), name='customer_service_skus'),
 
     # API endpoints
     path('api/customer-skus/<int:customer_id>/', get_customer_skus, name='get_customer_skus'),
+    path('api/customer-skus/<int:customer_id>/search/', search_customer_skus, name='search_customer_skus'),
+    path('api/<int:pk>/skus/', customer_service_skus_api, name='customer_service_skus_api'),
 ]
\ No newline at end of file
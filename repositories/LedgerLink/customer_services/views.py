@@ -2,13 +2,23 @@ from django.urls import reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
 from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.views import View
 from django.db.models import Q, Count
 from django.core.exceptions import ValidationError
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from products.models import Product
+from products.sku_index import catalog_version, get_sku_index
 from services.models import Service
 from customers.models import Customer
 from .models import CustomerService
-from .forms import CustomerServiceForm
+from .forms import CustomerServiceForm, SkuAssignmentForm
+from .sku_assignment import assign_skus
 
 
 class CustomerServiceListView(ListView):
@@ -218,8 +228,78 @@ class CustomerServiceDeleteView(DeleteView):
             return self.get(request, *args, **kwargs)
 
 
+class CustomerServiceSkuAssignView(View):
+    """Add, remove or replace a customer service's SKUs from a pasted list or a file."""
+    form_class = SkuAssignmentForm
+    template_name = 'customer_services/customer_service_sku_assign.html'
+
+    def get_customer_service(self, pk):
+        return get_object_or_404(CustomerService.objects.select_related('customer', 'service'), pk=pk)
+
+    def get(self, request, pk):
+        customer_service = self.get_customer_service(pk)
+        return render(request, self.template_name, {
+            'form': self.form_class(),
+            'customer_service': customer_service,
+        })
+
+    def post(self, request, pk):
+        customer_service = self.get_customer_service(pk)
+        form = self.form_class(request.POST, request.FILES)
+        context = {'form': form, 'customer_service': customer_service}
+        if form.is_valid():
+            result = assign_skus(customer_service, form.cleaned_data['sku_list'], mode=form.cleaned_data['mode'])
+            messages.success(
+                request,
+                f"{result['added']} SKUs added, {result['removed']} removed, {result['unchanged']} unchanged."
+            )
+            if result['unknown']:
+                messages.warning(request, f"{len(result['unknown'])} SKUs did not match a product for this customer.")
+            context['result'] = result
+        return render(request, self.template_name, context)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def customer_service_skus_api(request, pk):
+    """
+    Assign SKUs to a customer service in bulk.
+    Accepts {"skus": [...], "mode": "add" | "remove" | "replace"} and returns
+    the counts plus the SKUs that matched no product.
+    """
+    customer_service = get_object_or_404(CustomerService, pk=pk)
+    skus = request.data.get('skus') if isinstance(request.data, dict) else None
+    if not isinstance(skus, list) or not all(isinstance(sku, str) for sku in skus):
+        return Response({'error': 'Expected a list of SKU strings'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = assign_skus(customer_service, skus, mode=request.data.get('mode', 'add'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+
+def sku_catalog_version(request, customer_id):
+    """The customer's catalog version, read once per request."""
+    if not hasattr(request, 'sku_catalog_version'):
+        request.sku_catalog_version = catalog_version(customer_id)
+    return request.sku_catalog_version
+
+
+def sku_catalog_etag(request, customer_id):
+    # No Last-Modified: deleting a product doesn't move the latest updated_at
+    count, updated_at = sku_catalog_version(request, customer_id)
+    return f'"skus-{customer_id}-{count}-{updated_at.timestamp() if updated_at else 0}"'
+
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=sku_catalog_etag)
 def get_customer_skus(request, customer_id):
-    """API endpoint to get SKUs for a specific customer."""
+    """
+    API endpoint to get SKUs for a specific customer.
+    Returns the whole catalog; pickers for large catalogs use search_customer_skus.
+    """
     try:
         skus = Product.objects.filter(
             customer_id=customer_id
@@ -233,6 +313,40 @@ def get_customer_skus(request, customer_id):
         )
 
 
+SKU_SEARCH_DEFAULT_LIMIT = 50
+SKU_SEARCH_MAX_LIMIT = 500
+
+
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=sku_catalog_etag)
+def search_customer_skus(request, customer_id):
+    """
+    Typeahead search over a customer's SKUs, served from the in-memory SKU index.
+
+    Query parameters: q (matched against normalized SKUs), mode ('prefix' or
+    'contains') and limit (at most SKU_SEARCH_MAX_LIMIT). Returns the matches,
+    the size of the catalog and whether more matches may exist.
+    """
+    try:
+        limit = int(request.GET.get('limit', SKU_SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    limit = max(1, min(limit, SKU_SEARCH_MAX_LIMIT))
+
+    index = get_sku_index(customer_id, sku_catalog_version(request, customer_id))
+    results = index.search(
+        request.GET.get('q', ''),
+        limit=limit,
+        contains=request.GET.get('mode') == 'contains'
+    )
+    return JsonResponse({
+        'results': results,
+        'total': len(index),
+        'truncated': len(results) == limit and len(index) > limit,
+    })
+
+
 # Filter operators for different field types
 FILTER_OPERATORS = {
     'text': [
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_alter_customer_id'),
+        ('inserts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='insert',
+            name='normalized_sku',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+    ]
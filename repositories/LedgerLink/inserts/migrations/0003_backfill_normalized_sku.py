@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill_normalized_sku(apps, schema_editor):
+    """Fill normalized_sku in primary key order, committing each batch."""
+    Insert = apps.get_model('inserts', 'Insert')
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Insert.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'sku')[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                # Same rule as products.models.normalize_sku
+                row.normalized_sku = ''.join(str(row.sku or '').split()).upper()
+            Insert.objects.bulk_update(batch, ['normalized_sku'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so a large table is not rewritten in one transaction
+    atomic = False
+
+    dependencies = [
+        ('inserts', '0002_normalized_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_sku, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inserts', '0003_backfill_normalized_sku'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='insert',
+            index=models.Index(fields=['customer', 'normalized_sku'], name='insert_customer_norm_sku_idx'),
+        ),
+    ]
@@ -2,15 +2,31 @@
 
 from django.db import models
 from customers.models import Customer
+from products.models import SkuQuerySet, normalize_sku
 
 
 class Insert(models.Model):
     sku = models.CharField(max_length=100)
+    normalized_sku = models.CharField(max_length=100, editable=False, default='')
     insert_name = models.CharField(max_length=100)
     insert_quantity = models.PositiveIntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
 
+    objects = SkuQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'normalized_sku'], name='insert_customer_norm_sku_idx'),
+        ]
+
     def __str__(self):
         return f"{self.insert_name} ({self.sku})"
+
+    def save(self, *args, **kwargs):
+        self.normalized_sku = normalize_sku(self.sku)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'sku' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_sku'}
+        super().save(*args, **kwargs)
@@ -1,6 +1,5 @@
 from django import forms
-from .models import Order
-import json
+from .models import Order, canonical_sku_quantity
 
 class OrderForm(forms.ModelForm):
     class Meta:
@@ -27,52 +26,37 @@ class OrderForm(forms.ModelForm):
         }
 
     def clean_sku_quantity(self):
-        sku_quantity = self.cleaned_data.get('sku_quantity')
-        if sku_quantity:
-            try:
-                # Handle already parsed JSON or string input
-                if isinstance(sku_quantity, str):
-                    # Remove any escaped quotes
-                    sku_quantity = sku_quantity.replace('\\"', '"')
-                    data = json.loads(sku_quantity)
-                else:
-                    data = sku_quantity
-
-                # Validate structure
-                if not isinstance(data, list):
-                    raise forms.ValidationError("SKU quantity must be a list of items")
-
-                # Clean and validate each item
-                cleaned_data = []
-                for item in data:
-                    if not isinstance(item, dict):
-                        raise forms.ValidationError("Each SKU item must be an object")
-                    if 'sku' not in item or 'quantity' not in item:
-                        raise forms.ValidationError("Each SKU item must have 'sku' and 'quantity' fields")
-
-                    # Clean and validate SKU
-                    sku = str(item['sku']).strip()
-                    if not sku:
-                        raise forms.ValidationError("SKU cannot be empty")
-
-                    # Clean and validate quantity
-                    try:
-                        quantity = float(item['quantity'])
-                        if quantity <= 0:
-                            raise forms.ValidationError("Quantity must be a positive number")
-                    except (TypeError, ValueError):
-                        raise forms.ValidationError("Invalid quantity value")
-
-                    cleaned_data.append({
-                        'sku': sku,
-                        'quantity': quantity
-                    })
-
-                # Store as a clean JSON string
-                return json.dumps(cleaned_data)
-
-            except json.JSONDecodeError:
-                raise forms.ValidationError("Invalid JSON format")
-            except Exception as e:
-                raise forms.ValidationError(f"Invalid data format: {str(e)}")
-        return sku_quantity
\ No newline at end of file
+        # Stored as a native JSON list; see canonical_sku_quantity for the format
+        try:
+            return canonical_sku_quantity(self.cleaned_data.get('sku_quantity'))
+        except ValueError as e:
+            raise forms.ValidationError(f"Invalid data format: {e}")
+
+class OrderUploadForm(forms.Form):
+    file = forms.FileField(
+        label='Choose File',
+        help_text='Upload a CSV or Excel file containing orders.'
+    )
+    background = forms.BooleanField(
+        required=False,
+        label='Process in the background',
+        help_text='Store the file and process it in the background. Use this for large files.'
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data.get('file')
+        if file:
+            if not file.name.endswith(('.csv', '.xlsx')):
+                raise forms.ValidationError('Only CSV and Excel files are supported.')
+        return file
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file = cleaned_data.get('file')
+        if file:
+            if cleaned_data.get('background'):
+                if file.size > 1024 * 1024 * 1024:  # 1GB limit
+                    self.add_error('file', 'File size must be under 1GB.')
+            elif file.size > 10 * 1024 * 1024:  # 10MB limit
+                self.add_error('file', 'File size must be under 10MB. Larger files can be processed in the background.')
+        return cleaned_data
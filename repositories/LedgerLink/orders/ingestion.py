@@ -0,0 +1,267 @@
+# orders/ingestion.py
+
+import json
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from customers.models import Customer
+from Main.ingestion import RowErrors, clean_text, to_number
+from .models import Order, sku_quantity_total
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['transaction_id', 'customer_id', 'reference_number']
+TEXT_FIELDS = [
+    'reference_number', 'ship_to_name', 'ship_to_company', 'ship_to_address', 'ship_to_address2',
+    'ship_to_city', 'ship_to_state', 'ship_to_zip', 'ship_to_country', 'carrier', 'notes'
+]
+INTEGER_FIELDS = ['line_items', 'total_item_qty', 'packages']
+DECIMAL_FIELDS = ['weight_lb', 'volume_cuft']
+# Input column (field attname) -> field name, for every column an upsert can overwrite
+UPDATE_FIELDS = {
+    field.attname: field.name for field in Order._meta.concrete_fields if not field.primary_key
+}
+
+_INVALID = object()
+
+
+def read_order_file(file):
+    """Read an uploaded CSV or Excel file into a DataFrame of strings."""
+    if file.name.endswith('.csv'):
+        return pd.read_csv(file, dtype=str, keep_default_na=False)
+    elif file.name.endswith('.xlsx'):
+        return pd.read_excel(file, dtype=str)
+    raise ValueError('Unsupported file type')
+
+
+def _parse_sku_quantity(value):
+    if isinstance(value, list):
+        return value
+    if value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, str):
+        if not value.strip():
+            return None
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            return _INVALID
+        return parsed if isinstance(parsed, list) else _INVALID
+    return _INVALID
+
+
+def _column_names(columns):
+    """Input column names as Order field attnames; 'customer' is accepted for customer_id."""
+    names = [str(c).strip().lower() for c in columns]
+    if 'customer_id' not in names:
+        names = ['customer_id' if name == 'customer' else name for name in names]
+    return names
+
+
+def update_fields_for(columns):
+    """
+    The Order fields an upsert of rows with these input columns overwrites.
+    Columns missing from the input keep their stored values on existing orders.
+    """
+    names = set(_column_names(columns))
+    if 'sku_quantity' in names:
+        # Derived from the SKU lines whenever there are any
+        names.add('total_item_qty')
+    return [name for attname, name in UPDATE_FIELDS.items() if attname in names]
+
+
+def validate_orders(frame, first_row=1):
+    """
+    Validate and normalize order rows column by column.
+
+    Returns (orders, errors): unsaved Order instances for the valid rows and a
+    list of {'row', 'transaction_id', 'errors'} dicts, with row numbers counted
+    from first_row. When a transaction ID appears more than once, the last row wins and
+    the earlier rows are reported as errors.
+    """
+    if frame.empty:
+        return [], []
+    frame = frame.rename(columns=dict(zip(frame.columns, _column_names(frame.columns)))).reset_index(drop=True)
+    missing = [col for col in REQUIRED_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    errors = RowErrors()
+    size = len(frame)
+
+    def column(name):
+        if name in frame.columns:
+            return frame[name]
+        return pd.Series([None] * size, dtype=object)
+
+    transaction_ids = to_number(clean_text(column('transaction_id')))
+    errors.add(transaction_ids.isna() | (transaction_ids % 1 != 0), 'transaction_id: must be an integer')
+    errors.add(transaction_ids.notna() & transaction_ids.duplicated(keep='last'),
+               'transaction_id: duplicated by a later row')
+
+    customer_ids = to_number(clean_text(column('customer_id')))
+    known_customers = set(Customer.objects.filter(
+        id__in=customer_ids.dropna().astype('int64').unique().tolist()
+    ).values_list('id', flat=True))
+    errors.add(~customer_ids.isin(known_customers), 'customer_id: customer does not exist')
+
+    values = {}
+    for name in TEXT_FIELDS:
+        text = clean_text(column(name))
+        max_length = Order._meta.get_field(name).max_length
+        if max_length:
+            errors.add(text.str.len().fillna(0) > max_length,
+                       f'{name}: longer than {max_length} characters')
+        values[name] = text
+    errors.add(values['reference_number'].isna(), 'reference_number: required')
+
+    raw_dates = clean_text(column('close_date'))
+    close_dates = pd.to_datetime(raw_dates, errors='coerce', utc=True, format='mixed')
+    errors.add(raw_dates.notna() & close_dates.isna(), 'close_date: invalid date')
+
+    for name in INTEGER_FIELDS + DECIMAL_FIELDS:
+        raw = clean_text(column(name))
+        numbers = to_number(raw)
+        errors.add(raw.notna() & numbers.isna(), f'{name}: must be a number')
+        errors.add(numbers < 0, f'{name}: cannot be negative')
+        if name in INTEGER_FIELDS:
+            errors.add(numbers % 1 > 0, f'{name}: must be a whole number')
+            values[name] = numbers
+        else:
+            # Decimals keep their text so no precision is lost through floats
+            values[name] = raw
+
+    sku_lists = column('sku_quantity').map(_parse_sku_quantity)
+    errors.add(sku_lists.map(lambda v: v is _INVALID), 'sku_quantity: must be a JSON list')
+    sku_quantity = _normalize_sku_lists(sku_lists, errors)
+
+    error_rows = []
+    for position in sorted(errors.messages):
+        transaction_id = transaction_ids.iat[position]
+        error_rows.append({
+            'row': first_row + position,
+            'transaction_id': None if np.isnan(transaction_id) else int(transaction_id),
+            'errors': errors.messages[position],
+        })
+
+    # Build every column as a list of Python values, then create the orders from
+    # positional rows, which is Model.__init__'s fast path.
+    valid = np.setdiff1d(np.arange(size), np.fromiter(errors.messages, dtype=int, count=len(errors.messages)))
+    columns = {
+        'transaction_id': transaction_ids.iloc[valid].astype('int64').tolist(),
+        'customer_id': customer_ids.iloc[valid].astype('int64').tolist(),
+        'close_date': [
+            None if pd.isna(value) else value.to_pydatetime() for value in close_dates.iloc[valid]
+        ],
+        'sku_quantity': [sku_quantity.get(position) for position in valid.tolist()],
+    }
+    for name, series in values.items():
+        series = series.iloc[valid].astype(object)
+        column_values = series.where(series.notna(), None).tolist()
+        if name in INTEGER_FIELDS:
+            column_values = [None if value is None else int(value) for value in column_values]
+        elif name in DECIMAL_FIELDS:
+            column_values = [None if value is None else Decimal(value) for value in column_values]
+        columns[name] = column_values
+
+    # total_item_qty is derived from the SKU lines whenever there are any
+    columns['total_item_qty'] = [
+        total if sku_lines is None else sku_quantity_total(sku_lines)
+        for total, sku_lines in zip(columns['total_item_qty'], columns['sku_quantity'])
+    ]
+
+    missing_column = [None] * len(valid)
+    orders = [
+        Order(*row)
+        for row in zip(*(columns.get(field.attname, missing_column) for field in Order._meta.concrete_fields))
+    ]
+
+    return orders, error_rows
+
+
+def _normalize_sku_lists(sku_lists, errors):
+    """
+    Validate every SKU line at once and return {row position: canonical list},
+    in the form canonical_sku_quantity produces: normalized SKUs, repeated SKUs
+    merged and quantities as numbers (ints when whole).
+    """
+    lists = sku_lists[sku_lists.map(lambda v: isinstance(v, list) and len(v) > 0)]
+    if lists.empty:
+        return {}
+
+    lines = lists.explode()
+    is_item = lines.map(lambda item: isinstance(item, dict))
+    errors.add(
+        sku_lists.index.isin(lines.index[~is_item.to_numpy()]),
+        'sku_quantity: each item must be an object'
+    )
+    lines = lines[is_item]
+    if lines.empty:
+        return {}
+
+    # Same rule as normalize_sku: drop all whitespace and uppercase
+    skus = clean_text(lines.map(lambda item: item.get('sku'))).str.replace(r'\s+', '', regex=True).str.upper()
+    quantities = to_number(lines.map(lambda item: item.get('quantity')))
+    bad_sku = skus.isna()
+    bad_quantity = quantities.isna() | (quantities <= 0)
+    errors.add(sku_lists.index.isin(lines.index[bad_sku.to_numpy()]), 'sku_quantity: SKU cannot be empty')
+    errors.add(sku_lists.index.isin(lines.index[bad_quantity.to_numpy()]),
+               'sku_quantity: quantity must be a positive number')
+
+    merged = defaultdict(dict)
+    for position, sku, quantity in zip(lines.index, skus.tolist(), quantities.tolist()):
+        if position in errors:
+            continue
+        merged[position][sku] = merged[position].get(sku, 0) + quantity
+    return {
+        position: [
+            {'sku': sku, 'quantity': int(quantity) if float(quantity).is_integer() else quantity}
+            for sku, quantity in items.items()
+        ]
+        for position, items in merged.items()
+    }
+
+
+def upsert_orders(orders, update_fields, batch_size=1000, dry_run=False):
+    """
+    Insert or update orders by transaction ID in batches, each in its own
+    transaction. Existing orders only have update_fields overwritten, see
+    update_fields_for. Returns (created, updated) counts; with dry_run nothing
+    is written and the counts say what would have changed.
+    """
+    created = updated = 0
+    for start in range(0, len(orders), batch_size):
+        batch = orders[start:start + batch_size]
+        with transaction.atomic():
+            existing = Order.objects.filter(
+                transaction_id__in=[order.transaction_id for order in batch]
+            ).count()
+            if not dry_run:
+                Order.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['transaction_id'],
+                    update_fields=update_fields,
+                )
+        updated += existing
+        created += len(batch) - existing
+    return created, updated
+
+
+def ingest_orders(frame, batch_size=1000):
+    """Validate order rows and upsert the valid ones. Returns a summary with per-row errors."""
+    orders, errors = validate_orders(frame)
+    created, updated = upsert_orders(orders, update_fields_for(frame.columns), batch_size=batch_size)
+    logger.info(f"Ingested {len(orders)} orders ({created} created, {updated} updated), "
+                f"{len(errors)} rows rejected")
+    return {
+        'total': len(frame),
+        'created': created,
+        'updated': updated,
+        'errors': errors,
+    }
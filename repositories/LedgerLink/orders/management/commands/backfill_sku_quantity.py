@@ -0,0 +1,65 @@
+# orders/management/commands/backfill_sku_quantity.py
+
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import Order, canonical_sku_quantity, sku_quantity_total
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite Order.sku_quantity in its canonical form (a JSON list with normalized "
+        "SKUs and numeric quantities) and derive total_item_qty, in transaction ID order "
+        "with one transaction per batch. Rows already canonical are skipped, so the "
+        "command can be stopped and rerun, or resumed with --after. Run it once after "
+        "migrating an existing database: orders saved before sku_quantity was "
+        "canonicalized aren't matched by the SKU containment index until rewritten."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--after', type=int, default=None,
+                            help='Resume after this transaction ID (the last one reported)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving')
+
+    def handle(self, *args, **options):
+        last_id = options['after']
+        scanned = rewritten = invalid = 0
+        while True:
+            queryset = Order.objects.filter(sku_quantity__isnull=False).order_by('transaction_id')
+            if last_id is not None:
+                queryset = queryset.filter(transaction_id__gt=last_id)
+            with transaction.atomic():
+                rows = list(queryset.values_list(
+                    'transaction_id', 'sku_quantity', 'total_item_qty'
+                )[:options['batch_size']])
+                if not rows:
+                    break
+                changed = []
+                for transaction_id, sku_quantity, total_item_qty in rows:
+                    try:
+                        canonical = canonical_sku_quantity(sku_quantity)
+                    except ValueError as e:
+                        invalid += 1
+                        logger.warning(f"Order {transaction_id}: sku_quantity left unchanged ({e})")
+                        continue
+                    total = sku_quantity_total(canonical) if canonical else total_item_qty
+                    if canonical != sku_quantity or total != total_item_qty:
+                        changed.append(Order(transaction_id=transaction_id, sku_quantity=canonical,
+                                             total_item_qty=total))
+                if changed and not options['dry_run']:
+                    Order.objects.bulk_update(changed, ['sku_quantity', 'total_item_qty'])
+            scanned += len(rows)
+            rewritten += len(changed)
+            last_id = rows[-1][0]
+            self.stdout.write(f"Up to transaction {last_id}: {scanned} scanned, {rewritten} rewritten, "
+                              f"{invalid} invalid")
+
+        verb = 'would be rewritten' if options['dry_run'] else 'rewritten'
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {scanned} orders scanned, {rewritten} {verb}, {invalid} left unchanged as invalid"
+        ))
@@ -0,0 +1,73 @@
+# orders/management/commands/benchmark_order_ingestion.py
+
+from time import perf_counter
+import json
+import random
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.models import Customer
+from orders.ingestion import update_fields_for, upsert_orders, validate_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark bulk order ingestion: validation and batched upserts of generated "
+        "CSV-style rows, run twice to measure inserts and updates. Runs inside a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50000, help='Number of generated orders')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                company_name='Benchmark Customer',
+                legal_business_name='Benchmark Customer',
+                email='benchmark-order-ingestion@example.com'
+            )
+            frame = self.build_frame(random.Random(options['seed']), options['orders'], customer.id)
+
+            for label in ('insert', 'update'):
+                started = perf_counter()
+                orders, errors = validate_orders(frame)
+                validated = perf_counter()
+                created, updated = upsert_orders(
+                    orders, update_fields_for(frame.columns), batch_size=options['batch_size']
+                )
+                finished = perf_counter()
+
+                total = finished - started
+                self.stdout.write(
+                    f"{label}: {len(frame)} rows, {created} created, {updated} updated, {len(errors)} rejected\n"
+                    f"- validation: {validated - started:.2f}s\n"
+                    f"- upsert:     {finished - validated:.2f}s\n"
+                    f"- throughput: {len(frame) / total:,.0f} orders/s"
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def build_frame(rng, count, customer_id):
+        return pd.DataFrame({
+            'transaction_id': [str(800_000_000 + i) for i in range(count)],
+            'customer_id': [str(customer_id)] * count,
+            'reference_number': [f'REF-{i}' for i in range(count)],
+            'close_date': [f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00' for _ in range(count)],
+            'ship_to_name': [f'NAME {i}' for i in range(count)],
+            'ship_to_country': [rng.choice(['US', 'CA', 'MX']) for _ in range(count)],
+            'carrier': [rng.choice(['UPS', 'FedEx', 'USPS']) for _ in range(count)],
+            'weight_lb': [f'{rng.uniform(1, 100):.2f}' for _ in range(count)],
+            'packages': [str(rng.randint(1, 5)) for _ in range(count)],
+            'sku_quantity': [
+                json.dumps([
+                    {'sku': f'SKU-{rng.randint(0, 400)}', 'quantity': rng.randint(1, 10)}
+                    for _ in range(rng.randint(1, 5))
+                ])
+                for _ in range(count)
+            ],
+        }, dtype=object)
@@ -0,0 +1,118 @@
+# orders/management/commands/benchmark_order_list.py
+
+from decimal import Decimal
+from time import perf_counter
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.test import RequestFactory
+
+from customers.models import Customer
+from orders.models import Order
+from orders.views import OrderListView
+
+
+# The table body as rendered before column projection: full model instances
+# with a get_field lookup for every cell.
+LEGACY_ROWS = Template(
+    "{% load custom_filters %}"
+    "{% for order in orders %}<tr data-id=\"{{ order.transaction_id }}\">"
+    "{% for column in selected_columns %}<td>{{ order|get_field:column }}</td>{% endfor %}"
+    "</tr>{% endfor %}"
+)
+
+# The same table body rendered from the view's precomputed rows.
+PROJECTED_ROWS = Template(
+    "{% for transaction_id, cells in rows %}<tr data-id=\"{{ transaction_id }}\">"
+    "{% for value in cells %}<td>{{ value }}</td>{% endfor %}"
+    "</tr>{% endfor %}"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark rendering 100-row order list pages: projected rows against full model "
+        "instances with per-cell get_field lookups. Test orders are created inside a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000, help='Number of test orders')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--pages', type=int, default=20, help='Pages rendered per mode')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_orders(random.Random(options['seed']), options['orders'])
+            self.run(options['page_size'], options['pages'])
+            transaction.set_rollback(True)
+
+    def run(self, page_size, pages):
+        view = OrderListView.as_view(paginate_by=page_size)
+        factory = RequestFactory()
+        default_columns = [
+            col for col, props in OrderListView.COLUMN_DEFINITIONS.items() if props['default_visible']
+        ]
+        column_sets = {
+            'default columns': default_columns,
+            'all columns': list(OrderListView.COLUMN_DEFINITIONS),
+        }
+
+        for label, columns in column_sets.items():
+            # Legacy: every Order column loaded, one get_field call per cell
+            started = perf_counter()
+            queryset = Order.objects.select_related('customer').order_by('transaction_id')
+            for page in range(pages):
+                orders = list(queryset[page * page_size:(page + 1) * page_size])
+                LEGACY_ROWS.render(Context({'orders': orders, 'selected_columns': columns}))
+            legacy_time = perf_counter() - started
+
+            # Current: the view's projected rows and keyset pages
+            started = perf_counter()
+            cursor = None
+            for _ in range(pages):
+                params = {'columns': columns, 'sort': 'transaction_id'}
+                if cursor:
+                    params['cursor'] = cursor
+                context = view(factory.get('/orders/', params)).context_data
+                PROJECTED_ROWS.render(Context({'rows': context['rows']}))
+                cursor = context['page_obj'].next_cursor
+            projected_time = perf_counter() - started
+
+            self.stdout.write(
+                f"{label} ({len(columns)}), {pages} pages of {page_size} rows\n"
+                f"- full instances + get_field: {legacy_time / pages * 1000:.1f} ms/page\n"
+                f"- projected rows:             {projected_time / pages * 1000:.1f} ms/page\n"
+                f"- speedup:                    {legacy_time / projected_time:.1f}x"
+            )
+
+    @staticmethod
+    def create_orders(rng, count):
+        customer = Customer.objects.create(
+            company_name='Benchmark Customer',
+            legal_business_name='Benchmark Customer',
+            email='benchmark-order-list@example.com'
+        )
+        Order.objects.bulk_create(
+            Order(
+                transaction_id=900_000_000 + i,
+                customer=customer,
+                reference_number=f'REF-{i}',
+                ship_to_name=f'NAME {i}',
+                ship_to_city=rng.choice(['TORONTO', 'DALLAS', 'MONTERREY']),
+                ship_to_country=rng.choice(['US', 'CA', 'MX']),
+                carrier=rng.choice(['UPS', 'FedEx', 'USPS']),
+                notes='NOTES ' * 50,
+                weight_lb=Decimal(rng.randint(1, 100)),
+                line_items=rng.randint(1, 8),
+                total_item_qty=rng.randint(1, 50),
+                sku_quantity=[
+                    {'sku': f'SKU-{rng.randint(0, 400)}', 'quantity': rng.randint(1, 10)}
+                    for _ in range(rng.randint(1, 8))
+                ]
+            )
+            for i in range(count)
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_alter_customer_id'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['close_date', 'transaction_id'], name='order_close_date_seek_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['reference_number', 'transaction_id'], name='order_reference_seek_idx'),
+        ),
+    ]
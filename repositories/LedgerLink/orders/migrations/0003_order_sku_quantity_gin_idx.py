@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:05
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_order_seek_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['sku_quantity'], name='order_sku_quantity_gin_idx', opclasses=['jsonb_path_ops']),
+        ),
+    ]
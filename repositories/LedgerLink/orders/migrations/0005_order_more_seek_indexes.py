@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_alter_customer_id'),
+        ('orders', '0003_order_sku_quantity_gin_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['line_items', 'transaction_id'], name='order_line_items_seek_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_item_qty', 'transaction_id'], name='order_total_qty_seek_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['carrier', 'transaction_id'], name='order_carrier_seek_idx'),
+        ),
+    ]
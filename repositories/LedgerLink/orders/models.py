@@ -1,7 +1,84 @@
 # orders/models.py
 
+import json
+
+from django.contrib.postgres.indexes import GinIndex
+from django.core.exceptions import ValidationError
 from django.db import models
 from customers.models import Customer
+from products.models import normalize_sku
+
+
+def canonical_sku_quantity(value):
+    """
+    Return sku_quantity in its stored form: a list of {'sku', 'quantity'} items
+    with normalized SKUs, repeated SKUs merged and quantities as numbers (ints
+    when whole). Also accepts the legacy form, a JSON string. Raises ValueError
+    when the value cannot be read as SKU lines.
+    """
+    if value is None or value == '':
+        return None
+    # Legacy rows hold the list as a JSON string, sometimes encoded twice
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            # Text pasted with escaped quotes, which the order form has always accepted
+            try:
+                value = json.loads(value.replace('\\"', '"'))
+            except json.JSONDecodeError:
+                raise ValueError("Invalid JSON format")
+    if not isinstance(value, list):
+        raise ValueError("SKU quantity must be a list of items")
+
+    quantities = {}
+    for item in value:
+        if not isinstance(item, dict):
+            raise ValueError("Each SKU item must be an object")
+        if 'sku' not in item or 'quantity' not in item:
+            raise ValueError("Each SKU item must have 'sku' and 'quantity' fields")
+        sku = normalize_sku(str(item['sku']))
+        if not sku:
+            raise ValueError("SKU cannot be empty")
+        try:
+            quantity = float(item['quantity'])
+        except (TypeError, ValueError):
+            raise ValueError("Invalid quantity value")
+        if not quantity > 0:
+            raise ValueError("Quantity must be a positive number")
+        quantities[sku] = quantities.get(sku, 0) + quantity
+
+    return [
+        {'sku': sku, 'quantity': int(quantity) if quantity.is_integer() else quantity}
+        for sku, quantity in quantities.items()
+    ]
+
+
+def sku_lines(value):
+    """
+    sku_quantity as a list of {'sku', 'quantity'} items, for reading. Legacy
+    JSON strings are parsed; values that cannot be read give an empty list.
+    """
+    if isinstance(value, list):
+        return value
+    try:
+        return canonical_sku_quantity(value) or []
+    except ValueError:
+        return []
+
+
+def sku_quantity_total(sku_quantity):
+    """Total item quantity of canonical sku_quantity, rounded to a whole number."""
+    return round(sum(item['quantity'] for item in sku_quantity))
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_sku(self, sku):
+        """
+        Orders with a line for sku, matched in the database by JSON containment
+        (jsonb @> on PostgreSQL, served by order_sku_quantity_gin_idx).
+        """
+        return self.filter(sku_quantity__contains=[{'sku': normalize_sku(sku)}])
 
 
 class Order(models.Model):
@@ -26,5 +103,40 @@ class Order(models.Model):
     notes = models.TextField(blank=True, null=True)
     carrier = models.CharField(max_length=50, blank=True, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Seek indexes for the order list's default-visible sort columns. The
+            # customer name column sorts across a join and can't have one.
+            models.Index(fields=['close_date', 'transaction_id'], name='order_close_date_seek_idx'),
+            models.Index(fields=['reference_number', 'transaction_id'], name='order_reference_seek_idx'),
+            models.Index(fields=['line_items', 'transaction_id'], name='order_line_items_seek_idx'),
+            models.Index(fields=['total_item_qty', 'transaction_id'], name='order_total_qty_seek_idx'),
+            models.Index(fields=['carrier', 'transaction_id'], name='order_carrier_seek_idx'),
+            # JSON containment for Order.objects.with_sku()
+            GinIndex(fields=['sku_quantity'], opclasses=['jsonb_path_ops'], name='order_sku_quantity_gin_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.transaction_id} for {self.customer}"
+
+    def clean(self):
+        super().clean()
+        try:
+            self.sku_quantity = canonical_sku_quantity(self.sku_quantity)
+        except ValueError as e:
+            raise ValidationError({'sku_quantity': str(e)})
+
+    def save(self, *args, **kwargs):
+        try:
+            self.sku_quantity = canonical_sku_quantity(self.sku_quantity)
+        except ValueError:
+            # Saved as given; clean() reports it, and readers treat it as having no SKU lines
+            pass
+        if self.sku_quantity and isinstance(self.sku_quantity, list):
+            self.total_item_qty = sku_quantity_total(self.sku_quantity)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'sku_quantity' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'total_item_qty'}
+        super().save(*args, **kwargs)
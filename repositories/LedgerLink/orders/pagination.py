@@ -0,0 +1,226 @@
+# orders/pagination.py
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder without the truncation of times to milliseconds, which would
+    make a cursor land between rows less than a millisecond apart.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def keyset_ordering(sort_field, descending=False, tiebreaker='transaction_id'):
+    """
+    order_by() arguments for sorting on a column with a unique tiebreaker.
+    NULLs sort last ascending and first descending, matching KeysetPaginator.
+    """
+    fields = [tiebreaker] if sort_field == tiebreaker else [sort_field, tiebreaker]
+    if descending:
+        return [F(f).desc(nulls_first=True) for f in fields]
+    return [F(f).asc(nulls_last=True) for f in fields]
+
+
+class KeysetPage:
+    """
+    A page of results from KeysetPaginator.
+    Mirrors the parts of Django's Page used by templates, with cursors instead of page numbers.
+    """
+
+    def __init__(self, paginator, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Cursor (seek) pagination over a queryset ordered by one column plus a unique
+    tiebreaker column. Each page is fetched with a WHERE condition on the last
+    seen (value, tiebreaker) pair instead of an OFFSET. With an index on
+    (column, tiebreaker) a page is a short index range scan and costs the same
+    regardless of how deep it is; without one, every page still sorts the
+    matching rows, as it would with an OFFSET.
+
+    NULL values sort after all other values in ascending order (before them in
+    descending order), the same way on every database.
+
+    Cursors are opaque URL-safe tokens. 'last' is accepted as a cursor for the
+    final page. Cursors created for another sort column are ignored.
+    """
+
+    LAST = 'last'
+
+    def __init__(self, queryset, sort_field, descending=False, per_page=10,
+                 tiebreaker='transaction_id', count=None):
+        self.queryset = queryset
+        self.sort_field = sort_field
+        self.descending = descending
+        self.per_page = per_page
+        self.tiebreaker = tiebreaker
+        self._count = count
+
+    @property
+    def count(self):
+        """Total number of results. Uses the count callable given to the paginator if any."""
+        if callable(self._count):
+            self._count = self._count()
+        elif self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+
+    def _ordering(self, reverse=False):
+        return keyset_ordering(self.sort_field, self.descending != reverse, self.tiebreaker)
+
+    def _segments(self, start, ascending):
+        """
+        Conditions selecting the rows after start (value, pk), or all rows if start
+        is None, in the order they are walked: travelling in ascending order the
+        non-NULL values come before the NULLs. Each condition is a range on
+        (sort column, tiebreaker), so it can be read from the (column,
+        transaction_id) seek index without a sort. The NULLs are a separate
+        query rather than an OR that would defeat the index.
+        """
+        field, tiebreaker = self.sort_field, self.tiebreaker
+        if field == tiebreaker:
+            if start is None:
+                return [Q()]
+            return [Q(**{f'{tiebreaker}__gt' if ascending else f'{tiebreaker}__lt': start[1]})]
+
+        non_null, null = Q(**{f'{field}__isnull': False}), Q(**{f'{field}__isnull': True})
+        if start is None:
+            return [non_null, null] if ascending else [null, non_null]
+        value, pk = start
+        if value is None:
+            if ascending:
+                return [null & Q(**{f'{tiebreaker}__gt': pk})]
+            return [null & Q(**{f'{tiebreaker}__lt': pk}), non_null]
+        # (value, pk) row comparison, spelled so the leading bound is an index range
+        if ascending:
+            after = Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | Q(**{f'{tiebreaker}__gt': pk}))
+            return [after, null]
+        return [Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(**{f'{tiebreaker}__lt': pk}))]
+
+    def _rows(self, start, reverse, limit):
+        """Up to limit rows following start in page order, walking backwards if reverse."""
+        ordering = self._ordering(reverse=reverse)
+        rows = []
+        for condition in self._segments(start, ascending=self.descending == reverse):
+            rows.extend(self.queryset.filter(condition).order_by(*ordering)[:limit - len(rows)])
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def _key(self, obj):
+        # Named rows from values_list() carry related fields as flat attributes
+        if hasattr(obj, self.sort_field):
+            return getattr(obj, self.sort_field), getattr(obj, self.tiebreaker)
+        value = obj
+        for part in self.sort_field.split('__'):
+            value = getattr(value, part, None)
+            if value is None:
+                break
+        return value, getattr(obj, self.tiebreaker)
+
+    def encode_cursor(self, obj, backwards):
+        value, pk = self._key(obj)
+        payload = json.dumps([self.sort_field, value, pk, backwards], cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Return (value, pk, backwards) for a cursor, or None if it is invalid or stale.
+        Dates and times come back as the ISO strings they were encoded as, which
+        the field lookups in _after/_before parse at full precision.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            sort_field, value, pk, backwards = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError, binascii.Error):
+            return None
+        if sort_field != self.sort_field:
+            return None
+        return value, pk, bool(backwards)
+
+    def page(self, cursor=None):
+        """Return the KeysetPage for a cursor. A missing or invalid cursor returns the first page."""
+        size = self.per_page
+        decoded = self.decode_cursor(cursor) if cursor and cursor != self.LAST else None
+
+        if cursor == self.LAST:
+            rows = self._rows(None, True, size + 1)
+            has_previous, has_next = len(rows) > size, False
+            rows = rows[:size][::-1]
+        elif decoded is None:
+            rows = self._rows(None, False, size + 1)
+            has_previous, has_next = False, len(rows) > size
+            rows = rows[:size]
+        else:
+            value, pk, backwards = decoded
+            rows = self._rows((value, pk), backwards, size + 1)
+            if backwards:
+                has_previous, has_next = len(rows) > size, True
+                rows = rows[:size][::-1]
+            else:
+                has_previous, has_next = True, len(rows) > size
+                rows = rows[:size]
+
+        return KeysetPage(
+            self,
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self.encode_cursor(rows[-1], False) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0], True) if has_previous and rows else None,
+        )
+
+
+def estimated_count(queryset, cache_key, timeout=300):
+    """
+    Fast row count for an unfiltered queryset. On PostgreSQL this is the planner's
+    row estimate for the table (kept current by autovacuum/ANALYZE); elsewhere, or
+    if the table has never been analyzed, the exact count is cached for `timeout` seconds.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    return cache.get_or_set(cache_key, queryset.count, timeout)
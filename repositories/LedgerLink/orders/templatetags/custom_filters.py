@@ -44,13 +44,3 @@ def get_field(obj, field):
             current = current()
 
     return current
-
-@register.filter
-def parse_json(value):
-    """Parse JSON string into Python object"""
-    try:
-        if isinstance(value, str):
-            return json.loads(value)
-        return value
-    except (json.JSONDecodeError, TypeError):
-        return []
\ No newline at end of file
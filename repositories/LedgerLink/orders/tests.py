@@ -1,3 +1,405 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+import gzip
 
-# Create your tests here.
+from decimal import Decimal
+from io import StringIO
+
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, skipUnlessDBFeature
+from django.urls import reverse
+
+from customers.models import Customer
+from .ingestion import ingest_orders, validate_orders
+from .forms import OrderForm
+from .models import Order, canonical_sku_quantity, sku_lines
+from .pagination import KeysetPaginator
+
+
+class TestKeysetPagination(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [
+            Customer.objects.create(company_name=name, email=f"{name.lower()}@example.com")
+            for name in ("Acme", "Bravo", "Charlie")
+        ]
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for i in range(1, 24):
+            Order.objects.create(
+                transaction_id=1000 + i,
+                customer=cls.customers[i % 3],
+                reference_number=f"REF-{i % 5}",
+                # Repeated values and NULLs exercise the tiebreaker
+                close_date=None if i % 4 == 0 else base + timedelta(days=i % 6),
+                carrier=None if i % 7 == 0 else ("UPS", "FedEx")[i % 2],
+                total_item_qty=i % 3,
+            )
+
+    def walk(self, paginator):
+        """Follow next cursors from the first page, returning all rows in page order."""
+        rows, cursor, seen_pages = [], None, 0
+        while True:
+            page = paginator.page(cursor)
+            rows.extend(page.object_list)
+            seen_pages += 1
+            self.assertLessEqual(seen_pages, 20)
+            if not page.has_next():
+                return rows
+            cursor = page.next_cursor
+
+    def test_forward_pages_cover_every_order_once(self):
+        for field in ('transaction_id', 'customer__company_name', 'reference_number',
+                      'close_date', 'carrier', 'total_item_qty'):
+            for descending in (False, True):
+                with self.subTest(field=field, descending=descending):
+                    queryset = Order.objects.select_related('customer')
+                    paginator = KeysetPaginator(queryset, field, descending=descending, per_page=4)
+                    expected = list(queryset.order_by(*paginator._ordering()))
+                    self.assertEqual(self.walk(paginator), expected)
+
+    def test_nulls_sort_last_ascending(self):
+        paginator = KeysetPaginator(Order.objects.all(), 'close_date', per_page=50)
+        rows = paginator.page().object_list
+        dates = [order.close_date for order in rows]
+        first_null = dates.index(None)
+        self.assertTrue(all(d is None for d in dates[first_null:]))
+        self.assertEqual(dates[:first_null], sorted(dates[:first_null]))
+
+    def test_cursor_keeps_sub_millisecond_times(self):
+        base = datetime(2024, 2, 1, 12, tzinfo=timezone.utc)
+        for i in range(6):
+            Order.objects.create(
+                transaction_id=2000 + i,
+                customer=self.customers[0],
+                close_date=base + timedelta(microseconds=100 * i),
+            )
+        queryset = Order.objects.filter(transaction_id__gte=2000)
+        for descending in (False, True):
+            with self.subTest(descending=descending):
+                paginator = KeysetPaginator(queryset, 'close_date', descending=descending, per_page=2)
+                self.assertEqual(self.walk(paginator), list(queryset.order_by(*paginator._ordering())))
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = KeysetPaginator(Order.objects.all(), 'carrier', descending=True, per_page=5)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+
+        back = paginator.page(third.previous_cursor)
+        self.assertEqual(back.object_list, second.object_list)
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+
+        back = paginator.page(back.previous_cursor)
+        self.assertEqual(back.object_list, first.object_list)
+        self.assertFalse(back.has_previous())
+
+    def test_nulls_are_read_by_a_separate_query(self):
+        # 18 dated orders, then 5 without a close date
+        paginator = KeysetPaginator(Order.objects.all(), 'close_date', per_page=4)
+        with self.assertNumQueries(1):
+            page = paginator.page()
+        for _ in range(3):
+            page = paginator.page(page.next_cursor)
+        # The fifth page runs out of dated orders and continues with the NULLs
+        with self.assertNumQueries(2):
+            page = paginator.page(page.next_cursor)
+        self.assertEqual([order.close_date is None for order in page], [False, False, True, True])
+
+    def test_last_page(self):
+        paginator = KeysetPaginator(Order.objects.all(), 'close_date', per_page=5)
+        last = paginator.page(KeysetPaginator.LAST)
+        expected = list(Order.objects.order_by(*paginator._ordering()))[-5:]
+        self.assertEqual(last.object_list, expected)
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_invalid_or_stale_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Order.objects.all(), 'carrier', per_page=5)
+        cursor = paginator.page().next_cursor
+        other = KeysetPaginator(Order.objects.all(), 'close_date', per_page=5)
+        first = other.page()
+        self.assertEqual(other.page(cursor).object_list, first.object_list)
+        self.assertEqual(other.page('not-a-cursor').object_list, first.object_list)
+
+    def test_order_list_view(self):
+        cache.clear()
+        url = reverse('orders:order_list')
+        response = self.client.get(url, {'sort': 'close_date', 'direction': 'desc'})
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(len(page.object_list), 10)
+        self.assertTrue(response.context['count_is_estimate'])
+        self.assertEqual(page.paginator.count, 23)
+
+        response = self.client.get(url, {
+            'sort': 'close_date', 'direction': 'desc', 'cursor': page.next_cursor
+        })
+        second = response.context['page_obj']
+        ids = {o.transaction_id for o in page.object_list}
+        self.assertFalse(ids & {o.transaction_id for o in second.object_list})
+
+        response = self.client.get(url, {'customer': self.customers[0].id})
+        self.assertFalse(response.context['count_is_estimate'])
+        self.assertEqual(response.context['page_obj'].paginator.count, 7)
+
+    def test_order_list_rows_follow_selected_columns(self):
+        url = reverse('orders:order_list')
+        response = self.client.get(url, {
+            'columns': ['carrier', 'customer__company_name', 'bogus'],
+            'sort': 'transaction_id',
+        })
+        self.assertEqual(response.context['selected_columns'], ['carrier', 'customer__company_name'])
+        transaction_id, cells = response.context['rows'][0]
+        order = Order.objects.select_related('customer').get(transaction_id=transaction_id)
+        self.assertEqual(transaction_id, 1001)
+        self.assertEqual(cells, [order.carrier, order.customer.company_name])
+        # Only the projected fields are fetched
+        self.assertEqual(
+            response.context['page_obj'].object_list[0]._fields,
+            ('transaction_id', 'carrier', 'customer__company_name')
+        )
+        self.assertContains(response, order.customer.company_name)
+
+
+class TestOrderExport(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(company_name="Acme", email="acme@example.com")
+        other = Customer.objects.create(company_name="Bravo", email="bravo@example.com")
+        Order.objects.create(
+            transaction_id=2001, customer=cls.customer, reference_number="REF-1", carrier="UPS",
+            sku_quantity=[{"sku": "ABC-1", "quantity": 2}, {"sku": "ABC-2", "quantity": 5}]
+        )
+        Order.objects.create(transaction_id=2002, customer=cls.customer, reference_number="REF-2")
+        Order.objects.create(
+            transaction_id=2003, customer=other, reference_number="REF-3",
+            sku_quantity=[{"sku": "XYZ", "quantity": 1}]
+        )
+
+    def export(self, params):
+        response = self.client.get(reverse('orders:order_export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_export_expands_sku_lines_and_applies_filters(self):
+        response, content = self.export({
+            'customer': self.customer.id,
+            'columns': ['transaction_id', 'reference_number'],
+            'sort': 'transaction_id', 'direction': 'desc',
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(content.decode().splitlines(), [
+            'Transaction ID,Reference,SKU,Quantity',
+            '2002,REF-2,,',
+            '2001,REF-1,ABC-1,2',
+            '2001,REF-1,ABC-2,5',
+        ])
+
+    def test_gzip_export(self):
+        _, plain = self.export({'columns': ['transaction_id', 'customer__company_name']})
+        response, compressed = self.export({'columns': ['transaction_id', 'customer__company_name'], 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('orders.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertIn(b'2003,Bravo,XYZ,1', plain)
+
+
+class TestOrderIngestion(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(company_name="Acme", email="acme@example.com")
+
+    def test_validate_normalizes_rows(self):
+        frame = pd.DataFrame([{
+            'transaction_id': '3001', 'customer_id': str(self.customer.id), 'reference_number': ' REF-1 ',
+            'close_date': '2024-03-01 10:30', 'weight_lb': '12.50', 'packages': '2', 'carrier': '',
+            'sku_quantity': '[{"sku": " ABC-1 ", "quantity": "2"}, {"sku": "ABC-2", "quantity": 1.5}]',
+        }])
+        orders, errors = validate_orders(frame)
+        self.assertEqual(errors, [])
+        order = orders[0]
+        self.assertEqual(order.transaction_id, 3001)
+        self.assertEqual(order.reference_number, 'REF-1')
+        self.assertEqual(order.close_date, datetime(2024, 3, 1, 10, 30, tzinfo=timezone.utc))
+        self.assertEqual(order.weight_lb, Decimal('12.50'))
+        self.assertEqual(order.packages, 2)
+        self.assertIsNone(order.carrier)
+        self.assertEqual(order.sku_quantity, [{'sku': 'ABC-1', 'quantity': 2}, {'sku': 'ABC-2', 'quantity': 1.5}])
+
+    def test_validate_reports_row_errors(self):
+        rows = [
+            {'transaction_id': 'x', 'customer_id': self.customer.id, 'reference_number': 'A'},
+            {'transaction_id': 2, 'customer_id': 999, 'reference_number': ''},
+            {'transaction_id': 3, 'customer_id': self.customer.id, 'reference_number': 'C',
+             'sku_quantity': [{'sku': 'A', 'quantity': 0}], 'packages': '1.5'},
+            {'transaction_id': 4, 'customer_id': self.customer.id, 'reference_number': 'D',
+             'sku_quantity': 'not json', 'close_date': 'someday'},
+            {'transaction_id': 5, 'customer_id': self.customer.id, 'reference_number': 'E'},
+            {'transaction_id': 5, 'customer_id': self.customer.id, 'reference_number': 'E2'},
+        ]
+        orders, errors = validate_orders(pd.DataFrame(rows))
+        self.assertEqual([o.reference_number for o in orders], ['E2'])
+        by_row = {e['row']: e['errors'] for e in errors}
+        self.assertEqual(by_row[1], ['transaction_id: must be an integer'])
+        self.assertEqual(set(by_row[2]), {'customer_id: customer does not exist', 'reference_number: required'})
+        self.assertEqual(set(by_row[3]), {'packages: must be a whole number',
+                                          'sku_quantity: quantity must be a positive number'})
+        self.assertEqual(set(by_row[4]), {'close_date: invalid date', 'sku_quantity: must be a JSON list'})
+        self.assertEqual(by_row[5], ['transaction_id: duplicated by a later row'])
+
+    def test_ingest_upserts_in_batches(self):
+        Order.objects.create(transaction_id=1, customer=self.customer, reference_number='OLD', carrier='UPS')
+        rows = [
+            {'transaction_id': i, 'customer_id': self.customer.id, 'reference_number': f'NEW-{i}'}
+            for i in range(1, 8)
+        ]
+        result = ingest_orders(pd.DataFrame(rows), batch_size=3)
+        self.assertEqual((result['total'], result['created'], result['updated']), (7, 6, 1))
+        self.assertEqual(Order.objects.count(), 7)
+        order = Order.objects.get(transaction_id=1)
+        self.assertEqual(order.reference_number, 'NEW-1')
+        # Columns missing from the input keep their stored values
+        self.assertEqual(order.carrier, 'UPS')
+
+        ingest_orders(pd.DataFrame([{**rows[0], 'carrier': ''}]))
+        self.assertIsNone(Order.objects.get(transaction_id=1).carrier)
+
+    def test_upload_view(self):
+        content = (
+            'transaction_id,customer_id,reference_number,sku_quantity\n'
+            f'10,{self.customer.id},R10,"[{{""sku"": ""S1"", ""quantity"": 3}}]"\n'
+            f'11,{self.customer.id},,\n'
+        ).encode()
+        response = self.client.post(reverse('orders:order_upload'), {
+            'file': SimpleUploadedFile('orders.csv', content, content_type='text/csv')
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result']['created'], 1)
+        self.assertEqual(response.context['result']['errors'][0]['row'], 2)
+        self.assertEqual(Order.objects.get(transaction_id=10).sku_quantity, [{'sku': 'S1', 'quantity': 3}])
+
+    def test_batch_api(self):
+        url = reverse('orders:order_batch')
+        batch = {'orders': [
+            {'transaction_id': 20, 'customer': self.customer.id, 'reference_number': 'R20',
+             'sku_quantity': [{'sku': 'S1', 'quantity': 1}]},
+            {'transaction_id': 21, 'customer': self.customer.id},
+        ]}
+        response = self.client.post(url, batch, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user('importer', password='secret'))
+        response = self.client.post(url, batch, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'][0]['transaction_id'], 21)
+
+        response = self.client.post(url, {'orders': 'nope'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_validate_merges_sku_lines_and_derives_total(self):
+        frame = pd.DataFrame([{
+            'transaction_id': '3002', 'customer_id': str(self.customer.id), 'reference_number': 'R',
+            'total_item_qty': '99', 'sku_quantity': '[{"sku": "abc 1", "quantity": 2}, {"sku": "ABC1", "quantity": 3}]',
+        }])
+        orders, errors = validate_orders(frame)
+        self.assertEqual(errors, [])
+        self.assertEqual(orders[0].sku_quantity, [{'sku': 'ABC1', 'quantity': 5}])
+        self.assertEqual(orders[0].total_item_qty, 5)
+
+
+class TestCanonicalSkuQuantity(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(company_name="Acme", email="acme@example.com")
+
+    def test_canonical_form(self):
+        self.assertEqual(
+            canonical_sku_quantity('[{"sku": " ab-1 ", "quantity": "2"}, {"sku": "AB-1", "quantity": 1.5}]'),
+            [{'sku': 'AB-1', 'quantity': 3.5}]
+        )
+        self.assertEqual(canonical_sku_quantity('"[{\\"sku\\": \\"X\\", \\"quantity\\": 1}]"'),
+                         [{'sku': 'X', 'quantity': 1}])
+        self.assertIsNone(canonical_sku_quantity(''))
+        for value in ('not json', {'sku': 'X'}, [{'sku': 'X'}], [{'sku': ' ', 'quantity': 1}],
+                      [{'sku': 'X', 'quantity': 0}], [{'sku': 'X', 'quantity': 'many'}]):
+            with self.assertRaises(ValueError):
+                canonical_sku_quantity(value)
+
+    def test_save_stores_list_and_total(self):
+        order = Order.objects.create(transaction_id=1, customer=self.customer, reference_number='R',
+                                     sku_quantity='[{"sku": "a", "quantity": 2}, {"sku": "b", "quantity": 3}]')
+        order.refresh_from_db()
+        self.assertEqual(order.sku_quantity, [{'sku': 'A', 'quantity': 2}, {'sku': 'B', 'quantity': 3}])
+        self.assertEqual(order.total_item_qty, 5)
+
+    def test_invalid_value_is_saved_unchanged_and_rejected_by_clean(self):
+        order = Order(transaction_id=1, customer=self.customer, reference_number='R', sku_quantity='not json')
+        order.save()
+        order.refresh_from_db()
+        self.assertEqual(order.sku_quantity, 'not json')
+        with self.assertRaises(ValidationError) as raised:
+            order.full_clean()
+        self.assertIn('sku_quantity', raised.exception.message_dict)
+
+    def test_readers_accept_legacy_strings(self):
+        from billing.billing_calculator import convert_sku_format
+
+        Order.objects.create(transaction_id=1, customer=self.customer, reference_number='R')
+        Order.objects.filter(transaction_id=1).update(sku_quantity='[{"sku": "s 1", "quantity": 2}]')
+        order = Order.objects.get(transaction_id=1)
+        self.assertEqual(sku_lines(order.sku_quantity), [{'sku': 'S1', 'quantity': 2}])
+        self.assertEqual(sku_lines('not json'), [])
+        self.assertEqual(convert_sku_format(order.sku_quantity), {'S1': 2.0})
+
+        response = self.client.get(reverse('orders:order_export'))
+        self.assertIn('S1,2', b''.join(response.streaming_content).decode())
+        response = self.client.get(reverse('orders:order_download', args=[1]))
+        self.assertIn('S1,2', response.content.decode())
+
+    def test_form_cleans_to_list(self):
+        form = OrderForm(data={
+            'transaction_id': 2, 'customer': self.customer.id, 'reference_number': 'R',
+            'sku_quantity': '[{"sku": "x-1", "quantity": "4"}]',
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['sku_quantity'], [{'sku': 'X-1', 'quantity': 4}])
+
+        form = OrderForm(data={'transaction_id': 3, 'customer': self.customer.id, 'reference_number': 'R',
+                               'sku_quantity': '[{"sku": "x-1"}]'})
+        self.assertIn('sku_quantity', form.errors)
+
+    def test_backfill_rewrites_legacy_rows(self):
+        for transaction_id in range(1, 6):
+            Order.objects.create(transaction_id=transaction_id, customer=self.customer, reference_number='R')
+        # Legacy rows, written around save() the way the old form stored them
+        Order.objects.filter(transaction_id__in=[2, 4]).update(
+            sku_quantity='[{"sku": "s 1", "quantity": 2.0}]', total_item_qty=None
+        )
+        Order.objects.filter(transaction_id=5).update(sku_quantity='not json')
+
+        out = StringIO()
+        call_command('backfill_sku_quantity', batch_size=2, after=2, stdout=out)
+        self.assertIn('2 scanned, 1 rewritten, 1 invalid', out.getvalue())
+        self.assertEqual(Order.objects.get(transaction_id=2).sku_quantity, '[{"sku": "s 1", "quantity": 2.0}]')
+        order = Order.objects.get(transaction_id=4)
+        self.assertEqual((order.sku_quantity, order.total_item_qty), ([{'sku': 'S1', 'quantity': 2}], 2))
+        self.assertEqual(Order.objects.get(transaction_id=5).sku_quantity, 'not json')
+
+        call_command('backfill_sku_quantity', stdout=StringIO())
+        self.assertEqual(Order.objects.get(transaction_id=2).sku_quantity, [{'sku': 'S1', 'quantity': 2}])
+
+    @skipUnlessDBFeature('supports_json_field_contains')
+    def test_with_sku(self):
+        Order.objects.create(transaction_id=1, customer=self.customer, reference_number='R',
+                             sku_quantity=[{'sku': 'A-1', 'quantity': 1}, {'sku': 'B-2', 'quantity': 1}])
+        Order.objects.create(transaction_id=2, customer=self.customer, reference_number='R',
+                             sku_quantity=[{'sku': 'B-2', 'quantity': 1}])
+        self.assertEqual(list(Order.objects.with_sku('a-1').values_list('pk', flat=True)), [1])
+        self.assertEqual(Order.objects.with_sku('B-2').count(), 2)
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (
     OrderListView, OrderDetailView, OrderCreateView,
-    OrderUpdateView, OrderDeleteView, OrderDownloadView
+    OrderUpdateView, OrderDeleteView, OrderDownloadView, OrderExportView,
+    OrderUploadView, order_batch
 )
 
 app_name = 'orders'
@@ -10,6 +11,9 @@ urlpatterns = [
     path('', OrderListView.as_view(), name='order_list'),
     path('<int:transaction_id>/', OrderDetailView.as_view(), name='order_detail'),
     path('create/', OrderCreateView.as_view(), name='order_create'),
+    path('export/', OrderExportView.as_view(), name='order_export'),
+    path('upload/', OrderUploadView.as_view(), name='order_upload'),
+    path('api/batch/', order_batch, name='order_batch'),
     path('<int:transaction_id>/edit/', OrderUpdateView.as_view(), name='order_update'),
     path('<int:transaction_id>/delete/', OrderDeleteView.as_view(), name='order_delete'),
     path('<int:transaction_id>/download/', OrderDownloadView.as_view(), name='order_download'),
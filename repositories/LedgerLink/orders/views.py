@@ -2,13 +2,23 @@ from django.urls import reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib import messages
 from django.db.models import Q
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
 from django.views import View
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
 import json
 import csv
-from .models import Order
-from .forms import OrderForm
+import zlib
+import pandas as pd
+from .models import Order, sku_lines
+from .forms import OrderForm, OrderUploadForm
+from .ingestion import ingest_orders, read_order_file
+from .pagination import KeysetPaginator, estimated_count, keyset_ordering
 from customers.models import Customer
+from Main.models import UploadJob
 
 class OrderListView(ListView):
     template_name = 'orders/order_list.html'
@@ -179,16 +189,37 @@ class OrderListView(ListView):
         ]
     }
 
+    def get_sort(self):
+        """Return the (field, descending) pair to order by. Defaults to transaction ID."""
+        sort_field = self.request.GET.get('sort')
+        if not sort_field or not self.COLUMN_DEFINITIONS.get(sort_field, {}).get('sortable'):
+            sort_field = 'transaction_id'
+        return sort_field, self.request.GET.get('direction', 'asc') == 'desc'
+
+    def get_selected_columns(self):
+        """Columns requested for display, in request order. Unknown names are dropped."""
+        default_columns = [
+            col for col, props in self.COLUMN_DEFINITIONS.items()
+            if props.get('default_visible', False)
+        ]
+        columns = self.request.GET.getlist('columns', default_columns)
+        return [col for col in columns if col in self.COLUMN_DEFINITIONS]
+
+    def get_projection(self):
+        """Fields fetched for each row: the transaction ID, the selected columns and the sort key."""
+        sort_field, _ = self.get_sort()
+        return list(dict.fromkeys(['transaction_id', *self.get_selected_columns(), sort_field]))
+
     def get_queryset(self):
-        queryset = Order.objects.select_related('customer')
+        """
+        Filtered orders as named rows holding only the fields in get_projection(),
+        so wide columns such as notes and sku_quantity are never loaded.
+        """
+        return self.get_filtered_queryset().values_list(*self.get_projection(), named=True)
 
-        # Apply sorting
-        sort_field = self.request.GET.get('sort')
-        sort_direction = self.request.GET.get('direction', 'asc')
-        if sort_field and sort_field in self.COLUMN_DEFINITIONS:
-            if sort_direction == 'desc':
-                sort_field = f'-{sort_field}'
-            queryset = queryset.order_by(sort_field)
+    def get_filtered_queryset(self):
+        queryset = Order.objects.all()
+        self.is_filtered = False
 
         # Apply filters
         filters = self.request.GET.getlist('filter')
@@ -223,6 +254,7 @@ class OrderListView(ListView):
 
             if combined_filter:
                 queryset = queryset.filter(combined_filter)
+                self.is_filtered = True
 
         # Apply search
         search_query = self.request.GET.get('q')
@@ -239,21 +271,49 @@ class OrderListView(ListView):
             for field in search_fields:
                 search_filter |= Q(**{field: search_query})
             queryset = queryset.filter(search_filter)
+            self.is_filtered = True
 
         # Apply customer filter
         customer_id = self.request.GET.get('customer')
         if customer_id:
             queryset = queryset.filter(customer_id=customer_id)
+            self.is_filtered = True
 
         # Apply date range filter
         date_from = self.request.GET.get('date_from')
         date_to = self.request.GET.get('date_to')
         if date_from:
             queryset = queryset.filter(close_date__gte=date_from)
+            self.is_filtered = True
         if date_to:
             queryset = queryset.filter(close_date__lte=date_to)
-
-        return queryset.distinct()
+            self.is_filtered = True
+
+        # Every filter is on the order or its customer (a single-valued relation),
+        # so rows cannot be duplicated and DISTINCT is not needed.
+        return queryset
+
+    def get_count(self, queryset):
+        """
+        Row count shown with the pagination controls. Unfiltered listings use the
+        table estimate, since an exact COUNT(*) scans the whole orders table.
+        """
+        if getattr(self, 'is_filtered', True):
+            return queryset.count
+        return lambda: estimated_count(queryset, 'orders:order_list:count')
+
+    def paginate_queryset(self, queryset, page_size):
+        """Paginate with cursors on (sort column, transaction ID) instead of page numbers."""
+        sort_field, descending = self.get_sort()
+        paginator = KeysetPaginator(
+            queryset,
+            sort_field,
+            descending=descending,
+            per_page=page_size,
+            count=self.get_count(queryset)
+        )
+        page = paginator.page(self.request.GET.get('cursor'))
+        return paginator, page, page.object_list, page.has_other_pages()
 
     def _build_filter_condition(self, field, operator, value, value2=None):
         """Build Q object for filtering based on field type and operator."""
@@ -354,17 +414,21 @@ class OrderListView(ListView):
         context['customers'] = Customer.objects.all()
 
         # Get selected columns
-        default_columns = [
-            col for col, props in self.COLUMN_DEFINITIONS.items()
-            if props.get('default_visible', False)
+        selected_columns = self.get_selected_columns()
+        context['selected_columns'] = selected_columns
+
+        # Precompute the cells of each row so the template doesn't look up fields per cell
+        context['rows'] = [
+            (row.transaction_id, [getattr(row, column) for column in selected_columns])
+            for row in context['object_list']
         ]
-        context['selected_columns'] = self.request.GET.getlist('columns', default_columns)
 
         # Add current sort information
         context['current_sort'] = {
             'field': self.request.GET.get('sort', ''),
             'direction': self.request.GET.get('direction', 'asc')
         }
+        context['count_is_estimate'] = not getattr(self, 'is_filtered', True)
 
         # Add current filters
         context['current_filters'] = []
@@ -482,11 +546,139 @@ class OrderDownloadView(View):
         writer.writerow(['Carrier', order.carrier])
         writer.writerow([])
 
-        if order.sku_quantity:
+        items = sku_lines(order.sku_quantity)
+        if items:
             writer.writerow(['SKU Details'])
             writer.writerow(['SKU', 'Quantity'])
-            sku_data = json.loads(order.sku_quantity) if isinstance(order.sku_quantity, str) else order.sku_quantity
-            for item in sku_data:
+            for item in items:
                 writer.writerow([item['sku'], item['quantity']])
 
-        return response
\ No newline at end of file
+        return response
+
+class OrderUploadView(View):
+    form_class = OrderUploadForm
+    template_name = 'orders/order_upload.html'
+
+    def get(self, request):
+        form = self.form_class()
+        return render(request, self.template_name, {'form': form})
+
+    def post(self, request):
+        form = self.form_class(request.POST, request.FILES)
+        if form.is_valid():
+            file = request.FILES['file']
+            if form.cleaned_data.get('background'):
+                job = UploadJob.objects.create(
+                    kind='orders', file=file, original_name=file.name,
+                    created_by=request.user if request.user.is_authenticated else None,
+                )
+                messages.info(request, f'{file.name} will be processed in the background.')
+                return redirect('main:upload_job', pk=job.pk)
+
+            result = None
+            try:
+                result = ingest_orders(read_order_file(file))
+                messages.success(
+                    request,
+                    f"Processed {result['total']} rows: {result['created']} orders created, "
+                    f"{result['updated']} updated, {len(result['errors'])} rejected."
+                )
+            except Exception as e:
+                messages.error(request, f'Error processing file: {str(e)}')
+
+            return render(request, self.template_name, {'form': form, 'result': result})
+        return render(request, self.template_name, {'form': form})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def order_batch(request):
+    """
+    Create or update a batch of orders, keyed on transaction_id.
+    Accepts a JSON list of orders or {"orders": [...]} and returns counts plus per-row errors.
+    """
+    orders = request.data.get('orders') if isinstance(request.data, dict) else request.data
+    if not isinstance(orders, list) or not all(isinstance(row, dict) for row in orders):
+        return Response(
+            {'error': 'Expected a list of order objects'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        result = ingest_orders(pd.DataFrame.from_records(orders))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+
+class Echo:
+    """File-like object whose write() returns the value, so csv.writer output can be streamed."""
+
+    def write(self, value):
+        return value
+
+
+class OrderExportView(OrderListView):
+    """
+    Stream every order matching the list's filters, search and sort as CSV, one
+    row per SKU line. Rows are read with a database cursor and written in small
+    buffered chunks, so memory use does not grow with the number of orders.
+    Pass gzip=1 to compress the stream.
+    """
+    chunk_size = 2000
+    buffer_size = 64 * 1024
+
+    def get(self, request, *args, **kwargs):
+        columns = self.get_selected_columns() or list(self.COLUMN_DEFINITIONS)
+        sort_field, descending = self.get_sort()
+        queryset = (
+            self.get_filtered_queryset()
+            .order_by(*keyset_ordering(sort_field, descending))
+            .values_list(*columns, 'sku_quantity')
+        )
+        header = [self.COLUMN_DEFINITIONS[col]['label'] for col in columns] + ['SKU', 'Quantity']
+
+        chunks = self.buffered(self.csv_lines(header, queryset.iterator(chunk_size=self.chunk_size)))
+        filename = 'orders.csv'
+        if request.GET.get('gzip'):
+            chunks = self.gzipped(chunks)
+            filename += '.gz'
+            response = StreamingHttpResponse(chunks, content_type='application/gzip')
+        else:
+            response = StreamingHttpResponse(chunks, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def csv_lines(header, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            *values, sku_quantity = row
+            items = sku_lines(sku_quantity)
+            if not items:
+                yield writer.writerow(values + ['', ''])
+                continue
+            for item in items:
+                yield writer.writerow(values + [item['sku'], item['quantity']])
+
+    def buffered(self, lines):
+        """Join CSV lines into chunks of about buffer_size characters."""
+        buffer, size = [], 0
+        for line in lines:
+            buffer.append(line)
+            size += len(line)
+            if size >= self.buffer_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+
+    @staticmethod
+    def gzipped(chunks):
+        compressor = zlib.compressobj(wbits=31)  # gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode())
+            if data:
+                yield data
+        yield compressor.flush()
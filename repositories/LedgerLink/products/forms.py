@@ -50,12 +50,31 @@ class ProductUploadForm(forms.Form):
         label='Choose File',
         help_text='Upload a CSV or Excel file containing product information.'
     )
+    dry_run = forms.BooleanField(
+        required=False,
+        label='Dry run',
+        help_text='Validate the file and report what would change without saving anything.'
+    )
+    background = forms.BooleanField(
+        required=False,
+        label='Process in the background',
+        help_text='Store the file and process it in the background. Use this for large files.'
+    )
 
     def clean_file(self):
         file = self.cleaned_data.get('file')
         if file:
             if not file.name.endswith(('.csv', '.xlsx')):
                 raise forms.ValidationError('Only CSV and Excel files are supported.')
-            if file.size > 10 * 1024 * 1024:  # 10MB limit
-                raise forms.ValidationError('File size must be under 10MB.')
-        return file
\ No newline at end of file
+        return file
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file = cleaned_data.get('file')
+        if file:
+            if cleaned_data.get('background'):
+                if file.size > 1024 * 1024 * 1024:  # 1GB limit
+                    self.add_error('file', 'File size must be under 1GB.')
+            elif file.size > 10 * 1024 * 1024:  # 10MB limit
+                self.add_error('file', 'File size must be under 10MB. Larger files can be processed in the background.')
+        return cleaned_data
\ No newline at end of file
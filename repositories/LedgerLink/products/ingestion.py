@@ -0,0 +1,142 @@
+# products/ingestion.py
+
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from customers.models import Customer
+from Main.ingestion import RowErrors, clean_text, read_chunks, to_number
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['sku', 'customer_id']
+LABELING_UNITS = [f'labeling_unit_{i}' for i in range(1, 6)]
+LABELING_QUANTITIES = [f'labeling_quantity_{i}' for i in range(1, 6)]
+UPDATE_FIELDS = ['sku'] + LABELING_UNITS + LABELING_QUANTITIES + ['updated_at']
+
+
+def validate_products(frame, first_row=1):
+    """
+    Validate a chunk of product rows column by column.
+
+    Returns (products, results): unsaved Product instances for the valid rows,
+    each with a `row` attribute, and error entries in the upload report format
+    ({'row', 'sku', 'status', 'message'}). Row numbers start at first_row.
+    """
+    frame = frame.rename(columns=lambda c: str(c).strip().lower()).reset_index(drop=True)
+    missing = [col for col in REQUIRED_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+    errors = RowErrors()
+    size = len(frame)
+
+    def column(name):
+        if name in frame.columns:
+            return frame[name]
+        return pd.Series([None] * size, dtype=object)
+
+    skus = clean_text(column('sku'))
+    errors.add(skus.isna(), 'sku is required')
+    errors.add(skus.str.len().fillna(0) > 100, 'sku is longer than 100 characters')
+
+    customer_ids = to_number(clean_text(column('customer_id')))
+    known_customers = set(Customer.objects.filter(
+        id__in=customer_ids.dropna().astype('int64').unique().tolist()
+    ).values_list('id', flat=True))
+    errors.add(~customer_ids.isin(known_customers), 'Customer does not exist')
+
+    values = {}
+    for name in LABELING_UNITS:
+        units = clean_text(column(name))
+        errors.add(units.str.len().fillna(0) > 50, f'{name} is longer than 50 characters')
+        values[name] = units.astype(object).where(units.notna(), None).tolist()
+    for name in LABELING_QUANTITIES:
+        raw = clean_text(column(name))
+        quantities = to_number(raw)
+        errors.add(raw.notna() & (quantities.isna() | (quantities % 1 > 0) | (quantities < 0)),
+                   f'{name} must be a non-negative whole number')
+        values[name] = [None if np.isnan(q) else int(q) for q in quantities.tolist()]
+
+    # Same rule as normalize_sku: drop all whitespace and uppercase
+    normalized = skus.str.replace(r'\s+', '', regex=True).str.upper()
+    keys = pd.DataFrame({'sku': normalized, 'customer_id': customer_ids})
+    errors.add(skus.notna() & keys.duplicated(keep='last'), 'Duplicate SKU for this customer; a later row is used')
+
+    sku_list = skus.astype(object).where(skus.notna(), None).tolist()
+    normalized_list = normalized.astype(object).where(normalized.notna(), None).tolist()
+    customer_id_list = customer_ids.tolist()
+    products = []
+    results = []
+    for position in range(size):
+        if position in errors:
+            results.append({
+                'row': first_row + position,
+                'sku': sku_list[position] or 'Unknown',
+                'status': 'error',
+                'message': '; '.join(errors.messages[position]),
+            })
+            continue
+        product = Product(
+            sku=sku_list[position],
+            normalized_sku=normalized_list[position],
+            customer_id=int(customer_id_list[position]),
+            **{name: values[name][position] for name in LABELING_UNITS + LABELING_QUANTITIES}
+        )
+        product.row = first_row + position
+        products.append(product)
+
+    return products, results
+
+
+def upsert_products(products, batch_size=1000, dry_run=False):
+    """
+    Insert or update products on (customer, normalized SKU) in batches, each in
+    its own transaction, so an upload may change the spelling of an existing
+    SKU. With dry_run nothing is written, but the report still says
+    which products would be created or updated.
+    """
+    results = []
+    for start in range(0, len(products), batch_size):
+        batch = products[start:start + batch_size]
+        with transaction.atomic():
+            existing = set(Product.objects.filter(
+                customer_id__in={product.customer_id for product in batch},
+                normalized_sku__in={product.normalized_sku for product in batch},
+            ).values_list('normalized_sku', 'customer_id'))
+            if not dry_run:
+                Product.objects.bulk_create(
+                    batch,
+                    update_conflicts=True,
+                    unique_fields=['customer', 'normalized_sku'],
+                    update_fields=UPDATE_FIELDS,
+                )
+        for product in batch:
+            updated = (product.normalized_sku, product.customer_id) in existing
+            results.append({
+                'row': product.row,
+                'sku': product.sku,
+                'status': 'success',
+                'message': 'Product updated' if updated else 'Product created',
+            })
+    return results
+
+
+def import_products(file, dry_run=False, chunk_size=5000, batch_size=1000):
+    """
+    Validate and upsert a product file chunk by chunk.
+    Returns the per-row report, ordered by row number.
+    """
+    results = []
+    first_row = 1
+    for frame in read_chunks(file, chunk_size=chunk_size):
+        products, errors = validate_products(frame, first_row=first_row)
+        results.extend(errors)
+        results.extend(upsert_products(products, batch_size=batch_size, dry_run=dry_run))
+        first_row += len(frame)
+    results.sort(key=lambda result: result['row'])
+    logger.info(f"Processed {len(results)} product rows{' (dry run)' if dry_run else ''}")
+    return results
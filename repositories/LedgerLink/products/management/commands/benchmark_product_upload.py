@@ -0,0 +1,75 @@
+# products/management/commands/benchmark_product_upload.py
+
+from io import BytesIO
+from time import perf_counter
+import random
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.models import Customer
+from products.ingestion import import_products
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark product uploads: the chunked bulk upsert against the previous per-row "
+        "update_or_create loop (timed on a sample and extrapolated). Runs inside a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Rows in the generated CSV')
+        parser.add_argument('--legacy-rows', type=int, default=2000, help='Rows timed with update_or_create')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                company_name='Benchmark Customer',
+                legal_business_name='Benchmark Customer',
+                email='benchmark-product-upload@example.com'
+            )
+            content = self.build_csv(rng, options['rows'], customer.id)
+
+            for label in ('insert', 'update'):
+                started = perf_counter()
+                result = import_products(SimpleUploadedFile('products.csv', content))
+                elapsed = perf_counter() - started
+                errors = sum(1 for item in result if item['status'] == 'error')
+                self.stdout.write(
+                    f"bulk {label}: {len(result)} rows, {errors} errors in {elapsed:.2f}s "
+                    f"({len(result) / elapsed:,.0f} rows/s)"
+                )
+
+            legacy_rows = options['legacy_rows']
+            started = perf_counter()
+            for i in range(legacy_rows):
+                Product.objects.update_or_create(
+                    sku=f'LEGACY-{i}',
+                    customer_id=customer.id,
+                    defaults={'labeling_unit_1': 'Box', 'labeling_quantity_1': i % 50}
+                )
+            elapsed = perf_counter() - started
+            rate = legacy_rows / elapsed
+            self.stdout.write(
+                f"update_or_create: {legacy_rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/s), "
+                f"about {options['rows'] / rate:.0f}s for {options['rows']} rows"
+            )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def build_csv(rng, rows, customer_id):
+        out = BytesIO()
+        out.write(b'sku,customer_id,' + ','.join(
+            f'labeling_unit_{i},labeling_quantity_{i}' for i in range(1, 6)
+        ).encode() + b'\n')
+        for i in range(rows):
+            labels = ','.join(
+                f"{rng.choice(['Box', 'Case', 'Pallet'])},{rng.randint(1, 100)}" for _ in range(5)
+            )
+            out.write(f'SKU-{i:06d},{customer_id},{labels}\n'.encode())
+        return out.getvalue()
@@ -0,0 +1,66 @@
+# products/management/commands/benchmark_sku_search.py
+
+from statistics import median
+from time import perf_counter
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from customer_services.views import get_customer_skus, search_customer_skus
+from customers.models import Customer
+from products.models import Product
+from products.sku_index import get_sku_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark SKU typeahead: builds the in-memory index for a generated catalog, "
+        "then times search requests against the full-list endpoint. Runs inside a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skus', type=int, default=200000, help='Products in the generated catalog')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                company_name='Benchmark Customer',
+                legal_business_name='Benchmark Customer',
+                email='benchmark-sku-search@example.com'
+            )
+            prefixes = ['ABO', 'BOX', 'CASE', 'PAL', 'TOTE', 'XYZ']
+            Product.objects.bulk_create([
+                Product(sku=sku, normalized_sku=sku, customer=customer)
+                for sku in (f'{rng.choice(prefixes)}-{i:06d}' for i in range(options['skus']))
+            ], batch_size=5000)
+
+            started = perf_counter()
+            get_sku_index(customer.id)
+            self.stdout.write(f"index build: {options['skus']} SKUs in {perf_counter() - started:.2f}s")
+
+            factory = RequestFactory()
+            for mode in ('prefix', 'contains'):
+                timings = []
+                for _ in range(options['queries']):
+                    term = rng.choice([rng.choice(prefixes)[:2], f'{rng.randint(0, 999):03d}', '-0012'])
+                    started = perf_counter()
+                    search_customer_skus(factory.get('/', {'q': term, 'mode': mode, 'limit': 50}), customer.id)
+                    timings.append((perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f"search ({mode}): median {median(timings):.2f}ms, "
+                    f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms"
+                )
+
+            started = perf_counter()
+            response = get_customer_skus(factory.get('/'), customer.id)
+            self.stdout.write(
+                f"full list: {len(response.content) / 1e6:.1f} MB in {(perf_counter() - started) * 1000:.0f}ms"
+            )
+            transaction.set_rollback(True)
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def backfill_normalized_sku(apps, schema_editor):
+    """Fill normalized_sku in primary key order, committing each batch."""
+    Product = apps.get_model('products', 'Product')
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', 'sku')[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                # Same rule as products.models.normalize_sku
+                row.normalized_sku = ''.join(str(row.sku or '').split()).upper()
+            Product.objects.bulk_update(batch, ['normalized_sku'])
+        last_pk = batch[-1].pk
+
+
+def check_duplicates(apps, schema_editor):
+    """Stop before adding the unique constraint if existing SKUs collide once normalized."""
+    Product = apps.get_model('products', 'Product')
+    duplicates = list(
+        Product.objects.values('customer_id', 'normalized_sku')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .order_by('customer_id', 'normalized_sku')[:20]
+    )
+    if duplicates:
+        listing = ', '.join(f"customer {d['customer_id']}: {d['normalized_sku']}" for d in duplicates)
+        raise RuntimeError(
+            f"Products differ only by spaces or case in their SKU and must be merged or renamed "
+            f"before migrating: {listing}"
+        )
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so a large table is not rewritten in one transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0002_normalized_sku'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_normalized_sku, migrations.RunPython.noop),
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+    ]
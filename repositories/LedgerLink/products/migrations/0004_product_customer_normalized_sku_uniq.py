@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_backfill_normalized_sku'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('customer', 'normalized_sku'), name='product_customer_normalized_sku_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_alter_customer_id'),
+        ('products', '0004_product_customer_normalized_sku_uniq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['customer', 'updated_at'], name='product_customer_updated_idx'),
+        ),
+    ]
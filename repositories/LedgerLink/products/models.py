@@ -1,12 +1,57 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 from customers.models import Customer  # Assuming Customer model is in the customers app
 
+# Upper bound on the number of values bound into one IN query
+SKU_LOOKUP_BATCH_SIZE = 1000
+
+
+def normalize_sku(sku: str) -> str:
+    """
+    Normalize SKU format for consistent comparison.
+    Examples:
+        'pack boxes' -> 'PACKBOXES'
+        'TestSKU' -> 'TESTSKU'
+        '6pack boxes' -> '6PACKBOXES'
+        '  Pack  Boxes  ' -> 'PACKBOXES'
+    """
+    try:
+        if not sku:
+            return ''
+        # Remove extra spaces and convert to uppercase
+        return ''.join(str(sku).split()).upper()
+    except (AttributeError, TypeError):
+        return ''
+
+
+class SkuQuerySet(models.QuerySet):
+    """Lookups by normalized SKU, shared by Product and Insert."""
+
+    def for_skus(self, customer_id, skus):
+        """Rows for the customer matching any of the SKUs, in whatever format they were written."""
+        normalized = {normalize_sku(sku) for sku in skus} - {''}
+        return self.filter(customer_id=customer_id, normalized_sku__in=normalized)
+
+    def resolve_skus(self, customer_id, skus):
+        """
+        Map each normalized SKU to the customer's row for it, using one IN query
+        per SKU_LOOKUP_BATCH_SIZE SKUs. SKUs without a row are left out.
+        """
+        normalized = sorted({normalize_sku(sku) for sku in skus} - {''})
+        resolved = {}
+        for start in range(0, len(normalized), SKU_LOOKUP_BATCH_SIZE):
+            batch = normalized[start:start + SKU_LOOKUP_BATCH_SIZE]
+            for row in self.filter(customer_id=customer_id, normalized_sku__in=batch):
+                resolved[row.normalized_sku] = row
+        return resolved
+
 
 # Create your models here.
 class Product(models.Model):
     id = models.BigAutoField(primary_key=True)
     sku = models.CharField(max_length=100)
+    normalized_sku = models.CharField(max_length=100, editable=False, default='')
     labeling_unit_1 = models.CharField(max_length=50, blank=True, null=True)
     labeling_quantity_1 = models.PositiveIntegerField(blank=True, null=True)
     labeling_unit_2 = models.CharField(max_length=50, blank=True, null=True)
@@ -21,15 +66,40 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
 
+    objects = SkuQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['sku', 'customer'], name='billing_product_sku_customer_id_uniq'),
+            models.UniqueConstraint(fields=['customer', 'normalized_sku'], name='product_customer_normalized_sku_uniq'),
             models.CheckConstraint(check=models.Q(labeling_quantity_1__gte=0), name='billing_product_labeling_quantity_1_check'),
             models.CheckConstraint(check=models.Q(labeling_quantity_2__gte=0), name='billing_product_labeling_quantity_2_check'),
             models.CheckConstraint(check=models.Q(labeling_quantity_3__gte=0), name='billing_product_labeling_quantity_3_check'),
             models.CheckConstraint(check=models.Q(labeling_quantity_4__gte=0), name='billing_product_labeling_quantity_4_check'),
             models.CheckConstraint(check=models.Q(labeling_quantity_5__gte=0), name='billing_product_labeling_quantity_5_check'),
         ]
+        indexes = [
+            # Count and Max(updated_at) per customer for the SKU catalog version
+            models.Index(fields=['customer', 'updated_at'], name='product_customer_updated_idx'),
+        ]
 
     def __str__(self):
         return self.sku
+
+    def clean(self):
+        super().clean()
+        self.normalized_sku = normalize_sku(self.sku)
+        if self.customer_id and Product.objects.filter(
+                customer_id=self.customer_id, normalized_sku=self.normalized_sku
+        ).exclude(pk=self.pk).exists():
+            raise ValidationError({
+                'sku': f"This customer already has a product whose SKU matches '{self.sku}' "
+                       f"when spaces and case are ignored."
+            })
+
+    def save(self, *args, **kwargs):
+        self.normalized_sku = normalize_sku(self.sku)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'sku' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_sku'}
+        super().save(*args, **kwargs)
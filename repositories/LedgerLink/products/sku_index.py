@@ -0,0 +1,122 @@
+# products/sku_index.py
+
+"""
+In-memory SKU index per customer, for typeahead search in SKU pickers.
+
+Each process keeps the index it built for a customer, tagged with the
+customer's catalog version: the number of their products and the latest
+updated_at among them, read from the database with one aggregate query per
+request (served by product_customer_updated_idx). Every write to a product
+moves updated_at (auto_now, and upsert_products updates it on conflict) and
+every delete changes the count, so all processes see a change as soon as it
+is committed, whatever cache backend is configured.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+
+from django.db.models import Count, Max
+
+from .models import Product, normalize_sku
+
+SKU_INDEX_MAX_CUSTOMERS = 50
+
+CatalogVersion = namedtuple('CatalogVersion', ['count', 'updated_at'])
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def catalog_version(customer_id):
+    """The customer's product count and last product change (None without products)."""
+    return CatalogVersion(**Product.objects.filter(customer_id=customer_id).aggregate(
+        count=Count('id'), updated_at=Max('updated_at'),
+    ))
+
+
+class CustomerSkuIndex:
+    """One customer's SKUs, sorted by normalized SKU."""
+
+    def __init__(self, rows, version):
+        rows = sorted(rows, key=lambda row: row[2])
+        self.ids = [row[0] for row in rows]
+        self.skus = [row[1] for row in rows]
+        self.keys = [row[2] for row in rows]
+        self.version = version
+        # All keys in one string, so substring search runs in str.find rather
+        # than a Python loop; offsets map a match back to its SKU.
+        self.text = '\n'.join(self.keys)
+        self.offsets = []
+        position = 0
+        for key in self.keys:
+            self.offsets.append(position)
+            position += len(key) + 1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def is_current(self, version):
+        return self.version == version
+
+    def prefix(self, term, limit):
+        """Positions of SKUs starting with term, in SKU order."""
+        start = bisect_left(self.keys, term)
+        matches = []
+        for position in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[position].startswith(term):
+                break
+            matches.append(position)
+        return matches
+
+    def substring(self, term, limit, exclude=()):
+        """Positions of SKUs containing term, in SKU order, skipping those in exclude."""
+        matches = []
+        start = 0
+        while len(matches) < limit:
+            found = self.text.find(term, start)
+            if found == -1:
+                break
+            position = bisect_right(self.offsets, found) - 1
+            if position not in exclude:
+                matches.append(position)
+            # Continue after this SKU so each SKU matches at most once
+            start = self.offsets[position] + len(self.keys[position]) + 1
+        return matches
+
+    def search(self, term, limit=50, contains=False):
+        """
+        Up to limit {'id', 'sku'} matches for term, compared by normalized SKU.
+        Prefix matches come first; with contains, other SKUs containing the
+        term follow. A blank term returns the first SKUs in order.
+        """
+        term = normalize_sku(term)
+        if not term:
+            matches = list(range(min(limit, len(self.keys))))
+        else:
+            matches = self.prefix(term, limit)
+            if contains and len(matches) < limit:
+                matches += self.substring(term, limit - len(matches), exclude=set(matches))
+        return [{'id': self.ids[position], 'sku': self.skus[position]} for position in matches]
+
+
+def get_sku_index(customer_id, version=None):
+    """
+    The customer's SKU index, rebuilt when their catalog has changed. Pass the
+    catalog version if it was already read for this request.
+    """
+    if version is None:
+        version = catalog_version(customer_id)
+    index = _indexes.get(customer_id)
+    if index is not None and index.is_current(version):
+        return index
+    with _lock:
+        index = _indexes.get(customer_id)
+        if index is None or not index.is_current(version):
+            rows = Product.objects.filter(customer_id=customer_id).values_list('id', 'sku', 'normalized_sku')
+            index = CustomerSkuIndex(rows, version)
+            _indexes[customer_id] = index
+        _indexes.move_to_end(customer_id)
+        while len(_indexes) > SKU_INDEX_MAX_CUSTOMERS:
+            _indexes.popitem(last=False)
+    return index
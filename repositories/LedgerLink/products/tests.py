@@ -1,6 +1,9 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.urls import reverse
+from .ingestion import import_products
 from .models import Product
+from .sku_index import CustomerSkuIndex, get_sku_index
 from customers.models import Customer
 
 
@@ -35,6 +38,20 @@ class ProductModelTest(TestCase):
         self.assertEqual(self.product.labeling_quantity_1, 10)
         self.assertIsInstance(self.product, Product)
 
+    def test_save_stores_normalized_sku(self):
+        self.product.sku = ' sku 123 '
+        self.product.save(update_fields=['sku'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.normalized_sku, 'SKU123')
+
+    def test_resolve_skus_matches_any_spelling(self):
+        other = Product.objects.create(sku='abc-1', customer=self.customer)
+        with self.assertNumQueries(1):
+            products = Product.objects.resolve_skus(self.customer.id, ['sku123', 'ABC-1 ', 'missing'])
+        self.assertEqual(products['SKU123'].id, self.product.id)
+        self.assertEqual(products['ABC-1'].id, other.id)
+        self.assertNotIn('MISSING', products)
+
 
 class ProductListViewTest(TestCase):
 
@@ -93,3 +110,101 @@ class ProductDetailViewTest(TestCase):
         response = self.client.get(reverse('product_detail', args=[self.product.pk]))
         self.assertContains(response, self.product.sku)
         self.assertContains(response, self.product.customer.company_name)
+
+
+class ProductUploadTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            company_name='Test Company',
+            legal_business_name='Test Legal Name',
+            email='test@example.com'
+        )
+        Product.objects.create(sku='SKU1', customer=self.customer, labeling_unit_1='Old')
+
+    def upload(self, content, **data):
+        return self.client.post(reverse('products:product_upload'), {
+            'file': SimpleUploadedFile('products.csv', content.encode(), content_type='text/csv'),
+            **data
+        })
+
+    def csv(self):
+        return (
+            'sku,customer_id,labeling_unit_1,labeling_quantity_1\n'
+            f'SKU1,{self.customer.id},Box,12\n'
+            f'SKU2,{self.customer.id},,\n'
+            f',{self.customer.id},Box,1\n'
+            f'SKU3,999,Box,1\n'
+            f'SKU4,{self.customer.id},Case,-2\n'
+        )
+
+    def test_upload_upserts_and_reports_each_row(self):
+        response = self.upload(self.csv())
+        result = response.context['result']
+        self.assertEqual([item['row'] for item in result], [1, 2, 3, 4, 5])
+        self.assertEqual([item['status'] for item in result], ['success', 'success', 'error', 'error', 'error'])
+        self.assertEqual(result[0]['message'], 'Product updated')
+        self.assertEqual(result[1]['message'], 'Product created')
+        self.assertEqual(result[3]['message'], 'Customer does not exist')
+
+        product = Product.objects.get(sku='SKU1', customer=self.customer)
+        self.assertEqual((product.labeling_unit_1, product.labeling_quantity_1), ('Box', 12))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_dry_run_saves_nothing(self):
+        response = self.upload(self.csv(), dry_run='on')
+        self.assertTrue(response.context['dry_run'])
+        self.assertEqual(response.context['result'][1]['message'], 'Product created')
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Product.objects.get().labeling_unit_1, 'Old')
+
+    def test_chunks_report_file_row_numbers(self):
+        rows = ''.join(f'SKU{i},{self.customer.id},,\n' for i in range(10)) + 'BAD,999,,\n'
+        file = SimpleUploadedFile('products.csv', ('sku,customer_id,labeling_unit_1,labeling_quantity_1\n' + rows).encode())
+        result = import_products(file, chunk_size=3, batch_size=2)
+        self.assertEqual([item['row'] for item in result], list(range(1, 12)))
+        self.assertEqual(result[-1]['status'], 'error')
+        self.assertEqual(Product.objects.count(), 10)
+
+    def test_upload_matches_existing_sku_when_normalized(self):
+        file = SimpleUploadedFile('products.csv', f'sku,customer_id,labeling_unit_1\nsku 1,{self.customer.id},Box\n'.encode())
+        result = import_products(file)
+        self.assertEqual(result[0]['message'], 'Product updated')
+        product = Product.objects.get()
+        self.assertEqual((product.sku, product.normalized_sku, product.labeling_unit_1), ('sku 1', 'SKU1', 'Box'))
+
+
+class SkuIndexTest(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            company_name='Test Company',
+            legal_business_name='Test Legal Name',
+            email='test@example.com'
+        )
+
+    def test_prefix_then_substring_search(self):
+        rows = [(i, sku, sku.replace(' ', '').upper()) for i, sku in enumerate(
+            ['ab-2', 'AB-1', 'xab-1', 'BOX AB', 'cd-1']
+        )]
+        index = CustomerSkuIndex(rows, version=1)
+        self.assertEqual([m['sku'] for m in index.search('ab')], ['AB-1', 'ab-2'])
+        self.assertEqual([m['sku'] for m in index.search('ab', contains=True)], ['AB-1', 'ab-2', 'BOX AB', 'xab-1'])
+        self.assertEqual([m['sku'] for m in index.search('ab', limit=3, contains=True)], ['AB-1', 'ab-2', 'BOX AB'])
+        self.assertEqual(len(index.search('', limit=2)), 2)
+        self.assertEqual(index.search('zz', contains=True), [])
+
+    def test_index_refreshes_after_product_changes(self):
+        Product.objects.create(sku='AAA', customer=self.customer)
+        index = get_sku_index(self.customer.id)
+        self.assertIs(get_sku_index(self.customer.id), index)
+
+        Product.objects.create(sku='AAB', customer=self.customer)
+        self.assertEqual([m['sku'] for m in get_sku_index(self.customer.id).search('AA')], ['AAA', 'AAB'])
+
+        file = SimpleUploadedFile('products.csv', f'sku,customer_id\nAAC,{self.customer.id}\n'.encode())
+        import_products(file)
+        self.assertEqual(len(get_sku_index(self.customer.id)), 3)
+
+        Product.objects.filter(sku='AAA').delete()
+        self.assertEqual([m['sku'] for m in get_sku_index(self.customer.id).search('AA')], ['AAB', 'AAC'])
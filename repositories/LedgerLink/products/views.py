@@ -6,7 +6,9 @@ from django.http import HttpResponse
 from django.contrib import messages
 from .models import Product
 from .forms import ProductForm, ProductUploadForm
+from .ingestion import import_products
 from customers.models import Customer
+from Main.models import UploadJob
 from django.db.models import Q
 
 
@@ -73,51 +75,31 @@ class ProductUploadView(View):
         form = self.form_class(request.POST, request.FILES)
         if form.is_valid():
             file = request.FILES['file']
+            dry_run = form.cleaned_data.get('dry_run', False)
+            if form.cleaned_data.get('background'):
+                job = UploadJob.objects.create(
+                    kind='products', file=file, original_name=file.name, dry_run=dry_run,
+                    created_by=request.user if request.user.is_authenticated else None,
+                )
+                messages.info(request, f'{file.name} will be processed in the background.')
+                return redirect('main:upload_job', pk=job.pk)
+
             result = []
             try:
-                if file.name.endswith('.csv'):
-                    data = pd.read_csv(file)
-                elif file.name.endswith('.xlsx'):
-                    data = pd.read_excel(file)
+                result = import_products(file, dry_run=dry_run)
+                errors = sum(1 for item in result if item['status'] == 'error')
+                if dry_run:
+                    messages.info(
+                        request,
+                        f'Dry run: {len(result) - errors} products would be saved, {errors} rows have errors. '
+                        f'Nothing was saved.'
+                    )
                 else:
-                    raise ValueError('Unsupported file type')
-
-                # Process data
-                for _, row in data.iterrows():
-                    try:
-                        product, created = Product.objects.update_or_create(
-                            sku=row['sku'],
-                            customer_id=row['customer_id'],
-                            defaults={
-                                'labeling_unit_1': row.get('labeling_unit_1', ''),
-                                'labeling_quantity_1': row.get('labeling_quantity_1', 0),
-                                'labeling_unit_2': row.get('labeling_unit_2', ''),
-                                'labeling_quantity_2': row.get('labeling_quantity_2', 0),
-                                'labeling_unit_3': row.get('labeling_unit_3', ''),
-                                'labeling_quantity_3': row.get('labeling_quantity_3', 0),
-                                'labeling_unit_4': row.get('labeling_unit_4', ''),
-                                'labeling_quantity_4': row.get('labeling_quantity_4', 0),
-                                'labeling_unit_5': row.get('labeling_unit_5', ''),
-                                'labeling_quantity_5': row.get('labeling_quantity_5', 0),
-                            }
-                        )
-                        result.append({
-                            'sku': row['sku'],
-                            'status': 'success',
-                            'message': 'Product updated' if not created else 'Product created'
-                        })
-                    except Exception as e:
-                        result.append({
-                            'sku': row.get('sku', 'Unknown'),
-                            'status': 'error',
-                            'message': str(e)
-                        })
-
-                messages.success(request, f'Successfully processed {len(result)} products.')
+                    messages.success(request, f'Successfully processed {len(result)} products.')
             except Exception as e:
                 messages.error(request, f'Error processing file: {str(e)}')
 
-            return render(request, self.template_name, {'form': form, 'result': result})
+            return render(request, self.template_name, {'form': form, 'result': result, 'dry_run': dry_run})
         return render(request, self.template_name, {'form': form})
 
 
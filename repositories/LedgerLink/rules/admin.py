@@ -6,7 +6,19 @@ from django.core.exceptions import ValidationError
 from django.utils.html import format_html
 from django.urls import reverse
 import json
-from .models import RuleGroup, Rule, AdvancedRule
+from .models import RuleGroup, Rule, AdvancedRule, RuleStatistics
+
+
+def format_pass_rate(statistics):
+    if statistics is None or statistics.pass_rate is None:
+        return '-'
+    return f"{statistics.pass_rate:.1%}"
+
+
+def format_average_time(statistics):
+    if statistics is None or statistics.average_time_ns is None:
+        return '-'
+    return f"{statistics.average_time_ns / 1000:.1f} µs"
 
 
 class RuleInline(admin.TabularInline):
@@ -104,7 +116,10 @@ class RuleAdmin(admin.ModelAdmin):
         'field',
         'operator',
         'value',
-        'adjustment_amount'
+        'adjustment_amount',
+        'evaluation_count',
+        'pass_rate',
+        'average_time'
     ]
     list_filter = [
         'field',
@@ -115,6 +130,7 @@ class RuleAdmin(admin.ModelAdmin):
         'value',
         'rule_group__customer_service__customer__company_name'
     ]
+    list_select_related = ['rule_group', 'statistics']
 
     def rule_group_link(self, obj):
         url = reverse('admin:rules_rulegroup_change', args=[obj.rule_group.id])
@@ -122,6 +138,30 @@ class RuleAdmin(admin.ModelAdmin):
 
     rule_group_link.short_description = 'Rule Group'
 
+    def _statistics(self, obj):
+        try:
+            return obj.statistics
+        except RuleStatistics.DoesNotExist:
+            return None
+
+    def evaluation_count(self, obj):
+        statistics = self._statistics(obj)
+        return statistics.evaluation_count if statistics else 0
+
+    evaluation_count.short_description = 'Evaluations'
+
+    def pass_rate(self, obj):
+        statistics = self._statistics(obj)
+        return format_pass_rate(statistics)
+
+    pass_rate.short_description = 'Pass Rate'
+
+    def average_time(self, obj):
+        statistics = self._statistics(obj)
+        return format_average_time(statistics)
+
+    average_time.short_description = 'Avg. Time'
+
 
 @admin.register(AdvancedRule)
 class AdvancedRuleAdmin(admin.ModelAdmin):
@@ -214,5 +254,56 @@ class AdvancedRuleAdmin(admin.ModelAdmin):
             'admin/js/advanced-rule-admin.js',
         )
 
+@admin.register(RuleStatistics)
+class RuleStatisticsAdmin(admin.ModelAdmin):
+    list_display = [
+        'rule_link',
+        'rule_group',
+        'evaluation_count',
+        'pass_count',
+        'pass_rate_display',
+        'average_time_display',
+        'updated_at'
+    ]
+    list_filter = [
+        'rule__field',
+        'rule__rule_group__customer_service__customer'
+    ]
+    search_fields = [
+        'rule__value',
+        'rule__rule_group__customer_service__customer__company_name'
+    ]
+    list_select_related = ['rule', 'rule__rule_group']
+    readonly_fields = ['rule', 'evaluation_count', 'pass_count', 'total_time_ns', 'updated_at']
+    actions = ['reset_statistics']
+
+    def has_add_permission(self, request):
+        return False
+
+    def rule_link(self, obj):
+        url = reverse('admin:rules_rule_change', args=[obj.rule_id])
+        return format_html('<a href="{}">{}</a>', url, obj.rule)
+
+    rule_link.short_description = 'Rule'
+
+    def rule_group(self, obj):
+        return obj.rule.rule_group
+
+    rule_group.short_description = 'Rule Group'
+
+    def pass_rate_display(self, obj):
+        return format_pass_rate(obj)
+
+    pass_rate_display.short_description = 'Pass Rate'
+
+    def average_time_display(self, obj):
+        return format_average_time(obj)
+
+    average_time_display.short_description = 'Avg. Time'
+
+    @admin.action(description='Reset selected statistics')
+    def reset_statistics(self, request, queryset):
+        queryset.update(evaluation_count=0, pass_count=0, total_time_ns=0)
+
 # Register any additional models if needed
 # admin.site.register(OtherModel)
\ No newline at end of file
@@ -114,16 +114,17 @@ class AdvancedRuleForm(forms.ModelForm):
 
                 if 'type' not in calc:
                     raise ValidationError("Missing 'type' in calculation")
-                if 'value' not in calc:
-                    raise ValidationError("Missing 'value' in calculation")
 
                 if calc['type'] not in valid_types:
                     raise ValidationError(f"Invalid calculation type: {calc['type']}")
 
-                try:
-                    float(calc['value'])
-                except (TypeError, ValueError):
-                    raise ValidationError(f"Invalid numeric value: {calc['value']}")
+                if calc['type'] not in AdvancedRule.CALCULATIONS_WITHOUT_VALUE:
+                    if 'value' not in calc:
+                        raise ValidationError("Missing 'value' in calculation")
+                    try:
+                        float(calc['value'])
+                    except (TypeError, ValueError):
+                        raise ValidationError(f"Invalid numeric value: {calc['value']}")
 
                 # Validate specific calculation types
                 if calc['type'] == 'tiered_percentage':
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rules', '0005_alter_advancedrule_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuleStatistics',
+            fields=[
+                ('rule', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='rules.rule')),
+                ('evaluation_count', models.PositiveBigIntegerField(default=0)),
+                ('pass_count', models.PositiveBigIntegerField(default=0)),
+                ('total_time_ns', models.PositiveBigIntegerField(default=0, help_text='Total evaluation time in nanoseconds')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Rule Statistics',
+                'verbose_name_plural': 'Rule Statistics',
+            },
+        ),
+    ]
@@ -3,8 +3,7 @@
 from django.core.exceptions import ValidationError
 from django.db import models
 from customer_services.models import CustomerService
-import re
-import json
+
 
 class RuleGroup(models.Model):
     LOGIC_CHOICES = [
@@ -89,8 +88,9 @@ class Rule(models.Model):
 
         # JSON field validation (basic)
         elif self.field == 'sku_quantity':
-            if self.operator in ['contains', 'ncontains', 'in', 'ni']:
-                # Allow basic list of keys or values
+            if self.operator in ['contains', 'ncontains', 'in', 'ni', 'startswith', 'endswith']:
+                # contains/ncontains match whole SKUs, in/ni match part of a SKU,
+                # startswith/endswith match SKU prefixes and suffixes
                 pass
             elif self.operator in ['gt', 'lt', 'ge', 'le']:
                 raise ValidationError(f"Operator '{self.get_operator_display()}' is not valid for JSON fields.")
@@ -102,6 +102,39 @@ class Rule(models.Model):
         return [v.strip() for v in self.value.split(';') if v.strip()]
 
 
+class RuleStatistics(models.Model):
+    """
+    Evaluation statistics for a rule, collected during billing runs.
+    Used to order rules within a group so cheap, decisive rules are evaluated first.
+    """
+    rule = models.OneToOneField(Rule, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    evaluation_count = models.PositiveBigIntegerField(default=0)
+    pass_count = models.PositiveBigIntegerField(default=0)
+    total_time_ns = models.PositiveBigIntegerField(default=0, help_text="Total evaluation time in nanoseconds")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Rule Statistics"
+        verbose_name_plural = "Rule Statistics"
+
+    def __str__(self):
+        return f"Statistics for {self.rule}"
+
+    @property
+    def pass_rate(self):
+        """Fraction of evaluations that returned True, or None if never evaluated."""
+        if not self.evaluation_count:
+            return None
+        return self.pass_count / self.evaluation_count
+
+    @property
+    def average_time_ns(self):
+        """Average evaluation time in nanoseconds, or None if never evaluated."""
+        if not self.evaluation_count:
+            return None
+        return self.total_time_ns / self.evaluation_count
+
+
 class AdvancedRule(Rule):
     """
     Extended Rule model that supports complex conditions and calculations.
@@ -127,6 +160,8 @@ class AdvancedRule(Rule):
         'tiered_percentage',  # Apply percentage based on value tiers
         'product_specific'  # Apply specific rates per product
     ]
+    # Calculated from their "tiers" or "rates" rather than a "value"
+    CALCULATIONS_WITHOUT_VALUE = ['tiered_percentage', 'product_specific']
 
     def clean(self):
         """Validate the advanced rule's conditions and calculations"""
@@ -156,135 +191,54 @@ class AdvancedRule(Rule):
                 if not isinstance(calc, dict):
                     raise ValidationError({'calculations': 'Each calculation must be a JSON object'})
 
-                if 'type' not in calc or 'value' not in calc:
-                    raise ValidationError(
-                        {'calculations': 'Each calculation must have "type" and "value" fields'}
-                    )
+                if 'type' not in calc:
+                    raise ValidationError({'calculations': 'Each calculation must have a "type" field'})
 
                 if calc['type'] not in self.CALCULATION_TYPES:
                     raise ValidationError(
                         {'calculations': f'Invalid calculation type: {calc["type"]}'}
                     )
 
-                try:
-                    float(calc['value'])
-                except (TypeError, ValueError):
-                    raise ValidationError(
-                        {'calculations': f'Invalid numeric value in calculation: {calc["value"]}'}
-                    )
-
-    def evaluate_conditions(self, order):
-        """
-        Evaluate all conditions against the order.
-        Returns True if all conditions are met, False otherwise.
-        """
-        try:
-            # First evaluate the base rule conditions
-            if not super().clean():  # This calls the parent Rule's validation
-                return False
-
-            # Then evaluate the advanced conditions
-            for field, criteria in self.conditions.items():
-                if not hasattr(order, field):
-                    return False
-
-                order_value = getattr(order, field)
-                for operator, value in criteria.items():
-                    if not self.compare(order_value, operator, value):
-                        return False
-
-            return True
-
-        except Exception as e:
-            return False
-
-    @staticmethod
-    def compare(actual, operator, expected):
-        """
-        Compare actual value with expected value using the specified operator.
-        Supports various comparison operations for different data types.
-        """
-        if operator == 'eq':
-            return actual == expected
-        elif operator == 'ne':
-            return actual != expected
-        elif operator == 'gt':
-            return actual > expected
-        elif operator == 'lt':
-            return actual < expected
-        elif operator == 'ge':
-            return actual >= expected
-        elif operator == 'le':
-            return actual <= expected
-        elif operator == 'in':
-            return actual in expected
-        elif operator == 'ni':
-            return actual not in expected
-        elif operator == 'contains':
-            return expected in actual
-        elif operator == 'ncontains':
-            return expected not in actual
-        elif operator == 'starts_with':
-            return actual.startswith(expected)
-        elif operator == 'ends_with':
-            return actual.endswith(expected)
-        elif operator == 'is_empty':
-            return not actual
-        elif operator == 'is_not_empty':
-            return bool(actual)
-        elif operator == 'is_null':
-            return actual is None
-        elif operator == 'is_not_null':
-            return actual is not None
-        elif operator == 'in_range':
-            return expected[0] <= actual <= expected[1]
-        elif operator == 'not_in_range':
-            return actual < expected[0] or actual > expected[1]
-        elif operator == 'regex':
-            return bool(re.search(expected, actual))
-        return False
-
-    def apply_calculations(self, order, base_amount):
-        """
-        Apply the rule's calculations to determine the final amount.
-        Returns the calculated amount based on the rule's calculation steps.
-        """
-        try:
-            amount = base_amount
-
-            for calc in self.calculations:
-                calc_type = calc['type']
-                value = float(calc['value'])
-
-                if calc_type == 'flat_fee':
-                    amount += value
-                elif calc_type == 'percentage':
-                    amount += amount * (value / 100)
-                elif calc_type == 'per_unit':
-                    amount += order.total_item_qty * value
-                elif calc_type == 'weight_based':
-                    if order.weight_lb:
-                        amount += float(order.weight_lb) * value
-                elif calc_type == 'volume_based':
-                    if order.volume_cuft:
-                        amount += float(order.volume_cuft) * value
-                elif calc_type == 'tiered_percentage':
-                    for tier in value:
-                        if amount >= tier['min'] and amount <= tier['max']:
-                            amount += amount * (tier['percentage'] / 100)
-                            break
-                elif calc_type == 'product_specific':
-                    if order.sku_quantity:
-                        sku_data = json.loads(order.sku_quantity)
-                        for item in sku_data:
-                            sku = item['sku']
-                            if sku in calc['rates']:
-                                amount += item['quantity'] * calc['rates'][sku]
-
-            return amount
-
-        except Exception as e:
-            return base_amount
+                if calc['type'] not in self.CALCULATIONS_WITHOUT_VALUE:
+                    if 'value' not in calc:
+                        raise ValidationError(
+                            {'calculations': f'{calc["type"]} calculations must have a "value" field'}
+                        )
+                    try:
+                        float(calc['value'])
+                    except (TypeError, ValueError):
+                        raise ValidationError(
+                            {'calculations': f'Invalid numeric value in calculation: {calc["value"]}'}
+                        )
+
+                if calc['type'] == 'tiered_percentage':
+                    tiers = calc.get('tiers')
+                    if not isinstance(tiers, list) or not tiers:
+                        raise ValidationError(
+                            {'calculations': 'tiered_percentage calculations must have a "tiers" array'}
+                        )
+                    for tier in tiers:
+                        try:
+                            for key in ('min', 'max', 'percentage'):
+                                float(tier[key])
+                        except (KeyError, TypeError, ValueError):
+                            raise ValidationError(
+                                {'calculations': f'Invalid tier, expected numeric "min", "max" and "percentage": {tier}'}
+                            )
+
+                elif calc['type'] == 'product_specific':
+                    rates = calc.get('rates')
+                    if not isinstance(rates, dict) or not rates:
+                        raise ValidationError(
+                            {'calculations': 'product_specific calculations must have a "rates" object'}
+                        )
+                    for sku, rate in rates.items():
+                        try:
+                            float(rate)
+                        except (TypeError, ValueError):
+                            raise ValidationError(
+                                {'calculations': f'Invalid rate for SKU {sku}: {rate}'}
+                            )
 
     class Meta:
         verbose_name = "Advanced Rule"
@@ -239,7 +239,7 @@ def get_operator_choices(request):
     elif field in string_fields:
         valid_operators = ['eq', 'ne', 'contains', 'ncontains', 'startswith', 'endswith']
     elif field in json_fields:
-        valid_operators = ['contains', 'ncontains']
+        valid_operators = ['contains', 'ncontains', 'in', 'ni', 'startswith', 'endswith']
     else:
         valid_operators = [op[0] for op in Rule.OPERATOR_CHOICES]
 